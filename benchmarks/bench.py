@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for the youtube2mp3 engine
+
+Runs the engine against the fake yt-dlp, ffmpeg and ffprobe in fake_tools.
+They are put first on PATH, so the engine finds them through shutil.which
+exactly like the real tools, and no network access is needed.  Reported per
+scenario:
+
+    jobs_per_minute          completed jobs per minute of wall time
+    latency                  per-stage seconds (mean/p50/p95/max): queue wait,
+                             download, hand-off wait, encode, total
+    engine_updates_per_sec   job updates reported by the engine
+    ui_callbacks_per_sec     GTK main-loop callbacks those updates cost with
+                             the window's coalescing at UI_FRAME_RATE
+    peak_rss_mb              peak RSS of the engine process
+    peak_child_rss_mb        peak RSS of any fake tool process
+
+plus the start-up time of the headless CLI.  Each scenario runs in its own
+process so RSS figures do not leak between scenarios.
+
+    python benchmarks/bench.py                          # every scenario
+    python benchmarks/bench.py batch --jobs 24 -j 4
+    python benchmarks/bench.py --compare benchmarks/results/baseline.json
+
+Results are written as JSON to benchmarks/results/ (or --output) and can be
+compared with --compare, which exits non-zero when a metric regressed by more
+than --tolerance.  The fake tools are configured with FAKE_* environment
+variables (see fake_tools/yt-dlp and fake_tools/ffmpeg).
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import resource
+except ImportError:  # not available on native Windows Python
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+FAKE_TOOLS = os.path.join(BENCH_DIR, "fake_tools")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+SCENARIOS = ("single", "batch", "playlist")
+
+# Same value as youtube2mp3_gui.UI_FRAME_RATE (not imported: that needs GTK)
+UI_FRAME_RATE = 10
+
+# Metrics checked by --compare: True when higher is better
+COMPARED_METRICS = {
+    "jobs_per_minute": True,
+    "latency.total.p50": False,
+    "latency.download.p50": False,
+    "latency.encode.p50": False,
+    "ui_callbacks_per_sec": False,
+    "peak_rss_mb": False,
+}
+
+
+class UiSimulator:
+    """Counts main-loop work the way the window coalesces job updates"""
+    
+    def __init__(self, frame_rate=UI_FRAME_RATE):
+        self.updates = 0
+        self.callbacks = 0
+        self.rows_redrawn = 0
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.interval = 1.0 / frame_rate
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def on_update(self, job):
+        with self.lock:
+            self.updates += 1
+            self.dirty.add(job)
+    
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                jobs, self.dirty = self.dirty, set()
+            self.callbacks += 1
+            self.rows_redrawn += len(jobs)
+    
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+class StageTimer:
+    """Records when each job enters and leaves the scheduler's stages"""
+    
+    def __init__(self, scheduler):
+        self.times = {}
+        self.lock = threading.Lock()
+        scheduler.downloader = self._wrap("download", scheduler.downloader)
+        scheduler.encoder = self._wrap("encode", scheduler.encoder)
+    
+    def mark(self, job, event):
+        with self.lock:
+            self.times.setdefault(job.id, {}).setdefault(event, time.monotonic())
+    
+    def _wrap(self, stage, func):
+        def timed(job):
+            self.mark(job, stage + "_start")
+            try:
+                return func(job)
+            finally:
+                self.mark(job, stage + "_end")
+        return timed
+    
+    def latencies(self):
+        spans = {"queue": ("submit", "download_start"),
+                 "download": ("download_start", "download_end"),
+                 "handoff": ("download_end", "encode_start"),
+                 "encode": ("encode_start", "encode_end"),
+                 "total": ("submit", "finished")}
+        result = {}
+        for name, (begin, end) in spans.items():
+            values = [t[end] - t[begin] for t in self.times.values() if begin in t and end in t]
+            if values:
+                result[name] = summarize(values)
+        return result
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "mean": round(statistics.fmean(values), 4),
+        "p50": round(statistics.median(values), 4),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 4),
+        "max": round(values[-1], 4),
+    }
+
+
+def peak_rss_mb(who):
+    if resource is None:
+        return None
+    rss = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def setup_environment(scratch):
+    """Put the fake tools first on PATH and keep caches out of the user's home"""
+    os.environ["PATH"] = FAKE_TOOLS + os.pathsep + os.environ.get("PATH", "")
+    os.environ["XDG_CACHE_HOME"] = os.path.join(scratch, "cache")
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+
+
+def run_scenario(name, args):
+    """Run one scenario in this process and return its metrics"""
+    scratch = tempfile.mkdtemp(prefix="youtube2mp3-bench-")
+    try:
+        setup_environment(scratch)
+        import youtube2mp3_engine as engine_module
+        
+        output_dir = os.path.join(scratch, "out")
+        os.makedirs(output_dir)
+        ui = UiSimulator()
+        
+        def on_update(job):
+            # Jobs finish out of submission order, so note the time right away
+            if job.is_finished:
+                timer.mark(job, "finished")
+            ui.on_update(job)
+        
+        engine = engine_module.Engine(on_update, args.downloads, args.encoders,
+                                      engine_module.DownloadCache(root=os.path.join(scratch, "downloads")))
+        timer = StageTimer(engine.scheduler)
+        
+        # Unique video IDs per run so nothing is served from a cache
+        tag = name[0] + uuid.uuid4().hex[:2]
+        start = time.monotonic()
+        if name == "playlist":
+            os.environ["FAKE_PLAYLIST_SIZE"] = str(args.jobs)
+            _, jobs, _ = engine_module.create_playlist_jobs(
+                f"https://www.youtube.com/playlist?list=PL{tag}", output_dir,
+                max_active=args.playlist_jobs
+            )
+        else:
+            count = 1 if name == "single" else args.jobs
+            jobs = [engine_module.Job(f"https://youtu.be/{tag}{i:08d}", output_dir) for i in range(count)]
+        for job in jobs:
+            timer.mark(job, "submit")
+            engine.submit(job)
+        for job in jobs:
+            job.finished.wait()
+        wall = time.monotonic() - start
+        ui.stop()
+        
+        failed = [job.message for job in jobs if job.status != engine_module.JOB_DONE]
+        return {
+            "jobs": len(jobs),
+            "failed": len(failed),
+            "errors": failed[:3],
+            "wall_seconds": round(wall, 3),
+            "jobs_per_minute": round(len(jobs) / wall * 60, 2),
+            "latency": timer.latencies(),
+            "engine_updates_per_sec": round(ui.updates / wall, 1),
+            "ui_callbacks_per_sec": round(ui.callbacks / wall, 1),
+            "ui_rows_redrawn_per_sec": round(ui.rows_redrawn / wall, 1),
+            "scheduler": engine.scheduler.stats(),
+            "peak_rss_mb": peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+            "peak_child_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+        }
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def measure_startup(runs=5):
+    """Wall time of "youtube2mp3.py --headless --help" in a fresh interpreter"""
+    times = []
+    for _ in range(runs):
+        start = time.monotonic()
+        subprocess.run([sys.executable, os.path.join(REPO_DIR, "youtube2mp3.py"), "--headless", "--help"],
+                       stdout=subprocess.DEVNULL, check=True)
+        times.append(time.monotonic() - start)
+    return {"min": round(min(times), 4), "median": round(statistics.median(times), 4)}
+
+
+def lookup(metrics, dotted):
+    for key in dotted.split("."):
+        if not isinstance(metrics, dict) or key not in metrics:
+            return None
+        metrics = metrics[key]
+    return metrics
+
+
+def compare(results, baseline, tolerance):
+    """Print metric changes against a baseline; return the number of regressions"""
+    regressions = 0
+    for scenario, metrics in results["results"].items():
+        old_metrics = baseline.get("results", {}).get(scenario)
+        if not old_metrics:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            new, old = lookup(metrics, metric), lookup(old_metrics, metric)
+            if new is None or not old:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = "REGRESSION" if worse > tolerance else ""
+            regressions += bool(flag)
+            print(f"{scenario:10} {metric:24} {old:10.3f} -> {new:10.3f}  {change:+7.1%}  {flag}")
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the youtube2mp3 engine offline.")
+    parser.add_argument("scenarios", nargs="*", metavar="SCENARIO",
+                        help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--jobs", type=int, default=12, help="jobs in the batch and playlist scenarios")
+    parser.add_argument("-j", "--downloads", type=int, default=3, help="download workers")
+    parser.add_argument("-e", "--encoders", type=int, default=os.cpu_count() or 1, help="encode workers")
+    parser.add_argument("--playlist-jobs", type=int, default=3, help="playlist parallelism")
+    parser.add_argument("-o", "--output", help="result file (default: results/bench-<time>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare with an earlier result file")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="relative change counted as a regression (default: %(default)s)")
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name!r} (choose from {', '.join(SCENARIOS)})")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    
+    if args.run_scenario:
+        # Child process: run one scenario and print its metrics
+        print(json.dumps(run_scenario(args.run_scenario, args)))
+        return 0
+    
+    passthrough = ["--jobs", str(args.jobs), "-j", str(args.downloads), "-e", str(args.encoders),
+                   "--playlist-jobs", str(args.playlist_jobs)]
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "options": vars(args),
+            "fake_env": {key: value for key, value in os.environ.items() if key.startswith("FAKE_")},
+        },
+        "startup": measure_startup(),
+        "results": {},
+    }
+    print(f"CLI startup: {results['startup']['median'] * 1000:.0f} ms (median)")
+    
+    for name in args.scenarios or SCENARIOS:
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-scenario", name] + passthrough,
+            stdout=subprocess.PIPE, text=True, check=True
+        )
+        metrics = json.loads(child.stdout)
+        results["results"][name] = metrics
+        total = metrics["latency"].get("total", {})
+        print(f"{name:10} {metrics['jobs']:3} jobs  {metrics['jobs_per_minute']:8.1f} jobs/min  "
+              f"p50 {total.get('p50', 0):.2f}s  "
+              f"UI {metrics['ui_callbacks_per_sec']:.0f} callbacks/s "
+              f"({metrics['engine_updates_per_sec']:.0f} updates/s)  "
+              f"RSS {metrics['peak_rss_mb']} MB"
+              + (f"  FAILED {metrics['failed']}: {metrics['errors']}" if metrics["failed"] else ""))
+    
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("bench-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{regressions} metric(s) regressed by more than {args.tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
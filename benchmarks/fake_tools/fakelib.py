@@ -0,0 +1,77 @@
+"""
+Shared helpers for the fake yt-dlp / ffmpeg / ffprobe used by the benchmarks
+
+Fake media files start with a one-line header that records the codec and
+duration, followed by filler bytes:
+
+    FAKEAUDIO codec=opus duration=212.0
+
+Behaviour is configured through environment variables (see bench.py).
+"""
+
+import os
+import time
+
+HEADER_PREFIX = b"FAKEAUDIO"
+CHUNK_SIZE = 64 * 1024
+
+
+def env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+
+def make_header(codec, duration):
+    return f"FAKEAUDIO codec={codec} duration={duration}\n".encode()
+
+
+def read_header(path):
+    """Return (codec, duration) of a fake media file, or (None, None)"""
+    try:
+        with open(path, "rb") as f:
+            line = f.readline(200)
+    except OSError:
+        return None, None
+    if not line.startswith(HEADER_PREFIX):
+        return None, None
+    fields = dict(item.split("=", 1) for item in line.decode().split()[1:])
+    return fields.get("codec"), float(fields.get("duration", 0))
+
+
+def paced_write(out, total_bytes, rate, on_progress=None, progress_interval=0.1, header=b"", offset=0):
+    """Write total_bytes to a binary stream at roughly rate bytes/s
+    
+    The first `offset` bytes (header included) count as written already,
+    as when a download is continued.
+    """
+    if not offset:
+        out.write(header)
+    written = max(offset, len(header))
+    start = time.monotonic()
+    last_report = 0.0
+    while written < total_bytes:
+        chunk = min(CHUNK_SIZE, total_bytes - written)
+        out.write(b"\0" * chunk)
+        written += chunk
+        # Sleep until we are back on the target rate
+        ahead = (written - offset) / rate - (time.monotonic() - start)
+        if ahead > 0:
+            time.sleep(ahead)
+        now = time.monotonic() - start
+        if on_progress and (now - last_report >= progress_interval or written >= total_bytes):
+            last_report = now
+            on_progress(written, now)
+    out.flush()
+    return written
+
+
+def burn_cpu(seconds):
+    """Keep one core busy for about the given time, like a real encoder"""
+    end = time.monotonic() + seconds
+    x = 0
+    while time.monotonic() < end:
+        for i in range(10000):
+            x += i * i
+    return x
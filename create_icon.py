@@ -1,81 +1,305 @@
-#!/usr/bin/env python3
-"""
-Generate icon for YouTube to MP3 converter
-Creates PNG and ICO files
-"""
-
-try:
-    from PIL import Image, ImageDraw, ImageFont
-    import os
-except ImportError:
-    print("Pillow not installed. Installing...")
-    import subprocess
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "Pillow"])
-    from PIL import Image, ImageDraw, ImageFont
-    import os
-
-def create_icon():
-    """Create application icon"""
-    # Create 256x256 image
-    size = 256
-    img = Image.new('RGBA', (size, size), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(img)
-    
-    # Draw background circle (YouTube red)
-    center = size // 2
-    radius = size // 2 - 10
-    draw.ellipse(
-        [center - radius, center - radius, center + radius, center + radius],
-        fill=(255, 0, 0, 255)  # YouTube red
-    )
-    
-    # Draw play button triangle (white)
-    triangle_size = radius * 0.6
-    triangle_points = [
-        (center - triangle_size * 0.4, center - triangle_size * 0.6),
-        (center - triangle_size * 0.4, center + triangle_size * 0.6),
-        (center + triangle_size * 0.6, center)
-    ]
-    draw.polygon(triangle_points, fill=(255, 255, 255, 255))
-    
-    # Draw MP3 text at bottom
-    try:
-        # Try to use a font
-        font_size = int(size * 0.15)
-        font = ImageFont.truetype("arial.ttf", font_size)
-    except:
-        try:
-            font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", font_size)
-        except:
-            font = ImageFont.load_default()
-    
-    text = "MP3"
-    bbox = draw.textbbox((0, 0), text, font=font)
-    text_width = bbox[2] - bbox[0]
-    text_height = bbox[3] - bbox[1]
-    text_x = center - text_width // 2
-    text_y = size - text_height - 20
-    draw.text((text_x, text_y), text, fill=(255, 255, 255, 255), font=font)
-    
-    # Save PNG
-    img.save('youtube2mp3.png', 'PNG')
-    print("Created youtube2mp3.png")
-    
-    # Create ICO with multiple sizes
-    ico_sizes = [(16, 16), (32, 32), (48, 48), (64, 64), (128, 128), (256, 256)]
-    ico_images = []
-    for ico_size in ico_sizes:
-        ico_img = img.resize(ico_size, Image.Resampling.LANCZOS)
-        ico_images.append(ico_img)
-    
-    ico_images[0].save('youtube2mp3.ico', format='ICO', sizes=[(s[0], s[1]) for s in ico_sizes])
-    print("Created youtube2mp3.ico")
-    
-    # Also create a 48x48 PNG for app icon
-    icon_48 = img.resize((48, 48), Image.Resampling.LANCZOS)
-    icon_48.save('youtube2mp3_48.png', 'PNG')
-    print("Created youtube2mp3_48.png")
-
-if __name__ == "__main__":
-    create_icon()
-
+#!/usr/bin/env python3
+"""
+Generate icon for YouTube to MP3 converter
+Renders youtube2mp3.svg into PNG and multi-size ICO files
+
+Only the standard library is needed.  The SVG's shapes (circles,
+polygons, rectangles and the "MP3" text, drawn with built-in bold
+glyphs) are rasterized row by row: every row of samples becomes a list
+of covered intervals, turned into exact per-pixel coverage with a
+difference array instead of testing sample points against the shapes.
+Coverage and colors are still combined pixel by pixel, one layer at a
+time.  Each ICO size is rendered separately from the vector shapes
+rather than resized from a larger image, which keeps the small sizes
+sharp.  PNGs are zlib-compressed with real CRCs; the ICO holds one PNG
+per size, which Windows reads since Vista.
+
+The hash of the SVG and of this script is stored in youtube2mp3.png.
+When neither has changed and all outputs exist, nothing is regenerated.
+"""
+
+import argparse
+import hashlib
+import math
+import os
+import struct
+import sys
+import zlib
+import xml.etree.ElementTree as ET
+from itertools import accumulate
+
+ICON_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE = os.path.join(ICON_DIR, "youtube2mp3.svg")
+PNG_PATH = os.path.join(ICON_DIR, "youtube2mp3.png")
+PNG_48_PATH = os.path.join(ICON_DIR, "youtube2mp3_48.png")
+ICO_PATH = os.path.join(ICON_DIR, "youtube2mp3.ico")
+ICO_SIZES = (16, 32, 48, 64, 128, 256)
+
+# Sample rows per pixel row; coverage along a row is computed exactly
+SUPERSAMPLING = 8
+
+# PNG tEXt keyword holding the source hash
+HASH_KEYWORD = "Source-Hash"
+
+SVG_NS = "{http://www.w3.org/2000/svg}"
+
+
+def _rect(x0, y0, x1, y1):
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+
+
+def _bowl(cx, cy, outer, inner, steps=24):
+    """Right half of a ring, as drawn in the bowls of P and 3"""
+    angles = [math.pi * (i / steps - 0.5) for i in range(steps + 1)]
+    return ([(cx + outer * math.cos(a), cy + outer * math.sin(a)) for a in angles]
+            + [(cx + inner * math.cos(a), cy + inner * math.sin(a)) for a in reversed(angles)])
+
+
+# Bold glyphs in font units (1000 per em, y up from the baseline):
+# advance width and the polygons whose union is the glyph
+GLYPHS = {
+    "M": (833, [_rect(70, 0, 220, 716), _rect(613, 0, 763, 716),
+                [(70, 716), (220, 716), (492, 0), (341, 0)],
+                [(613, 716), (763, 716), (492, 0), (341, 0)]]),
+    "P": (667, [_rect(75, 0, 225, 716), _rect(75, 566, 420, 716), _rect(75, 290, 420, 440),
+                _bowl(420, 503, 213, 63)]),
+    "3": (556, [_rect(50, 566, 300, 716), _rect(150, 283, 300, 433), _rect(50, 0, 300, 150),
+                _bowl(300, 499.5, 216.5, 66.5), _bowl(300, 216.5, 216.5, 66.5)]),
+    " ": (278, []),
+}
+
+
+def parse_color(value):
+    """Return an SVG color as (r, g, b) in 0..1, or None for "none" """
+    if not value or value == "none":
+        return None
+    if value.startswith("#") and len(value) == 4:
+        value = "#" + "".join(c * 2 for c in value[1:])
+    if not value.startswith("#") or len(value) != 7:
+        raise ValueError(f"Unsupported color: {value}")
+    return tuple(int(value[i:i + 2], 16) / 255 for i in (1, 3, 5))
+
+
+def polygon_spans(points):
+    """Return a function giving the intervals a polygon covers on a row (even-odd rule)"""
+    edges = [(x0, y0, x1, y1) for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1]) if y0 != y1]
+
+    def spans(y):
+        xs = sorted(x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+                    for x0, y0, x1, y1 in edges if (y0 <= y) != (y1 <= y))
+        return list(zip(xs[0::2], xs[1::2]))
+    return spans
+
+
+def ring_spans(cx, cy, outer, inner=0.0):
+    """Return a function giving the intervals a disc, or a ring, covers on a row"""
+    def spans(y):
+        dy = y - cy
+        if abs(dy) >= outer:
+            return []
+        half = math.sqrt(outer * outer - dy * dy)
+        if abs(dy) >= inner:
+            return [(cx - half, cx + half)]
+        hole = math.sqrt(inner * inner - dy * dy)
+        return [(cx - half, cx - hole), (cx + hole, cx + half)]
+    return spans
+
+
+def text_shapes(element):
+    """Return span functions for an SVG <text>, one per glyph polygon"""
+    text = "".join(element.itertext()).strip()
+    missing = set(text) - set(GLYPHS)
+    if missing:
+        raise ValueError(f"No glyph for: {''.join(sorted(missing))}")
+    scale = float(element.get("font-size", "16")) / 1000
+    width = sum(GLYPHS[char][0] for char in text) * scale
+    x = float(element.get("x", "0")) - {"middle": width / 2, "end": width}.get(element.get("text-anchor"), 0)
+    baseline = float(element.get("y", "0"))
+    shapes = []
+    for char in text:
+        advance, polygons = GLYPHS[char]
+        for polygon in polygons:
+            shapes.append(polygon_spans([(x + gx * scale, baseline - gy * scale) for gx, gy in polygon]))
+        x += advance * scale
+    return shapes
+
+
+def parse_svg(data):
+    """Return (width, height, layers) of an SVG
+
+    layers is a list of ((r, g, b), span functions) in painting order.
+    Only what the icon uses is understood: <circle>, <polygon>, <rect>
+    and <text> with solid fills, and circle strokes.
+    """
+    root = ET.fromstring(data)
+    width, height = float(root.get("width")), float(root.get("height"))
+    layers = []
+    for element in root.iter():
+        tag = element.tag.replace(SVG_NS, "")
+        fill = parse_color(element.get("fill", "#000000"))
+        if tag == "circle":
+            cx, cy, r = (float(element.get(name, "0")) for name in ("cx", "cy", "r"))
+            if fill:
+                layers.append((fill, [ring_spans(cx, cy, r)]))
+            stroke = parse_color(element.get("stroke"))
+            stroke_width = float(element.get("stroke-width", "1"))
+            if stroke:
+                layers.append((stroke, [ring_spans(cx, cy, r + stroke_width / 2, r - stroke_width / 2)]))
+        elif tag == "polygon":
+            values = [float(v) for v in element.get("points").replace(",", " ").split()]
+            layers.append((fill, [polygon_spans(list(zip(values[0::2], values[1::2])))]))
+        elif tag == "rect":
+            x, y, w, h = (float(element.get(name, "0")) for name in ("x", "y", "width", "height"))
+            layers.append((fill, [polygon_spans(_rect(x, y, x + w, y + h))]))
+        elif tag == "text":
+            layers.append((fill, text_shapes(element)))
+    return width, height, [(color, shapes) for color, shapes in layers if color]
+
+
+def _merge(spans):
+    merged = []
+    for x0, x1 in sorted(spans):
+        if merged and x0 <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], x1)
+        else:
+            merged.append([x0, x1])
+    return merged
+
+
+def _row_coverage(spans, size):
+    """Per-pixel coverage (0..1) of one row of samples by merged intervals"""
+    edges = [0.0] * size
+    inside = [0] * (size + 1)  # difference array of fully covered pixels
+    for x0, x1 in spans:
+        x0, x1 = max(x0, 0.0), min(x1, float(size))
+        if x1 <= x0:
+            continue
+        first, last = int(x0), min(int(x1), size - 1)
+        if first == last:
+            edges[first] += x1 - x0
+            continue
+        edges[first] += first + 1 - x0
+        inside[first + 1] += 1
+        inside[last] -= 1
+        edges[last] += x1 - last
+    return [edge + full for edge, full in zip(edges, accumulate(inside))]
+
+
+def rasterize(svg, size, samples=SUPERSAMPLING):
+    """Render a parsed SVG to size x size straight (non-premultiplied) RGBA bytes"""
+    width, height, layers = svg
+    scale = size / max(width, height)
+    pixels = size * size
+    channels = [[0.0] * pixels for _ in range(4)]  # premultiplied r, g, b and alpha
+    for color, shapes in layers:
+        coverage = [0.0] * pixels
+        for row in range(size * samples):
+            y = (row + 0.5) / samples / scale
+            spans = _merge(span for shape in shapes for span in shape(y))
+            if not spans:
+                continue
+            start = row // samples * size
+            covered = _row_coverage([(x0 * scale, x1 * scale) for x0, x1 in spans], size)
+            coverage[start:start + size] = [c + v / samples for c, v in
+                                            zip(coverage[start:start + size], covered)]
+        keep = [1 - min(c, 1.0) for c in coverage]
+        for channel, value in zip(channels, color + (1.0,)):
+            channel[:] = [value * (1 - k) + old * k for old, k in zip(channel, keep)]
+    red, green, blue, alpha = channels
+    rgba = bytearray(pixels * 4)
+    for offset, channel in enumerate((red, green, blue)):
+        rgba[offset::4] = bytes(round(255 * v / a) if a else 0 for v, a in zip(channel, alpha))
+    rgba[3::4] = bytes(round(255 * a) for a in alpha)
+    return bytes(rgba)
+
+
+def _chunk(chunk_type, data):
+    return (struct.pack(">I", len(data)) + chunk_type + data
+            + struct.pack(">I", zlib.crc32(chunk_type + data)))
+
+
+def png_bytes(rgba, size, text=None):
+    """Encode size x size RGBA bytes as a PNG, with optional tEXt entries"""
+    stride = size * 4
+    raw = b"".join(b"\x00" + rgba[y * stride:(y + 1) * stride] for y in range(size))
+    chunks = [_chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 6, 0, 0, 0))]
+    for keyword, value in (text or {}).items():
+        chunks.append(_chunk(b"tEXt", keyword.encode("latin-1") + b"\x00" + value.encode("latin-1")))
+    chunks.append(_chunk(b"IDAT", zlib.compress(raw, 9)))
+    chunks.append(_chunk(b"IEND", b""))
+    return b"\x89PNG\r\n\x1a\n" + b"".join(chunks)
+
+
+def png_text(path, keyword):
+    """Return a tEXt value of a PNG file, or None"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    offset = 8
+    while offset + 8 <= len(data):
+        length, chunk_type = struct.unpack(">I4s", data[offset:offset + 8])
+        body = data[offset + 8:offset + 8 + length]
+        if chunk_type == b"tEXt" and body.startswith(keyword.encode("latin-1") + b"\x00"):
+            return body[len(keyword) + 1:].decode("latin-1")
+        if chunk_type == b"IDAT":
+            return None
+        offset += 12 + length
+    return None
+
+
+def ico_bytes(pngs):
+    """Pack {size: PNG bytes} into an ICO file"""
+    header = struct.pack("<HHH", 0, 1, len(pngs))
+    offset = len(header) + 16 * len(pngs)
+    entries, images = [], []
+    for size, png in sorted(pngs.items()):
+        entries.append(struct.pack("<BBBBHHII", size % 256, size % 256, 0, 0, 1, 32, len(png), offset))
+        images.append(png)
+        offset += len(png)
+    return header + b"".join(entries) + b"".join(images)
+
+
+def source_hash():
+    """Hash of the SVG and of this generator"""
+    digest = hashlib.sha256()
+    for path in (SOURCE, os.path.abspath(__file__)):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _write(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    print(f"Created {os.path.basename(path)}")
+
+
+def create_icon(force=False):
+    """Render the PNG and ICO files unless they are up to date; returns True if rendered"""
+    digest = source_hash()
+    outputs = (PNG_PATH, PNG_48_PATH, ICO_PATH)
+    if not force and png_text(PNG_PATH, HASH_KEYWORD) == digest and all(map(os.path.exists, outputs)):
+        print("Icons are up to date")
+        return False
+
+    with open(SOURCE, "rb") as f:
+        svg = parse_svg(f.read())
+    images = {size: rasterize(svg, size) for size in ICO_SIZES}
+    pngs = {size: png_bytes(rgba, size) for size, rgba in images.items()}
+
+    # The hash goes into the 256 pixel PNG, written last so an interrupted
+    # run is redone
+    _write(ICO_PATH, ico_bytes(pngs))
+    _write(PNG_48_PATH, pngs[48])
+    _write(PNG_PATH, png_bytes(images[256], 256, {HASH_KEYWORD: digest}))
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render youtube2mp3.svg to PNG and ICO files.")
+    parser.add_argument("--force", action="store_true", help="render even if the SVG has not changed")
+    create_icon(parser.parse_args(sys.argv[1:]).force)
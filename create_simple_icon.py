@@ -1,96 +0,0 @@
-#!/usr/bin/env python3
-"""
-Simple icon generator using base64 encoded PNG
-Creates a basic YouTube to MP3 icon
-"""
-
-import base64
-import struct
-
-def create_simple_png():
-    """Create a simple PNG icon programmatically"""
-    # PNG signature
-    png_signature = b'\x89PNG\r\n\x1a\n'
-    
-    # For simplicity, create a minimal 48x48 red circle with play button
-    # This is a very basic implementation
-    width, height = 48, 48
-    
-    # Create PNG chunks manually (simplified)
-    # In practice, you'd use PIL, but this creates a minimal valid PNG
-    ihdr = create_ihdr_chunk(width, height)
-    idat = create_idat_chunk_simple(width, height)
-    iend = create_iend_chunk()
-    
-    png_data = png_signature + ihdr + idat + iend
-    
-    with open('youtube2mp3.png', 'wb') as f:
-        f.write(png_data)
-    print("Created youtube2mp3.png (simple version)")
-    
-    # For ICO, we'd need to create a proper ICO file structure
-    # For now, just copy PNG
-    with open('youtube2mp3.ico', 'wb') as f:
-        f.write(png_data)
-    print("Created youtube2mp3.ico (simple version)")
-
-def create_ihdr_chunk(width, height):
-    """Create IHDR chunk"""
-    data = struct.pack('>II', width, height)
-    data += b'\x08\x06'  # 8-bit RGBA
-    data += b'\x00\x00\x00'  # compression, filter, interlace
-    return create_chunk(b'IHDR', data)
-
-def create_idat_chunk_simple(width, height):
-    """Create a simple IDAT chunk with red circle"""
-    # This is a simplified version - creates a red image
-    # In a real implementation, you'd compress the image data properly
-    rows = []
-    for y in range(height):
-        row = b'\x00'  # filter byte
-        for x in range(width):
-            # Simple red circle
-            dist = ((x - width/2)**2 + (y - height/2)**2)**0.5
-            if dist < width/2 - 2:
-                # Red pixel
-                row += b'\xff\x00\x00\xff'  # RGBA
-            else:
-                # Transparent
-                row += b'\x00\x00\x00\x00'
-        rows.append(row)
-    
-    # Compress (simplified - just concatenate for now)
-    data = b''.join(rows)
-    # In reality, this needs zlib compression
-    return create_chunk(b'IDAT', data)
-
-def create_iend_chunk():
-    """Create IEND chunk"""
-    return create_chunk(b'IEND', b'')
-
-def create_chunk(chunk_type, data):
-    """Create a PNG chunk"""
-    crc = calculate_crc(chunk_type + data)
-    length = struct.pack('>I', len(data))
-    return length + chunk_type + data + struct.pack('>I', crc)
-
-def calculate_crc(data):
-    """Calculate CRC32 (simplified - would need proper implementation)"""
-    # This is a placeholder - proper PNG needs zlib and CRC32
-    return 0x12345678
-
-if __name__ == "__main__":
-    # Instead of complex PNG generation, let's create a simple SVG that can be converted
-    svg_content = '''<?xml version="1.0" encoding="UTF-8"?>
-<svg width="256" height="256" xmlns="http://www.w3.org/2000/svg">
-  <circle cx="128" cy="128" r="118" fill="#FF0000"/>
-  <polygon points="100,80 100,176 180,128" fill="#FFFFFF"/>
-  <text x="128" y="220" font-family="Arial" font-size="32" font-weight="bold" fill="#FFFFFF" text-anchor="middle">MP3</text>
-</svg>'''
-    
-    with open('youtube2mp3.svg', 'w') as f:
-        f.write(svg_content)
-    print("Created youtube2mp3.svg")
-    print("Note: For PNG/ICO, install Pillow and run: python create_icon.py")
-    print("Or use an image converter to convert the SVG to PNG/ICO")
-
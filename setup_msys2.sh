@@ -27,10 +27,6 @@ pacman -S --needed --noconfirm yt-dlp
 echo "Installing ffmpeg..."
 pacman -S --needed --noconfirm mingw-w64-ucrt-x86_64-ffmpeg
 
-# Install Pillow for icon generation (optional)
-echo "Installing Pillow for icon generation..."
-pacman -S --needed --noconfirm mingw-w64-ucrt-x86_64-python-pillow
-
 echo ""
 echo "Setup complete!"
 echo ""
@@ -0,0 +1,141 @@
+"""Tests for youtube2mp3_segments on synthetic MP3 frames"""
+
+import struct
+
+import pytest
+
+from youtube2mp3_segments import (
+    SEGMENT_POSTROLL_FRAMES, SEGMENT_PREROLL_FRAMES, EncodedSegment, Segment, crc16, join_segments,
+    plan_segments, samples_per_frame,
+)
+
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, stereo, no CRC, no padding bit:
+# 144 * 128000 // 44100 = 417 bytes per frame, 32 bytes of side info
+HEADER = b"\xff\xfb\x90\x00"
+FRAME_SIZE = 417
+SIDE_INFO = 32
+RATE = 44100
+# The LAME tag follows the Info frame's flags, counts, seek table and quality
+LAME_OFFSET = 4 + SIDE_INFO + 8 + 4 + 4 + 100 + 4
+
+
+def audio_frame(marker):
+    """An audio frame whose body is filled with `marker`, to tell frames apart"""
+    return HEADER + bytes([marker % 256]) * (FRAME_SIZE - 4)
+
+
+def xing_frame(frames, delay, padding):
+    """An Info frame with frame count, byte count, seek table and LAME tag"""
+    body = bytearray(SIDE_INFO) + b"Info" + struct.pack(">I", 0x0F)
+    body += struct.pack(">II", frames, (frames + 1) * FRAME_SIZE) + bytes(range(100)) + struct.pack(">I", 0)
+    lame = bytearray(36)
+    lame[:9] = b"LAME3.100"
+    lame[21:24] = ((delay << 12) | padding).to_bytes(3, "big")
+    body += lame
+    frame = bytearray(HEADER + body + bytes(FRAME_SIZE - 4 - len(body)))
+    frame[LAME_OFFSET + 34:LAME_OFFSET + 36] = crc16(frame[:LAME_OFFSET + 34]).to_bytes(2, "big")
+    return frame
+
+
+def id3_tag(padding):
+    """An empty ID3v2.3 tag of `padding` bytes"""
+    return b"ID3\x03\x00\x00" + bytes(((padding >> shift) & 0x7F) for shift in (21, 14, 7, 0)) + bytes(padding)
+
+
+def write_piece(path, markers, delay, padding, tag=b""):
+    with open(path, "wb") as f:
+        f.write(tag + xing_frame(len(markers), delay, padding) + b"".join(audio_frame(m) for m in markers))
+    return str(path)
+
+
+@pytest.fixture
+def pieces(tmp_path):
+    """Two pieces: frames 0-19, and frames 12-39 encoded with preroll"""
+    first = write_piece(tmp_path / "0.mp3", range(0, 24), delay=576, padding=100, tag=id3_tag(64))
+    second = write_piece(tmp_path / "1.mp3", range(12, 40), delay=576, padding=1000)
+    frame = samples_per_frame(RATE)
+    segments = [Segment(0, 24 * frame, 0, 20), Segment(12 * frame, None, 8, None)]
+    return [first, second], segments
+
+
+def test_join_keeps_the_planned_frames(tmp_path, pieces):
+    paths, segments = pieces
+    output = str(tmp_path / "joined.mp3")
+    frames = join_segments(segments, paths, output)
+
+    assert frames == 20 + 20
+    joined = EncodedSegment(output)
+    assert joined.frame_count == 40
+    with open(output, "rb") as f:
+        data = f.read()
+    markers = [data[offset + 4] for offset in joined.offsets]
+    assert markers == list(range(40))
+    assert len(data) == len(id3_tag(64)) + FRAME_SIZE * 41
+
+
+def test_join_rewrites_the_xing_and_lame_headers(tmp_path, pieces):
+    paths, segments = pieces
+    output = str(tmp_path / "joined.mp3")
+    join_segments(segments, paths, output)
+    joined = EncodedSegment(output)
+
+    xing = joined.xing
+    position = 4 + SIDE_INFO + 8
+    assert struct.unpack(">II", xing[position:position + 8]) == (40, FRAME_SIZE * 41)
+    lame, delay, padding = joined.lame_fields()
+    assert lame == LAME_OFFSET
+    assert (delay, padding) == (576, 1000)  # first piece's delay, last piece's padding
+    assert int.from_bytes(xing[lame + 28:lame + 32], "big") == FRAME_SIZE * 41
+    assert int.from_bytes(xing[lame + 34:lame + 36], "big") == crc16(xing[:lame + 34])
+
+
+def test_join_seek_table_points_at_frames(tmp_path, pieces):
+    paths, segments = pieces
+    output = str(tmp_path / "joined.mp3")
+    join_segments(segments, paths, output)
+    joined = EncodedSegment(output)
+
+    position = 4 + SIDE_INFO + 8 + 8
+    table = joined.xing[position:position + 100]
+    total = FRAME_SIZE * 41
+    assert list(table) == sorted(table)
+    for percent in (0, 25, 50, 99):
+        frame = percent * 40 // 100
+        assert table[percent] == (FRAME_SIZE * (1 + frame)) * 256 // total
+
+
+def test_join_rejects_a_short_piece(tmp_path):
+    first = write_piece(tmp_path / "0.mp3", range(10), 576, 0)
+    second = write_piece(tmp_path / "1.mp3", range(10), 576, 0)
+    with pytest.raises(ValueError):
+        join_segments([Segment(0, None, 0, 20), Segment(0, None, 8, None)], [first, second],
+                      str(tmp_path / "joined.mp3"))
+
+
+def test_plan_tiles_the_source_on_the_frame_grid():
+    frame = samples_per_frame(RATE)
+    duration = 600.0
+    segments = plan_segments(duration, RATE, 4)
+
+    assert len(segments) == 4
+    assert segments[0].start == 0 and segments[0].skip == 0
+    assert segments[-1].end is None and segments[-1].keep is None
+    kept_start = 0
+    for segment in segments[:-1]:
+        assert segment.start + segment.skip * frame == kept_start
+        kept_start += segment.keep * frame
+        assert kept_start % frame == 0
+        assert segment.end == kept_start + SEGMENT_POSTROLL_FRAMES * frame
+    assert segments[-1].start + SEGMENT_PREROLL_FRAMES * frame == kept_start
+    assert all(segment.skip == SEGMENT_PREROLL_FRAMES for segment in segments[1:])
+
+
+def test_plan_snaps_cuts_to_chapters():
+    frame = samples_per_frame(RATE)
+    segments = plan_segments(600.0, RATE, 2, [{"start_time": 0}, {"start_time": 280}])
+    cut = segments[1].start + segments[1].skip * frame
+    assert cut == round(280 * RATE / frame) * frame
+
+
+def test_plan_does_not_split_short_sources():
+    assert len(plan_segments(0.2, RATE, 8)) == 1
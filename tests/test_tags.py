@@ -0,0 +1,118 @@
+"""Tests for youtube2mp3_tags on synthetic MP3 files"""
+
+import struct
+
+import pytest
+
+from youtube2mp3_tags import TAG_PADDING, _read_tag, tags_from_info, write_tags
+
+AUDIO = bytes(range(256)) * 40  # stands in for the MP3 frames after the tag
+
+
+def syncsafe(value):
+    return bytes(((value >> shift) & 0x7F) for shift in (21, 14, 7, 0))
+
+
+def frame(frame_id, data, version):
+    size = syncsafe(len(data)) if version == 4 else struct.pack(">I", len(data))
+    return frame_id.encode() + size + b"\x00\x00" + data
+
+
+def mp3_file(path, version=None, frames=(), padding=16):
+    """Write AUDIO behind an optional ID3v2 tag like the one ffmpeg writes"""
+    data = AUDIO
+    if version:
+        body = b"".join(frame(frame_id, value, version) for frame_id, value in frames) + bytes(padding)
+        data = b"ID3" + bytes([version, 0, 0]) + syncsafe(len(body)) + body + AUDIO
+    path.write_bytes(data)
+    return str(path)
+
+
+def read(path):
+    with open(path, "rb") as f:
+        version, frames, space = _read_tag(f)
+        f.seek(space)
+        audio = f.read()
+    return version, {frame_id: data for frame_id, _, data in frames}, space, audio
+
+
+def test_new_tag_is_version_2_3_and_keeps_the_audio(tmp_path):
+    path = mp3_file(tmp_path / "a.mp3")
+    assert write_tags(path, {"title": "Song", "artist": "Band", "year": "2024"}) is False
+
+    version, frames, space, audio = read(path)
+    assert version == 3
+    assert frames["TIT2"] == b"\x00Song"
+    assert frames["TPE1"] == b"\x00Band"
+    assert frames["TYER"] == b"\x002024"
+    assert space >= TAG_PADDING
+    assert audio == AUDIO
+
+
+def test_version_2_4_round_trip(tmp_path):
+    path = mp3_file(tmp_path / "a.mp3", 4, [("TSSE", b"\x00Lavf60")], padding=TAG_PADDING)
+    assert write_tags(path, {"title": "Café ☕", "year": "2020", "url": "https://youtu.be/x"}) is True
+
+    version, frames, _, audio = read(path)
+    assert version == 4
+    assert frames["TIT2"] == b"\x03" + "Café ☕".encode("utf-8")
+    assert frames["TDRC"] == b"\x002020"
+    assert frames["WOAS"] == b"https://youtu.be/x"
+    assert frames["TSSE"] == b"\x00Lavf60"  # frames that are not changed are kept
+    assert audio == AUDIO
+
+
+def test_version_2_3_uses_utf16_for_non_latin_text(tmp_path):
+    path = mp3_file(tmp_path / "a.mp3", 3, padding=TAG_PADDING)
+    write_tags(path, {"artist": "☕"})
+    _, frames, _, _ = read(path)
+    assert frames["TPE1"][:1] == b"\x01"
+    assert frames["TPE1"][1:].decode("utf-16") == "☕"
+
+
+def test_tag_that_fits_is_written_in_place(tmp_path):
+    path = mp3_file(tmp_path / "a.mp3", 3, [("TIT2", b"\x00Old")], padding=TAG_PADDING)
+    size = (tmp_path / "a.mp3").stat().st_size
+    cover = b"\xff\xd8" + bytes(1000)
+
+    assert write_tags(path, {"title": "New"}, cover) is True
+    assert (tmp_path / "a.mp3").stat().st_size == size
+    _, frames, _, audio = read(path)
+    assert frames["TIT2"] == b"\x00New"
+    assert frames["APIC"].endswith(cover)
+    assert audio == AUDIO
+
+
+def test_tag_that_outgrows_its_space_is_rewritten(tmp_path):
+    path = mp3_file(tmp_path / "a.mp3", 3, [("TIT2", b"\x00Old")], padding=16)
+    cover = b"\xff\xd8" + bytes(1000)
+
+    assert write_tags(path, {"title": "New"}, cover) is False
+    version, frames, space, audio = read(path)
+    assert version == 3
+    assert frames["APIC"].endswith(cover)
+    assert space - 10 - sum(10 + len(data) for data in frames.values()) == TAG_PADDING
+    assert audio == AUDIO
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_empty_value_removes_a_frame(tmp_path):
+    path = mp3_file(tmp_path / "a.mp3", 3, [("TIT2", b"\x00Old"), ("TALB", b"\x00Album")], padding=TAG_PADDING)
+    write_tags(path, {"album": ""})
+    _, frames, _, _ = read(path)
+    assert "TALB" not in frames
+    assert frames["TIT2"] == b"\x00Old"
+
+
+def test_unknown_tag_name_is_rejected(tmp_path):
+    path = mp3_file(tmp_path / "a.mp3")
+    with pytest.raises(ValueError):
+        write_tags(path, {"composer": "Someone"})
+
+
+def test_tags_from_info_prefers_music_metadata():
+    info = {"title": "Video title", "track": "Song", "uploader": "Channel", "artist": "Band",
+            "upload_date": "20240131", "playlist_index": 3}
+    assert tags_from_info(info, "https://youtu.be/x") == {
+        "title": "Song", "artist": "Band", "track": "3", "year": "2024", "url": "https://youtu.be/x",
+    }
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+YouTube to MP3 Converter - command line
+Converts a list of URLs with the concurrent engine, without GTK
+
+    python youtube2mp3.py --headless [options] [FILE]
+
+URLs are read one per line from FILE, or from standard input when FILE is
+omitted or "-".  Blank lines and lines starting with # are ignored.  Files
+are named after the video title.  Playlist and channel URLs are expanded
+into one job per video, named "NN - Title" in playlist order; videos that
+are already in the output folder are skipped.
+
+Timings of every job are appended to a JSON-lines log (--metrics-log), and
+--metrics-port serves running totals for Prometheus while the jobs run.
+
+Jobs are recorded in the journal shared with the window (--journal).  A
+batch that was interrupted by a crash can be picked up again with --resume,
+and --skip-converted leaves out videos the journal has already converted
+into the same folder and format.
+
+--retag DIR rewrites the ID3 tags of the MP3s in a folder from the journal
+and the download cache, plus any --tag NAME=VALUE, without re-encoding.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+from youtube2mp3_engine import (
+    Engine, Job, DownloadCache, OUTPUT_FORMATS, DEFAULT_OUTPUT_FORMAT, QUALITY_PRESETS, DEFAULT_QUALITY,
+    DEFAULT_DOWNLOAD_WORKERS, DEFAULT_ENCODE_WORKERS, DEFAULT_CACHE_SIZE_MB, DEFAULT_PLAYLIST_JOBS,
+    JOB_DONE, JOB_FAILED, TERMINATE_TIMEOUT, METRICS_LOG, PROFILE_ROOT, LOG_ROOT,
+    DEFAULT_JOB_LOGS, DEFAULT_SEGMENT_MIN_DURATION, DEFAULT_BANDWIDTH_LIMIT, is_playlist_url, create_playlist_jobs,
+    DEFAULT_NORMALIZE, parse_rate,
+)
+from youtube2mp3_loudness import DEFAULT_LOUDNESS_TARGET
+from youtube2mp3_metrics import MetricsLog, PROFILE_MODES, serve_metrics
+from youtube2mp3_journal import Journal, JOURNAL_PATH
+from youtube2mp3_ipc import read_urls
+from youtube2mp3_tags import TAG_NAMES, tags_from_info, retag_files
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="youtube2mp3 --headless",
+        description="Download YouTube videos and convert them to audio files."
+    )
+    parser.add_argument("file", nargs="?", default="-",
+                        help="file with one URL per line (default: standard input)")
+    parser.add_argument("-o", "--output-dir", default=os.getcwd(),
+                        help="folder to save files in (default: current folder)")
+    parser.add_argument("-f", "--format", choices=list(OUTPUT_FORMATS), default=DEFAULT_OUTPUT_FORMAT,
+                        help="output format (default: %(default)s)")
+    parser.add_argument("-q", "--quality", choices=list(QUALITY_PRESETS), default=DEFAULT_QUALITY,
+                        help="quality preset; below best, the smallest source stream good enough for it is "
+                             "downloaded (default: %(default)s)")
+    parser.add_argument("--normalize", action=argparse.BooleanOptionalAction, default=DEFAULT_NORMALIZE,
+                        help=f"normalize loudness to {DEFAULT_LOUDNESS_TARGET:g} LUFS; measurements are cached "
+                             "by video (default: %(default)s)")
+    parser.add_argument("-j", "--downloads", type=int, default=DEFAULT_DOWNLOAD_WORKERS,
+                        help="concurrent downloads (default: %(default)s)")
+    parser.add_argument("-e", "--encoders", type=int, default=DEFAULT_ENCODE_WORKERS,
+                        help="concurrent encodes (default: %(default)s)")
+    parser.add_argument("-r", "--limit-rate", type=parse_rate, default=DEFAULT_BANDWIDTH_LIMIT, metavar="RATE",
+                        help="total download rate shared by all downloads, e.g. 4M or 500K; 0 for no limit "
+                             "(default: %(default)s)")
+    parser.add_argument("--stream", action="store_true",
+                        help="pipe downloads straight into the encoder, no temporary file")
+    parser.add_argument("--playlist", action="store_true",
+                        help="treat every URL as a playlist or channel (detected automatically for most URLs)")
+    parser.add_argument("--playlist-jobs", type=int, default=DEFAULT_PLAYLIST_JOBS, metavar="N",
+                        help="videos of one playlist processed at a time (default: %(default)s)")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE_MB, metavar="MB",
+                        help="download cache size limit (default: %(default)s)")
+    parser.add_argument("--segment-minutes", type=float, default=DEFAULT_SEGMENT_MIN_DURATION / 60, metavar="M",
+                        help="encode MP3s of videos longer than M minutes in parallel parts, 0 to never "
+                             "(default: %(default)g)")
+    parser.add_argument("--metrics-log", default=METRICS_LOG, metavar="PATH",
+                        help="JSON-lines file for per-job timings, empty to disable (default: %(default)s)")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--profile", choices=PROFILE_MODES,
+                        help=f"profile every job with cProfile (cpu) or tracemalloc (memory), "
+                             f"reports go to {PROFILE_ROOT}")
+    parser.add_argument("--job-logs", action="store_true", default=DEFAULT_JOB_LOGS,
+                        help=f"keep a compressed log of each job's yt-dlp and ffmpeg output in {LOG_ROOT}")
+    parser.add_argument("--journal", default=JOURNAL_PATH, metavar="PATH",
+                        help="job history database, empty to disable (default: %(default)s)")
+    parser.add_argument("--resume", action="store_true",
+                        help="also queue jobs left unfinished by a crashed or killed run")
+    parser.add_argument("--skip-converted", action="store_true",
+                        help="skip videos already converted into the output folder and format")
+    parser.add_argument("--history", type=int, nargs="?", const=20, metavar="N",
+                        help="print the last N jobs from the journal (default: 20) and exit")
+    parser.add_argument("--retag", metavar="DIR",
+                        help="rewrite the tags of the MP3 files in DIR from the job history and --tag, then exit")
+    parser.add_argument("--tag", action="append", type=parse_tag, default=[], metavar="NAME=VALUE",
+                        help=f"with --retag, set a tag on every file ({', '.join(TAG_NAMES)}); "
+                             f"an empty value removes it")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="print progress messages")
+    return parser.parse_args(argv)
+
+
+def parse_tag(value):
+    """argparse type for --tag NAME=VALUE"""
+    name, sep, text = value.partition("=")
+    if not sep or name not in TAG_NAMES:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE with NAME one of {', '.join(TAG_NAMES)}")
+    return name, text
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    journal = Journal(args.journal) if args.journal else None
+    try:
+        return run(args, journal)
+    finally:
+        if journal:
+            journal.close()
+
+
+def print_history(journal, limit):
+    """Print the most recent jobs of the journal, oldest first"""
+    for row in reversed(journal.history(limit)):
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["updated"]))
+        print(f"{when}  {row['status']:9}  {row['output_path'] or row['url']}")
+
+
+def retag(folder, overrides, journal, cache):
+    """Rewrite the tags of the MP3 files in a folder, several at a time
+    
+    Files converted by an earlier job get that job's metadata and the
+    thumbnail of its cached download; `overrides` are applied on top.
+    """
+    paths = sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.lower().endswith(".mp3"))
+    
+    def tags_for(path):
+        tags, cover = {}, None
+        row = journal.find_output(path) if journal else None
+        if row:
+            info = {key: row[key] for key in ("title", "playlist_title", "playlist_index") if row[key] is not None}
+            cached = cache.find_info(row["video_id"]) if row["video_id"] else None
+            if cached:
+                info = {**cached[0], **info}
+                if cached[1]:
+                    try:
+                        with open(cached[1], "rb") as f:
+                            cover = f.read()
+                    except OSError:
+                        pass  # evicted meanwhile
+            tags = tags_from_info(info, row["url"])
+        tags.update(overrides)
+        return (tags, cover) if tags or cover else None
+    
+    retagged = skipped = failed = 0
+    for path, in_place, error in retag_files(paths, tags_for):
+        if error:
+            print(f"{path}: {error}", file=sys.stderr)
+            failed += 1
+        elif in_place is None:
+            skipped += 1
+        else:
+            print(f"✓ {path}" + ("" if in_place else " (file rewritten to make room)"), flush=True)
+            retagged += 1
+    print(f"{retagged} retagged, {skipped} without known metadata, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def run(args, journal):
+    if args.history is not None:
+        if not journal:
+            print("The journal is disabled", file=sys.stderr)
+            return 2
+        print_history(journal, args.history)
+        return 0
+    
+    if args.retag:
+        if not os.path.isdir(args.retag):
+            print(f"Folder does not exist: {args.retag}", file=sys.stderr)
+            return 2
+        return retag(args.retag, dict(args.tag), journal, DownloadCache(max_size_mb=args.cache_size))
+    
+    resumed = journal.claim_interrupted() if journal and args.resume else []
+    if resumed:
+        print(f"Resuming {len(resumed)} interrupted job(s)", file=sys.stderr)
+    
+    if args.file == "-" and resumed and sys.stdin.isatty():
+        urls = []  # only resuming; do not wait for typed URLs
+    elif args.file == "-":
+        urls = read_urls(sys.stdin)
+    else:
+        with open(args.file) as f:
+            urls = read_urls(f)
+    if not urls and not resumed:
+        if args.resume:
+            print("No interrupted jobs", file=sys.stderr)
+            return 0
+        print("No URLs given", file=sys.stderr)
+        return 2
+    
+    if not os.path.isdir(args.output_dir):
+        print(f"Folder does not exist: {args.output_dir}", file=sys.stderr)
+        return 2
+    
+    print_lock = threading.Lock()
+    last_message = {}
+    
+    def on_update(job):
+        # Called from worker threads
+        with print_lock:
+            if job.status == JOB_DONE and last_message.get(job.id) != JOB_DONE:
+                print(f"✓ {job.output_path}", flush=True)
+                last_message[job.id] = JOB_DONE
+            elif job.status == JOB_FAILED and last_message.get(job.id) != JOB_FAILED:
+                print(f"{job.url}: {job.message}", file=sys.stderr, flush=True)
+                last_message[job.id] = JOB_FAILED
+            elif args.verbose and job.message and last_message.get(job.id) != job.message:
+                print(f"[{job.id}] {job.message}", file=sys.stderr, flush=True)
+                last_message[job.id] = job.message
+    
+    engine = Engine(on_update, args.downloads, args.encoders,
+                    DownloadCache(max_size_mb=args.cache_size),
+                    metrics=MetricsLog(args.metrics_log or None),
+                    journal=journal, skip_converted=args.skip_converted, job_logs=args.job_logs,
+                    segment_min_duration=args.segment_minutes * 60, bandwidth_limit=args.limit_rate)
+    if args.metrics_port:
+        try:
+            serve_metrics(args.metrics_port, lambda: engine.metrics.render(engine.stats()))
+        except OSError as e:
+            print(f"Cannot serve metrics on port {args.metrics_port}: {e}", file=sys.stderr)
+            return 2
+    jobs = []
+    failed = 0
+    try:
+        for job in resumed:
+            job.profile = args.profile
+            jobs.append(job)
+            engine.submit(job)
+        for url in urls:
+            if args.playlist or is_playlist_url(url):
+                try:
+                    group, playlist_jobs, skipped = create_playlist_jobs(
+                        url, args.output_dir, args.format, args.stream, args.playlist_jobs, args.quality,
+                        args.normalize
+                    )
+                except Exception as e:
+                    print(f"{url}: could not read playlist: {e}", file=sys.stderr)
+                    failed += 1
+                    continue
+                print(f"{group.title}: {len(playlist_jobs)} queued, {skipped} already in folder",
+                      file=sys.stderr)
+            else:
+                playlist_jobs = [Job(url, args.output_dir, output_format=args.format, streaming=args.stream,
+                                     quality=args.quality, normalize=args.normalize)]
+            for job in playlist_jobs:
+                job.profile = args.profile
+                jobs.append(job)
+                engine.submit(job)
+        
+        for job in jobs:
+            job.finished.wait()
+    except KeyboardInterrupt:
+        # Stop child processes and remove temp dirs before exiting
+        print("Cancelling...", file=sys.stderr)
+        for job in jobs:
+            engine.cancel(job)
+        for job in jobs:
+            job.finished.wait(TERMINATE_TIMEOUT)
+        return 130
+    
+    failed += sum(1 for job in jobs if job.status == JOB_FAILED)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
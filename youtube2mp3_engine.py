@@ -0,0 +1,1979 @@
+#!/usr/bin/env python3
+"""
+YouTube to MP3 conversion engine
+Downloads with yt-dlp and converts with ffmpeg.  Has no GTK dependency so it
+can be used by the GUI, the command line and headless workers alike.
+"""
+
+import io
+import os
+import functools
+import threading
+import subprocess
+import sys
+import tempfile
+import shutil
+import re
+import socket
+import sqlite3
+import json
+import hashlib
+import itertools
+import math
+import time
+import traceback
+import uuid
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+
+from youtube2mp3_metrics import JobMetrics, MetricsLog, parse_speed, profiled
+from youtube2mp3_joblog import JobLog, prune_logs
+from youtube2mp3_info import InfoCache, bytes_saved
+from youtube2mp3_tags import TAG_PADDING, write_tags, tags_from_info
+from youtube2mp3_loudness import (LoudnessCache, measure_args, parse_measurement, gain_for, gain_filter,
+                                  dynamic_filter)
+from youtube2mp3_segments import SEGMENT_ENCODE_ARGS, plan_segments, timestamp_bases, segment_args, join_segments
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+# Seconds a cancelled child process gets to exit before it is killed
+TERMINATE_TIMEOUT = 5
+
+# Default pool sizes: downloads are network-bound, encodes are CPU-bound
+DEFAULT_DOWNLOAD_WORKERS = 3
+DEFAULT_ENCODE_WORKERS = os.cpu_count() or 1
+
+# Jobs of one playlist or channel that may be active at the same time
+DEFAULT_PLAYLIST_JOBS = 3
+
+# Download rate shared by all running downloads, in yt-dlp's syntax
+# ("4M", "500K"; bytes per second); "0" for no limit
+DEFAULT_BANDWIDTH_LIMIT = os.environ.get("YOUTUBE2MP3_BANDWIDTH_LIMIT", "0")
+# No download is started with less than this, even when the budget is used up
+MIN_DOWNLOAD_RATE = 64 * 1024
+# A running download is restarted with a new share when its share is
+# more than this factor above or below the fair share
+REBALANCE_FACTOR = 1.5
+# ...unless it is expected to finish within this many seconds anyway
+REBALANCE_MIN_ETA = 10
+# Concurrent fragment downloads (yt-dlp -N) of one job, and of all jobs
+# together when there is no limit
+MAX_CONCURRENT_FRAGMENTS = 8
+MAX_CONNECTIONS = 16
+# Throughput assumed for one connection until downloads have been measured
+DEFAULT_CONNECTION_RATE = 1024 * 1024
+
+# Downloaded files that may be produced by yt-dlp
+AUDIO_SUFFIXES = ['.mp3', '.m4a', '.webm', '.opus', '.ogg', '.mp4']
+
+# Output formats.  "copy_codecs" are source codecs that can go into the
+# output container unchanged (-c:a copy); anything else is encoded once
+# with "encode_args".  "download_format" prefers a source that can be copied.
+# Cover art is added by ffmpeg with "cover_args", or, for "id3_tags"
+# formats, written with the other tags after encoding (Engine.tag_output).
+OUTPUT_FORMATS = {
+    "mp3": {
+        "name": "MP3",
+        "label": "MP3",
+        "ext": ".mp3",
+        "download_format": "bestaudio/best",
+        "copy_codecs": ("mp3",),
+        "encode_args": ["-codec:a", "libmp3lame", "-q:a", "0", "-id3v2_version", "3"],
+        "cover_args": None,
+        "id3_tags": True,
+    },
+    "opus": {
+        "name": "Opus",
+        "label": "Opus (no re-encode for Opus sources)",
+        "ext": ".opus",
+        "download_format": "bestaudio[acodec=opus]/bestaudio/best",
+        "copy_codecs": ("opus",),
+        "encode_args": ["-codec:a", "libopus", "-b:a", "160k"],
+        "cover_args": None,  # the Ogg muxer cannot store cover art
+        "id3_tags": False,
+    },
+    "m4a": {
+        "name": "M4A",
+        "label": "M4A (no re-encode for AAC sources)",
+        "ext": ".m4a",
+        "download_format": "bestaudio[ext=m4a]/bestaudio/best",
+        "copy_codecs": ("aac",),
+        "encode_args": ["-codec:a", "aac", "-b:a", "192k"],
+        "cover_args": ["-c:v", "mjpeg", "-disposition:v:0", "attached_pic"],
+        "id3_tags": False,
+    },
+}
+DEFAULT_OUTPUT_FORMAT = "mp3"
+
+# Quality presets.  "bitrate" is the target output bitrate in kbit/s; None
+# keeps the best source and the encoder settings of OUTPUT_FORMATS.
+# Encoding cannot add quality the source lacks, so with a target the
+# download is the smallest audio-only stream of at least that bitrate
+# rather than the best one.  "mp3_quality" is the LAME VBR setting (-q:a)
+# that averages about the target.
+QUALITY_PRESETS = {
+    "best": {"label": "Best", "bitrate": None, "mp3_quality": 0},
+    "high": {"label": "High (128 kbps)", "bitrate": 128, "mp3_quality": 5},
+    "medium": {"label": "Medium (96 kbps)", "bitrate": 96, "mp3_quality": 7},
+    "low": {"label": "Low (48 kbps, speech)", "bitrate": 48, "mp3_quality": 9},
+}
+DEFAULT_QUALITY = os.environ.get("YOUTUBE2MP3_QUALITY", "best").strip().lower()
+if DEFAULT_QUALITY not in QUALITY_PRESETS:
+    print(f"YOUTUBE2MP3_QUALITY: unknown preset {DEFAULT_QUALITY!r} (choose from {', '.join(QUALITY_PRESETS)}), "
+          "using best", file=sys.stderr)
+    DEFAULT_QUALITY = "best"
+
+# Persistent cache for downloaded source streams
+CACHE_ROOT = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "youtube2mp3"
+)
+DEFAULT_CACHE_SIZE_MB = int(os.environ.get("YOUTUBE2MP3_CACHE_SIZE_MB", "2048"))
+
+# Per-video working directories.  They survive failed downloads and app
+# restarts so yt-dlp can continue its .part file, and are removed after a
+# successful job or once older than the age limit.
+WORK_ROOT = os.path.join(CACHE_ROOT, "work")
+DEFAULT_WORK_MAX_AGE_DAYS = float(os.environ.get("YOUTUBE2MP3_WORK_MAX_AGE_DAYS", "7"))
+
+# Hidden directory in the output folder where files are written before
+# they are renamed into place.  Being on the same filesystem as the
+# output, finishing a job is an atomic rename instead of a copy, and a
+# half-written file is never visible under its final name.
+STAGING_DIR_NAME = ".youtube2mp3"
+STAGING_MAX_AGE = 86400  # seconds before a file left by a crash is removed
+
+# JSON-lines log with the timings of every finished job (an empty
+# YOUTUBE2MP3_METRICS_LOG disables it), and where per-job profiles go
+METRICS_LOG = os.environ.get("YOUTUBE2MP3_METRICS_LOG", os.path.join(CACHE_ROOT, "metrics.jsonl"))
+PROFILE_ROOT = os.path.join(CACHE_ROOT, "profiles")
+
+# Compressed per-job logs of yt-dlp and ffmpeg output, written when
+# enabled (YOUTUBE2MP3_JOB_LOGS=1) and pruned like the working directories
+LOG_ROOT = os.path.join(CACHE_ROOT, "logs")
+DEFAULT_JOB_LOGS = os.environ.get("YOUTUBE2MP3_JOB_LOGS", "") not in ("", "0")
+
+# MP3 encodes of sources longer than this (seconds, 0 for never) are split
+# into one piece per core not taken by other encodes, encoded in parallel;
+# there is at most one piece per SEGMENT_LENGTH seconds of audio, so
+# shorter sources get fewer pieces
+DEFAULT_SEGMENT_MIN_DURATION = float(os.environ.get("YOUTUBE2MP3_SEGMENT_MIN_MINUTES", "20")) * 60
+SEGMENT_LENGTH = 300
+# Largest accepted difference between a joined file's and its source's duration
+SEGMENT_DURATION_TOLERANCE = 0.25
+
+# Normalize loudness unless jobs say otherwise (see youtube2mp3_loudness)
+DEFAULT_NORMALIZE = os.environ.get("YOUTUBE2MP3_NORMALIZE", "") not in ("", "0")
+
+# Automatic download retries; the delay doubles after each attempt
+DEFAULT_DOWNLOAD_RETRIES = 3
+RETRY_BACKOFF = 2.0
+
+# yt-dlp errors that retrying cannot fix, searched for in the last
+# JOB_ERROR_LINES lines of its output
+PERMANENT_ERRORS = ("Video unavailable", "Private video", "Unsupported URL", "is not a valid URL",
+                    "This video is not available", "Sign in to confirm your age")
+JOB_ERROR_LINES = 20
+
+VIDEO_ID_RE = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)([A-Za-z0-9_-]{11})')
+PLAYLIST_URL_RE = re.compile(r'[?&]list=|/@[^/]+|/channel/|/c/|/user/')
+CHANNEL_URL_RE = re.compile(r'/@[^/?]+/?$|/(?:channel|c|user)/[^/?]+/?$')
+TRACK_PREFIX_RE = re.compile(r'^\d+ - ')
+
+
+# Metadata kept from yt-dlp's info JSON (the full file lists every format
+# and can be hundreds of kilobytes)
+INFO_KEYS = ("id", "title", "uploader", "channel", "artist", "track", "album",
+             "duration", "chapters", "upload_date", "playlist_title", "playlist_index")
+
+# Machine-readable yt-dlp progress: one line per update with raw numbers
+# ("NA" when unknown) instead of the human-readable progress bar
+PROGRESS_PREFIX = "YTDLP_PROGRESS"
+PROGRESS_ARGS = [
+    "--newline",
+    "--progress-template",
+    "download:" + PROGRESS_PREFIX + " %(progress.status)s %(progress.downloaded_bytes)s"
+    " %(progress.total_bytes)s %(progress.total_bytes_estimate)s"
+    " %(progress.speed)s %(progress.eta)s",
+]
+
+ProgressEvent = namedtuple("ProgressEvent", "status downloaded_bytes total_bytes speed eta")
+
+UNSAFE_FILENAME_RE = re.compile(r'[\x00-\x1f<>:"/\\|?*]')
+
+
+def extract_video_id(url):
+    """Return the YouTube video ID in a URL, or None"""
+    match = VIDEO_ID_RE.search(url)
+    return match.group(1) if match else None
+
+
+def sanitize_filename(name):
+    """Make a video title usable as a file name on Windows and Linux"""
+    name = UNSAFE_FILENAME_RE.sub("_", name).strip(" .")
+    return name[:200] or "audio"
+
+
+def prune_work_dirs(max_age, root=WORK_ROOT):
+    """Remove working directories untouched for more than max_age seconds"""
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            mtimes = [os.path.getmtime(path)]
+            mtimes += [os.path.getmtime(os.path.join(path, entry)) for entry in os.listdir(path)]
+        except OSError:
+            continue
+        if max(mtimes) < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def prune_staging_dir(staging_dir, max_age=STAGING_MAX_AGE):
+    """Remove staged files that a crashed run left behind"""
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(staging_dir))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def is_retryable(lines):
+    """False when yt-dlp's output shows an error that retrying cannot fix"""
+    return not any(error in line for line in lines for error in PERMANENT_ERRORS)
+
+
+def terminate_process(process):
+    """Ask a child process to exit, killing it if it does not"""
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(TERMINATE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def is_playlist_url(url):
+    """True for playlist and channel URLs (but not a video inside a playlist)"""
+    return bool(PLAYLIST_URL_RE.search(url)) and not VIDEO_ID_RE.search(url)
+
+
+def expand_playlist(url):
+    """List the videos of a playlist or channel with one flat metadata fetch
+    
+    Returns (title, entries) where entries are dicts with "index", "id",
+    "title", "url" and "duration" (None if unknown).  Raises RuntimeError
+    when yt-dlp fails.
+    """
+    ytdlp_cmd = shutil.which("yt-dlp")
+    if not ytdlp_cmd:
+        raise RuntimeError("yt-dlp not found. Please install it: pacman -S yt-dlp")
+    # A bare channel URL lists its tabs rather than its videos
+    if CHANNEL_URL_RE.search(url):
+        url = url.rstrip("/") + "/videos"
+    result = subprocess.run(
+        [ytdlp_cmd, "--flat-playlist", "-J", url],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "yt-dlp failed")
+    playlist = json.loads(result.stdout)
+    
+    entries = []
+    for entry in playlist.get("entries") or []:
+        if not entry or not entry.get("id"):
+            continue
+        entries.append({
+            "index": len(entries) + 1,
+            "id": entry["id"],
+            "title": entry.get("title") or entry["id"],
+            "url": entry.get("url") or f"https://www.youtube.com/watch?v={entry['id']}",
+            "duration": entry.get("duration"),
+        })
+    return playlist.get("title") or url, entries
+
+
+def create_playlist_jobs(url, output_dir, output_format=DEFAULT_OUTPUT_FORMAT, streaming=False,
+                         max_active=DEFAULT_PLAYLIST_JOBS, quality=DEFAULT_QUALITY, normalize=DEFAULT_NORMALIZE):
+    """Expand a playlist into jobs named "NN - Title" in playlist order
+    
+    Entries whose title already exists in output_dir (under any track
+    number) are skipped, so re-running a playlist only fetches new videos.
+    Returns (group, jobs, skipped_count).
+    """
+    title, entries = expand_playlist(url)
+    group = JobGroup(title, max_active)
+    width = max(2, len(str(len(entries))))
+    ext = OUTPUT_FORMATS[output_format]["ext"]
+    
+    existing = set()
+    for name in os.listdir(output_dir):
+        stem, name_ext = os.path.splitext(name)
+        if name_ext == ext:
+            existing.add(TRACK_PREFIX_RE.sub("", stem))
+    
+    jobs = []
+    skipped = 0
+    for entry in entries:
+        name = sanitize_filename(entry["title"])
+        if name in existing:
+            skipped += 1
+            continue
+        job = Job(entry["url"], output_dir, f"{entry['index']:0{width}d} - {name}", output_format,
+                  streaming, group, quality=quality, normalize=normalize)
+        job.video_id = job.video_id or entry["id"]
+        job.info = {"title": entry["title"], "playlist_title": title, "playlist_index": entry["index"]}
+        if entry["duration"]:
+            job.info["duration"] = entry["duration"]  # lets the scheduler start short videos first
+        jobs.append(job)
+    return group, jobs, skipped
+
+
+def parse_progress_line(line):
+    """Parse a PROGRESS_ARGS template line into a ProgressEvent, or None
+    
+    Byte counts and speed are floats (bytes, bytes/s), eta is seconds;
+    unknown values are None.  total_bytes falls back to yt-dlp's estimate.
+    """
+    fields = line.split()
+    if len(fields) != 7 or fields[0] != PROGRESS_PREFIX:
+        return None
+    
+    def number(value):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    
+    downloaded, total, estimate, speed, eta = (number(value) for value in fields[2:])
+    return ProgressEvent(fields[1], downloaded, total or estimate, speed, eta)
+
+
+def format_size(num_bytes):
+    """Format a byte count as e.g. '3.4 MiB'"""
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if num_bytes < 1024 or unit == "GiB":
+            return f"{num_bytes:.1f} {unit}" if unit != "B" else f"{num_bytes:.0f} B"
+        num_bytes /= 1024
+
+
+def parse_rate(value):
+    """Turn a rate like "4M", "500K" or "1.5m" into bytes per second (0 for none)
+    
+    Like yt-dlp's --limit-rate, K, M and G are powers of 1024.  Raises
+    ValueError for anything else.
+    """
+    if isinstance(value, (int, float)):
+        return max(0, int(value))
+    text = value.strip().upper().removesuffix("B").removesuffix("I")
+    factor = 1
+    if text[-1:] in ("K", "M", "G"):
+        factor = 1024 ** ("KMG".index(text[-1]) + 1)
+        text = text[:-1]
+    rate = float(text) * factor
+    if rate < 0:
+        raise ValueError(f"negative rate: {value}")
+    return int(rate)
+
+
+def remaining_work(job):
+    """Seconds of audio the job still has to download and encode, or None if unknown
+    
+    Used to run the job closest to finishing first.
+    """
+    duration = job.duration or job.info.get("duration")
+    if not duration:
+        return None
+    progress = job.progress
+    if progress and progress.total_bytes and progress.downloaded_bytes:
+        duration *= 1 - min(1.0, progress.downloaded_bytes / progress.total_bytes)
+    return duration
+
+
+def format_progress(event):
+    """Human-readable summary of a ProgressEvent"""
+    parts = []
+    if event.downloaded_bytes is not None and event.total_bytes:
+        parts.append(f"{event.downloaded_bytes / event.total_bytes:.0%}")
+    if event.speed:
+        parts.append(f"{format_size(event.speed)}/s")
+    if event.eta is not None:
+        minutes, seconds = divmod(int(event.eta), 60)
+        parts.append(f"ETA {minutes}:{seconds:02d}")
+    return "Downloading... " + ", ".join(parts) if parts else "Downloading..."
+
+
+def load_info(path):
+    """Read a yt-dlp info JSON file, keeping only INFO_KEYS"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {key: info[key] for key in INFO_KEYS if info.get(key) is not None}
+
+
+def process_alive(pid):
+    """Return False only when pid is known not to exist (POSIX)"""
+    if os.name != "posix":
+        return True  # os.kill would terminate the process on Windows; callers fall back on timestamps
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+DOWNLOAD_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    file TEXT NOT NULL,
+    thumbnail TEXT,
+    info TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pins (
+    key TEXT NOT NULL,
+    host TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    pinned REAL NOT NULL,
+    PRIMARY KEY (key, host, pid)
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+"""
+
+# Seconds after which a pin, or a file being moved into the download cache,
+# counts as left over from a crashed process (pins of dead processes on
+# this host are dropped right away where that can be checked)
+CACHE_STALE_AGE = 24 * 3600
+
+
+class DownloadCache:
+    """On-disk cache of downloaded source streams with LRU eviction
+    
+    Entries are keyed by video ID and yt-dlp format selector, so the same
+    video converted again (to another file name or folder) skips the
+    download.  Entries in use by a running job are pinned and never
+    evicted; ``release`` unpins them.
+    
+    The index is an SQLite database in the cache folder, shared by every
+    process using the same root (the window and the command line): each
+    change is one transaction, pins are recorded per process, and pins of
+    processes that have died on this host, or older than CACHE_STALE_AGE,
+    are dropped when a cache is opened.  Files in the folder that the
+    index does not know are deleted then too, so the size limit covers
+    everything on disk.
+    """
+    
+    def __init__(self, root=os.path.join(CACHE_ROOT, "downloads"), max_size_mb=DEFAULT_CACHE_SIZE_MB):
+        self.root = root
+        self.max_size = max_size_mb * 1024 * 1024
+        self.index_path = os.path.join(root, "index.sqlite3")
+        self.host = socket.gethostname()
+        self.pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()  # guards the connection
+        os.makedirs(root, exist_ok=True)
+        self.conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(DOWNLOAD_CACHE_SCHEMA)
+        with self.lock, self._transaction():
+            self._import_json_index()
+            self.conn.execute("DELETE FROM pins WHERE pinned < ?", (time.time() - CACHE_STALE_AGE,))
+            for host, pid in self.conn.execute("SELECT DISTINCT host, pid FROM pins").fetchall():
+                if host == self.host and not process_alive(pid):
+                    self.conn.execute("DELETE FROM pins WHERE host = ? AND pid = ?", (host, pid))
+            self._tidy()
+            self._evict()
+    
+    @staticmethod
+    def key(video_id, download_format):
+        digest = hashlib.sha1(download_format.encode()).hexdigest()[:8]
+        return f"{video_id}.{digest}"
+    
+    def lookup(self, video_id, download_format):
+        """Return (source_file, thumbnail, info) for a cached download, or None
+        
+        A hit pins the entry until ``release`` is called.
+        """
+        key = self.key(video_id, download_format)
+        with self.lock, self._transaction():
+            row = self.conn.execute("SELECT file, thumbnail, info FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or not os.path.exists(os.path.join(self.root, row[0])):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._pin(key)
+            return self._paths(row[0], row[1]) + (json.loads(row[2]),)
+    
+    def store(self, video_id, download_format, source_file, thumbnail=None, info=None):
+        """Move a finished download into the cache and pin it
+        
+        Returns the (source_file, thumbnail) paths inside the cache.  When
+        another process has stored the same download meanwhile, its copy
+        is used and this one is dropped.
+        """
+        key = self.key(video_id, download_format)
+        file = key + os.path.splitext(source_file)[1]
+        thumbnail_file = key + ".jpg" if thumbnail else None
+        # Move under a temporary name first: a copy across file systems can
+        # take a while and must not hold the index
+        suffix = f".{self.pid}.{threading.get_ident()}.tmp"
+        moves = [(source_file, file)] + ([(thumbnail, thumbnail_file)] if thumbnail else [])
+        for path, name in moves:
+            shutil.move(path, os.path.join(self.root, name + suffix))
+        size = sum(os.path.getsize(os.path.join(self.root, name + suffix)) for _, name in moves)
+        with self.lock, self._transaction():
+            row = self.conn.execute("SELECT file, thumbnail FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and os.path.exists(os.path.join(self.root, row[0])):
+                for _, name in moves:
+                    os.remove(os.path.join(self.root, name + suffix))
+                file, thumbnail_file = row
+                self.conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            else:
+                for _, name in moves:
+                    os.replace(os.path.join(self.root, name + suffix), os.path.join(self.root, name))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, file, thumbnail, info, size, last_used)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, file, thumbnail_file, json.dumps(info or {}), size, time.time())
+                )
+            self._pin(key)
+            self._evict()
+            return self._paths(file, thumbnail_file)
+    
+    def find_info(self, video_id):
+        """Return (info, thumbnail) of the newest cached download of a video, or None
+        
+        Any format will do.  Nothing is pinned, so the thumbnail may be
+        evicted at any time.
+        """
+        prefix = video_id + "."
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT file, thumbnail, info FROM entries WHERE substr(key, 1, ?) = ?"
+                " ORDER BY last_used DESC LIMIT 1",
+                (len(prefix), prefix)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[2]), self._paths(row[0], row[1])[1]
+    
+    def release(self, video_id, download_format):
+        """Unpin an entry returned by ``lookup`` or ``store``"""
+        key = self.key(video_id, download_format)
+        with self.lock, self._transaction():
+            self.conn.execute("UPDATE pins SET count = count - 1 WHERE key = ? AND host = ? AND pid = ?",
+                              (key, self.host, self.pid))
+            self.conn.execute("DELETE FROM pins WHERE count <= 0")
+            self._evict()
+    
+    def stats(self):
+        """Return hit/miss counters and current cache size"""
+        with self.lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "size": size}
+    
+    def _paths(self, file, thumbnail):
+        return (
+            os.path.join(self.root, file),
+            os.path.join(self.root, thumbnail) if thumbnail else None,
+        )
+    
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so a read-modify-
+        # write never interleaves with another process
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+    
+    def _pin(self, key):
+        # Called in a transaction
+        self.conn.execute(
+            "INSERT INTO pins (key, host, pid, count, pinned) VALUES (?, ?, ?, 1, ?)"
+            " ON CONFLICT (key, host, pid) DO UPDATE SET count = count + 1, pinned = excluded.pinned",
+            (key, self.host, self.pid, time.time())
+        )
+    
+    def _import_json_index(self):
+        # Called in a transaction: take over the index.json of older versions
+        json_path = os.path.join(self.root, "index.json")
+        try:
+            with open(json_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        for key, entry in index.items():
+            self.conn.execute(
+                "INSERT OR IGNORE INTO entries (key, file, thumbnail, info, size, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, entry["file"], entry.get("thumbnail"), json.dumps(entry.get("info", {})),
+                 entry["size"], entry["last_used"])
+            )
+        for path in (json_path, json_path + ".tmp"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    def _tidy(self):
+        # Called in a transaction: drop entries whose files have disappeared
+        # and delete files no entry refers to
+        known = set()
+        for key, file, thumbnail in self.conn.execute("SELECT key, file, thumbnail FROM entries").fetchall():
+            if os.path.exists(os.path.join(self.root, file)):
+                known.update(name for name in (file, thumbnail) if name)
+            else:
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        index_name = os.path.basename(self.index_path)
+        cutoff = time.time() - CACHE_STALE_AGE
+        for entry in os.scandir(self.root):
+            if entry.name in known or entry.name.startswith(index_name) or not entry.is_file():
+                continue
+            try:
+                if entry.name.endswith(".tmp") and entry.stat().st_mtime > cutoff:
+                    continue  # being moved in by another process
+                os.remove(entry.path)
+            except OSError:
+                pass
+    
+    def _evict(self):
+        # Called in a transaction: drop least recently used unpinned entries
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_size:
+            return
+        rows = self.conn.execute(
+            "SELECT key, file, thumbnail, size FROM entries WHERE key NOT IN (SELECT key FROM pins)"
+            " ORDER BY last_used"
+        ).fetchall()
+        for key, file, thumbnail, size in rows:
+            if total <= self.max_size:
+                break
+            for path in self._paths(file, thumbnail):
+                if path:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+
+
+def probe_audio(path):
+    """Return (codec_name, duration_seconds, sample_rate) of the first audio stream
+    
+    Any value is None when it cannot be determined (e.g. ffprobe is not
+    installed).
+    """
+    ffprobe_cmd = shutil.which("ffprobe")
+    if not ffprobe_cmd:
+        return None, None, None
+    result = subprocess.run(
+        [ffprobe_cmd, "-v", "error",
+         "-select_streams", "a:0",
+         "-show_entries", "stream=codec_name,sample_rate:format=duration",
+         "-of", "json", path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True
+    )
+    if result.returncode != 0:
+        return None, None, None
+    try:
+        info = json.loads(result.stdout)
+    except ValueError:
+        return None, None, None
+    streams = info.get("streams") or [{}]
+    codec = streams[0].get("codec_name")
+    try:
+        duration = float(info.get("format", {}).get("duration"))
+    except (TypeError, ValueError):
+        duration = None
+    try:
+        sample_rate = int(streams[0].get("sample_rate"))
+    except (TypeError, ValueError):
+        sample_rate = None
+    return codec, duration, sample_rate
+
+
+def format_selector(output_format, quality=DEFAULT_QUALITY):
+    """Return the yt-dlp format selector for an output format and quality preset
+    
+    With a target bitrate, every "bestaudio" alternative is tried first as
+    the smallest stream of the same kind that reaches the target.  Muxed
+    video ("best") stays the last resort, used only without any
+    audio-only stream.
+    """
+    selector = OUTPUT_FORMATS[output_format]["download_format"]
+    bitrate = QUALITY_PRESETS[quality]["bitrate"]
+    if not bitrate:
+        return selector
+    alternatives = []
+    for alternative in selector.split("/"):
+        if alternative.startswith("bestaudio"):
+            alternatives.append("worstaudio" + alternative[len("bestaudio"):] + f"[abr>={bitrate}]")
+        alternatives.append(alternative)
+    return "/".join(alternatives)
+
+
+def encoder_args(output_format, quality=DEFAULT_QUALITY):
+    """Return the encoder arguments of an output format at a quality preset"""
+    args = list(OUTPUT_FORMATS[output_format]["encode_args"])
+    preset = QUALITY_PRESETS[quality]
+    if preset["bitrate"]:
+        if "-q:a" in args:
+            args[args.index("-q:a") + 1] = str(preset["mp3_quality"])
+        if "-b:a" in args:
+            args[args.index("-b:a") + 1] = f"{preset['bitrate']}k"
+    return args
+
+
+def tag_padding_args(job):
+    """ffmpeg arguments leaving room in an MP3's ID3 tag for Engine.tag_output
+    
+    ffmpeg pads its tag with a few bytes only; without the room, writing
+    the tags and cover would copy the whole encoded file once more.
+    """
+    cover = os.path.getsize(job.thumbnail) if job.thumbnail else 0
+    return ["-metadata_header_padding", str(TAG_PADDING + cover)]
+
+
+def plan_conversion(source_codec, output_format, quality=DEFAULT_QUALITY, filtered=False):
+    """Decide how to turn a source into the output format
+    
+    Returns (copy, audio_args): copy is True when the audio stream can be
+    remuxed as-is, in which case no encoding happens at all.  A source
+    that goes through an audio filter (`filtered`) is always encoded.
+    """
+    fmt = OUTPUT_FORMATS[output_format]
+    if source_codec in fmt["copy_codecs"] and not filtered:
+        return True, ["-c:a", "copy"]
+    return False, encoder_args(output_format, quality)
+
+
+class Job:
+    """State of a single download & convert job"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, url, output_dir, filename=None, output_format=DEFAULT_OUTPUT_FORMAT, streaming=False,
+                 group=None, profile=None, uid=None, quality=DEFAULT_QUALITY, normalize=DEFAULT_NORMALIZE):
+        self.id = next(Job._ids)
+        self.uid = uid or uuid.uuid4().hex  # unique across runs, used by the journal
+        self.url = url
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.streaming = streaming
+        self.quality = quality  # key of QUALITY_PRESETS
+        self.normalize = normalize
+        self.loudness_gain = None  # dB, set in the download stage when normalizing
+        self.group = group
+        self.profile = profile  # "cpu" or "memory" to profile the job's stages
+        # Without a filename the output is named after the video title
+        # once it is known (see Engine.resolve_output_path)
+        self.output_path = None
+        self.filename = filename
+        if filename:
+            ext = OUTPUT_FORMATS[output_format]["ext"]
+            if not filename.endswith(ext):
+                filename += ext
+            self.output_path = os.path.join(output_dir, filename)
+        self.status = JOB_QUEUED
+        self.fraction = 0.0
+        self.progress_text = "Queued"
+        self.message = ""
+        self.temp_dir = None
+        self.work_key = None  # set while the job owns a persistent working directory
+        self.video_id = extract_video_id(url)
+        self.source_file = None
+        self.thumbnail = None
+        self.duration = None
+        self.info = {}
+        self.cached = False
+        self.progress = None  # latest ProgressEvent of the download
+        self.finished = threading.Event()
+        self.cancel_event = threading.Event()
+        self.processes = []  # running yt-dlp / ffmpeg children
+        self.rebalance_requested = False  # restart the download with a new bandwidth share
+        self.metrics = JobMetrics()
+        self.log = JobLog()
+
+    @property
+    def is_finished(self):
+        return self.status in (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+    @property
+    def cancel_requested(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def download_format(self):
+        return format_selector(self.output_format, self.quality)
+
+    @property
+    def display_name(self):
+        if self.output_path:
+            return os.path.basename(self.output_path)
+        return self.info.get("title") or self.url
+
+
+class JobGroup:
+    """Jobs that share a concurrency limit, e.g. the entries of a playlist"""
+
+    def __init__(self, title, max_active=DEFAULT_PLAYLIST_JOBS):
+        self.title = title
+        self.max_active = max(1, max_active)
+        self.active = 0  # guarded by the scheduler's lock
+
+
+class BandwidthBudget:
+    """Shares a total download rate between the running downloads
+    
+    yt-dlp reads its rate limit (--limit-rate) and fragment count (-N)
+    when it starts, so every download attempt asks for its share once:
+    the limit divided by the running downloads (and at least
+    MIN_DOWNLOAD_RATE).  When downloads start or end, the shares of the
+    others go stale; a download whose share is more than REBALANCE_FACTOR
+    off the fair share is listed by unbalanced(), and the engine restarts
+    it with a new share (yt-dlp continues the partial file).  Until then
+    the total may briefly exceed the limit.  The fragment count is the
+    number of connections needed for the share at the throughput of one
+    connection, as measured on earlier downloads; without a limit,
+    MAX_CONNECTIONS are split between the running downloads.
+    """
+
+    def __init__(self, limit=0):
+        self.limit = parse_rate(limit)
+        self.shares = {}  # job ID -> rate of the running download attempts
+        self.jobs = {}  # job ID -> Job, for unbalanced()
+        self.connection_rate = DEFAULT_CONNECTION_RATE
+        self.lock = threading.Lock()
+
+    def set_limit(self, limit):
+        """Change the total rate for download attempts started from now on"""
+        with self.lock:
+            self.limit = parse_rate(limit)
+
+    def fair_share(self, downloads):
+        # Called with the lock held
+        return int(max(MIN_DOWNLOAD_RATE, self.limit / max(1, downloads)))
+
+    def acquire(self, job, active):
+        """Reserve a share for a download attempt among `active` downloads
+        
+        Returns (rate, fragments); rate is None without a limit.
+        """
+        with self.lock:
+            self.shares.pop(job.id, None)
+            if not self.limit:
+                return None, max(1, min(MAX_CONCURRENT_FRAGMENTS, MAX_CONNECTIONS // max(1, active)))
+            rate = self.fair_share(len(self.shares) + 1)
+            self.shares[job.id] = rate
+            self.jobs[job.id] = job
+            fragments = max(1, min(MAX_CONCURRENT_FRAGMENTS, math.ceil(rate / self.connection_rate)))
+            return rate, fragments
+
+    def unbalanced(self):
+        """Jobs whose download share is far off the fair share for the running downloads"""
+        with self.lock:
+            if not self.limit:
+                return [self.jobs[job_id] for job_id in self.shares]  # still held to an old limit
+            fair = self.fair_share(len(self.shares))
+            return [self.jobs[job_id] for job_id, rate in self.shares.items()
+                    if rate > fair * REBALANCE_FACTOR or rate * REBALANCE_FACTOR < fair]
+
+    def release(self, job, rate, fragments, throughput):
+        """Give back a job's share and learn from the attempt's throughput (bytes/s or None)"""
+        with self.lock:
+            self.shares.pop(job.id, None)
+            self.jobs.pop(job.id, None)
+            if not throughput:
+                return
+            per_connection = throughput / fragments
+            if rate and throughput >= 0.9 * rate:
+                # Held back by the limit: the connections could do at least this much
+                self.connection_rate = max(self.connection_rate, per_connection)
+            else:
+                self.connection_rate = 0.7 * self.connection_rate + 0.3 * per_connection
+
+    def stats(self):
+        with self.lock:
+            return {"limit": self.limit, "allocated": sum(self.shares.values()),
+                    "connection_rate": int(self.connection_rate)}
+
+
+class PipelineScheduler:
+    """Two-stage job scheduler with separate download and encode pools
+
+    Downloads are network-bound and run in one pool, encodes are CPU-bound
+    and run in another sized to the CPU cores.  A job moves from the first
+    pool to the second through a bounded hand-off queue: when the encoders
+    fall behind, download workers wait instead of piling files up on disk.
+
+    ``downloader(job)`` returns True when the job should be handed to
+    ``encoder(job)``; returning False ends the job after the download stage.
+    Jobs in a JobGroup additionally never exceed the group's limit of
+    active (downloading or encoding) jobs.  An exception escaping either
+    stage is passed to ``on_error(job, error)`` and ends the job there.
+    
+    Both queues start the job with the least remaining_work() first, which
+    minimizes the mean time until files are ready; jobs of unknown length
+    follow in submission order.
+    """
+
+    def __init__(self, downloader, encoder, download_workers=DEFAULT_DOWNLOAD_WORKERS,
+                 encode_workers=DEFAULT_ENCODE_WORKERS, handoff_size=None, on_error=None):
+        self.downloader = downloader
+        self.encoder = encoder
+        self.on_error = on_error
+        self.download_workers = max(1, download_workers)
+        self.encode_workers = max(1, encode_workers)
+        self.handoff_size = handoff_size or self.encode_workers
+        self.pending = deque()
+        self.handoff = deque()
+        self.downloading = 0
+        self.encoding = 0
+        self.busy_time = {"download": 0.0, "encode": 0.0}
+        self.busy_since = {}
+        self.started = None
+        self.cond = threading.Condition()
+
+    def submit(self, job):
+        """Queue a job; its download starts as soon as a download worker is free"""
+        with self.cond:
+            if self.started is None:
+                self.started = time.monotonic()
+            self.pending.append(job)
+            self._start_downloads()
+
+    def remove(self, job):
+        """Take a job out of the queues if it has not started a stage yet
+        
+        Returns True when the job was removed.
+        """
+        with self.cond:
+            for waiting in (self.pending, self.handoff):
+                if job in waiting:
+                    waiting.remove(job)
+                    if waiting is self.handoff:
+                        self._release_group(job)
+                    self.cond.notify_all()
+                    return True
+            return False
+
+    def set_download_workers(self, count):
+        """Change the number of concurrent downloads"""
+        with self.cond:
+            self.download_workers = max(1, count)
+            self._start_downloads()
+
+    def set_encode_workers(self, count):
+        """Change the number of concurrent encodes"""
+        with self.cond:
+            self.encode_workers = max(1, count)
+            self._start_encodes()
+
+    def stats(self):
+        """Return queue depths and per-pool utilization (0.0 - 1.0)"""
+        with self.cond:
+            now = time.monotonic()
+            elapsed = now - self.started if self.started is not None else 0.0
+            busy = dict(self.busy_time)
+            for (stage, _), since in self.busy_since.items():
+                busy[stage] += now - since
+            return {
+                "download_queued": len(self.pending),
+                "downloading": self.downloading,
+                "handoff_queued": len(self.handoff),
+                "encoding": self.encoding,
+                "download_utilization": self._utilization(busy["download"], self.download_workers, elapsed),
+                "encode_utilization": self._utilization(busy["encode"], self.encode_workers, elapsed),
+            }
+
+    @staticmethod
+    def _utilization(busy, workers, elapsed):
+        if elapsed <= 0:
+            return 0.0
+        return min(1.0, busy / (workers * elapsed))
+
+    def _start_downloads(self):
+        # Called with self.cond held
+        while self.downloading < self.download_workers:
+            job = self._next_pending()
+            if job is None:
+                break
+            self.downloading += 1
+            threading.Thread(target=self._run_download, args=(job,), daemon=True).start()
+
+    def _next_pending(self):
+        # Called with self.cond held: shortest queued job whose group has room
+        ready = [job for job in self.pending
+                 if job.group is None or job.group.active < job.group.max_active]
+        if not ready:
+            return None
+        job = min(ready, key=self._work_key)
+        self.pending.remove(job)
+        if job.group is not None:
+            job.group.active += 1
+        return job
+    
+    @staticmethod
+    def _work_key(job):
+        work = remaining_work(job)
+        return math.inf if work is None else work
+
+    def _release_group(self, job):
+        # Called with self.cond held when a job leaves the pipeline
+        if job.group is not None:
+            job.group.active -= 1
+
+    def _start_encodes(self):
+        # Called with self.cond held
+        while self.handoff and self.encoding < self.encode_workers:
+            job = min(self.handoff, key=self._work_key)
+            self.handoff.remove(job)
+            self.encoding += 1
+            threading.Thread(target=self._run_encode, args=(job,), daemon=True).start()
+        self.cond.notify_all()
+
+    def _run_stage(self, stage, func, job):
+        key = (stage, job.id)
+        with self.cond:
+            self.busy_since[key] = time.monotonic()
+        try:
+            return func(job)
+        except Exception as e:
+            if self.on_error is None:
+                raise
+            self.on_error(job, e)
+            return False
+        finally:
+            with self.cond:
+                self.busy_time[stage] += time.monotonic() - self.busy_since.pop(key)
+
+    def _run_download(self, job):
+        encode = False
+        try:
+            encode = self._run_stage("download", self.downloader, job)
+            if encode:
+                # Wait for room in the hand-off queue (back-pressure)
+                with self.cond:
+                    while len(self.handoff) >= self.handoff_size:
+                        self.cond.wait()
+                    self.handoff.append(job)
+                    self._start_encodes()
+        finally:
+            with self.cond:
+                self.downloading -= 1
+                if not encode:
+                    self._release_group(job)
+                self._start_downloads()
+
+    def _run_encode(self, job):
+        try:
+            self._run_stage("encode", self.encoder, job)
+        finally:
+            with self.cond:
+                self.encoding -= 1
+                self._release_group(job)
+                self._start_encodes()
+                self._start_downloads()
+
+
+class Engine:
+    """Runs download & convert jobs through a PipelineScheduler
+
+    ``on_update(job)`` is called from worker threads whenever a job's
+    progress, message or status changes.  Finished jobs are recorded in
+    ``metrics`` (a MetricsLog, by default writing to METRICS_LOG).  With a
+    ``journal`` (youtube2mp3_journal.Journal) every change is also written
+    to the job history, and ``skip_converted`` finishes jobs whose video
+    the journal has already converted into the same folder and format.
+    ``job_logs`` streams each job's process output to LOG_ROOT.
+    Downloads share ``bandwidth_limit`` (bytes/s or a rate like "4M", see
+    BandwidthBudget).  Video info fetched ahead of time into ``info_cache``
+    saves yt-dlp's extraction step when the job downloads.  Loudness
+    measurements of jobs that normalize are kept in ``loudness_cache``.
+    """
+
+    def __init__(self, on_update=None, download_workers=DEFAULT_DOWNLOAD_WORKERS,
+                 encode_workers=DEFAULT_ENCODE_WORKERS, cache=None,
+                 download_retries=DEFAULT_DOWNLOAD_RETRIES, work_max_age_days=DEFAULT_WORK_MAX_AGE_DAYS,
+                 metrics=None, journal=None, skip_converted=False, job_logs=DEFAULT_JOB_LOGS,
+                 segment_min_duration=DEFAULT_SEGMENT_MIN_DURATION, bandwidth_limit=DEFAULT_BANDWIDTH_LIMIT,
+                 info_cache=None, loudness_cache=None):
+        self.on_update = on_update
+        self.journal = journal
+        self.skip_converted = skip_converted
+        self.job_logs = job_logs
+        self.segment_min_duration = segment_min_duration
+        self.scheduler = PipelineScheduler(functools.partial(self.run_stage, "download", self.download_job),
+                                           functools.partial(self.run_stage, "encode", self.encode_job),
+                                           download_workers, encode_workers, on_error=self.stage_failed)
+        self.metrics = metrics if metrics is not None else MetricsLog(METRICS_LOG or None)
+        self.download_cache = cache if cache is not None else DownloadCache()
+        self.info_cache = info_cache if info_cache is not None else InfoCache(os.path.join(CACHE_ROOT, "info"))
+        self.loudness_cache = (loudness_cache if loudness_cache is not None
+                               else LoudnessCache(os.path.join(CACHE_ROOT, "loudness.sqlite3")))
+        self.bandwidth = BandwidthBudget(bandwidth_limit)
+        self.download_retries = download_retries
+        self.work_dirs_in_use = set()
+        self.work_dirs_lock = threading.Lock()
+        prune_work_dirs(work_max_age_days * 86400)
+        prune_logs(LOG_ROOT, work_max_age_days * 86400)
+
+    def submit(self, job):
+        """Queue a job"""
+        job.metrics.submitted = time.monotonic()
+        if self.job_logs:
+            job.log.path = os.path.join(LOG_ROOT, f"{job.uid}.log.gz")
+        if self.journal:
+            self.journal.update(job)
+        self.scheduler.submit(job)
+
+    def stats(self):
+        """Return scheduler and cache statistics"""
+        stats = self.scheduler.stats()
+        stats.update({"cache_" + key: value for key, value in self.download_cache.stats().items()})
+        stats.update({"bandwidth_" + key: value for key, value in self.bandwidth.stats().items()})
+        stats.update({"info_" + key: value for key, value in self.info_cache.stats().items()})
+        stats.update({"loudness_" + key: value for key, value in self.loudness_cache.stats().items()})
+        return stats
+
+    def update_job(self, job, fraction=None, text=None, message=None, status=None):
+        """Update job state from a worker thread and notify the listener"""
+        if fraction is not None:
+            job.fraction = fraction
+        if text is not None:
+            job.progress_text = text
+        if message is not None:
+            job.message = message
+        if status is not None:
+            job.status = status
+        if self.on_update:
+            self.on_update(job)
+        if self.journal:
+            self.journal.update(job)
+        # Inside a stage the job is finished once the stage has returned
+        if job.is_finished and job.metrics.current_stage is None:
+            self.finish_job(job)
+    
+    def finish_job(self, job):
+        """Record a finished job's metrics and wake up anyone waiting for it"""
+        if not job.finished.is_set():
+            self.metrics.record(job)
+            if self.journal:
+                self.journal.update(job)  # with the final timings
+            job.finished.set()
+    
+    def run_stage(self, stage, func, job):
+        """Run a scheduler stage of the job, timing and optionally profiling it"""
+        job.metrics.begin_stage(stage)
+        try:
+            with profiled(job, stage, PROFILE_ROOT):
+                return func(job)
+        finally:
+            job.metrics.end_stage()
+            if job.is_finished:
+                self.finish_job(job)
+    
+    def cancel(self, job):
+        """Stop a job at whatever stage it is in
+        
+        Queued jobs are dropped; running yt-dlp or ffmpeg children are
+        terminated and the worker cleans up the job's temp dir.  May block
+        for up to TERMINATE_TIMEOUT seconds.
+        """
+        if job.is_finished:
+            return
+        job.cancel_event.set()
+        if self.scheduler.remove(job):
+            self.cleanup_job(job)
+            self.update_job(job, text="Cancelled", message="Cancelled", status=JOB_CANCELLED)
+            return
+        for process in list(job.processes):
+            terminate_process(process)
+    
+    def set_bandwidth_limit(self, limit):
+        """Change the total download rate, rebalancing running downloads to it"""
+        self.bandwidth.set_limit(limit)
+        self.rebalance_downloads()
+    
+    def rebalance_downloads(self):
+        """Restart downloads whose bandwidth share is far off the fair share
+        
+        yt-dlp cannot change its rate while it runs, so the download is
+        stopped and download_job starts it again with a new share,
+        continuing the partial file.  Streams cannot be continued, and
+        downloads about to finish are not worth restarting.
+        """
+        for job in self.bandwidth.unbalanced():
+            eta = job.progress.eta if job.progress else None
+            if job.streaming or job.rebalance_requested or (eta is not None and eta < REBALANCE_MIN_ETA):
+                continue
+            running = [process for process in job.processes if process.poll() is None]
+            if running:
+                job.rebalance_requested = True
+                for process in running:
+                    process.terminate()
+    
+    def start_process(self, job, cmd, **kwargs):
+        """Start a child process that Engine.cancel can terminate"""
+        process = subprocess.Popen(cmd, **kwargs)
+        job.processes.append(process)
+        if job.cancel_requested:
+            terminate_process(process)
+        return process
+    
+    def finish_cancelled(self, job):
+        """Mark a job cancelled if that was requested; returns True if so"""
+        if not job.cancel_requested:
+            return False
+        self.update_job(job, text="Cancelled", message="Cancelled", status=JOB_CANCELLED)
+        return True
+    
+    def fail_job(self, job, message):
+        """Mark a job as failed (called from worker thread)"""
+        self.update_job(job, text="Failed", message=f"✗ {message}", status=JOB_FAILED)
+    
+    def stage_failed(self, job, error):
+        """Fail a job whose stage raised, so that it still reaches a final state"""
+        for line in traceback.format_exception(type(error), error, error.__traceback__):
+            for part in line.rstrip("\n").splitlines():
+                job.log.write("youtube2mp3", part)
+        if not job.is_finished:
+            self.fail_job(job, f"Internal error: {error}")
+        self.cleanup_job(job)
+        self.finish_job(job)
+    
+    def download_job(self, job):
+        """Download the job's audio stream (runs in a download worker thread)
+        
+        Returns True when the download succeeded and the job should be
+        handed to the encode pool.
+        """
+        job.status = JOB_RUNNING
+        handed_off = False
+        try:
+            download_format = job.download_format
+            if self.finish_cancelled(job):
+                return False
+            
+            if self.skip_converted and self.journal and not job.filename:
+                converted = self.journal.find_converted(job.video_id, job.output_dir, job.output_format)
+                if converted:
+                    job.output_path = converted
+                    self.update_job(job, 1.0, "Already converted", f"✓ Already converted: {converted}", JOB_DONE)
+                    return False
+            
+            # Reuse an earlier download of the same video and format
+            if job.video_id:
+                cached = self.download_cache.lookup(job.video_id, download_format)
+                if cached:
+                    job.source_file, job.thumbnail, info = cached
+                    job.info = {**info, **job.info}
+                    job.cached = True
+                    job.metrics.cache_hit = True
+                    if job.normalize and not self.measure_loudness(job):
+                        return False
+                    self.update_job(job, 0.7, "Waiting for encoder...", "Using cached download, waiting for a free encoder...")
+                    handed_off = True
+                    return True
+            
+            # Check for yt-dlp, and for ffmpeg (used by yt-dlp for the thumbnail and by the encoder)
+            with job.metrics.stage("tools"):
+                ytdlp_cmd = shutil.which("yt-dlp")
+                ffmpeg_cmd = shutil.which("ffmpeg")
+            if not ytdlp_cmd:
+                self.fail_job(job, "yt-dlp not found. Please install it: pacman -S yt-dlp")
+                return False
+            
+            if not ffmpeg_cmd:
+                self.fail_job(job, "ffmpeg not found. Please install it: pacman -S ffmpeg")
+                return False
+            
+            if job.streaming:
+                # Nothing to resume when streaming; the temp dir only holds the info JSON
+                os.makedirs(WORK_ROOT, exist_ok=True)
+                job.temp_dir = tempfile.mkdtemp(dir=WORK_ROOT)
+                self.stream_job(job, ytdlp_cmd, ffmpeg_cmd)
+                return False
+            
+            # Working directory for this job, reused by a later retry of the same video
+            self.acquire_work_dir(job, download_format)
+            temp_video = os.path.join(job.temp_dir, "video.%(ext)s")
+            
+            # Update status
+            self.update_job(job, 0.1, "Downloading...", "Downloading video...")
+            
+            # Download the audio stream as-is; encoding happens in the encode pool
+            info_json = self.info_cache.lookup(job.video_id) if job.video_id else None
+            download_args = [
+                "-o", temp_video,
+                "--continue",
+                "--no-playlist",
+                "--write-info-json",
+                "--write-thumbnail",
+                "--convert-thumbnails", "jpg",
+                "-f", download_format
+            ] + PROGRESS_ARGS
+            
+            attempt = 0
+            restart = False
+            while True:
+                if attempt and not restart:
+                    delay = RETRY_BACKOFF * 2 ** (attempt - 1)
+                    self.update_job(job, None, f"Retrying in {delay:.0f}s...",
+                                    f"Download interrupted, retry {attempt} of {self.download_retries}...")
+                    job.cancel_event.wait(delay)
+                    if self.finish_cancelled(job):
+                        return False
+                
+                # yt-dlp continues the .part file left by an earlier attempt
+                job.metrics.download_attempts += 1
+                job.rebalance_requested = False
+                rate, fragments = self.bandwidth.acquire(job, self.scheduler.downloading)
+                self.rebalance_downloads()  # the others give up part of their share
+                job.log.write("youtube2mp3", ("Restarting download" if restart else f"Download attempt {attempt + 1}")
+                              + (f", {format_size(rate)}/s" if rate else "") + f", {fragments} fragments")
+                if info_json and not restart:
+                    job.log.write("youtube2mp3", "Using prefetched video info")
+                throughput = None
+                try:
+                    with job.metrics.stage("ytdlp"):
+                        process = self.start_process(
+                            job,
+                            [ytdlp_cmd] + self.source_args(job, info_json) + download_args
+                            + self.rate_args(rate, fragments),
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT,  # yt-dlp outputs progress to stderr, merge with stdout
+                            universal_newlines=True,
+                            cwd=job.temp_dir,
+                            bufsize=1
+                        )
+                        
+                        throughput = self.read_download_progress(job, process.stdout)
+                        process.wait()
+                finally:
+                    self.bandwidth.release(job, rate, fragments, throughput)
+                    self.rebalance_downloads()  # the others take up the freed share
+                job.metrics.exit_codes["yt-dlp"] = process.returncode
+                
+                if self.finish_cancelled(job):
+                    return False
+                
+                if process.returncode == 0:
+                    break
+                restart = job.rebalance_requested
+                if restart:
+                    # Stopped by rebalance_downloads; the info is already on disk
+                    local_info = os.path.join(job.temp_dir, "video.info.json")
+                    info_json = local_info if os.path.exists(local_info) else info_json
+                    continue
+                attempt += 1
+                if attempt > self.download_retries:
+                    break
+                if info_json:
+                    # The stream URLs in the prefetched info may have expired
+                    self.info_cache.discard(job.video_id)
+                    info_json = None
+                elif not is_retryable(job.log.tail(JOB_ERROR_LINES, "yt-dlp")):
+                    break
+            
+            if process.returncode != 0:
+                error_msg = '\n'.join(job.log.tail(5, "yt-dlp")) or "Download failed"
+                self.fail_job(job, f"Download failed: {error_msg}")
+                return False
+            
+            # Find downloaded file and thumbnail
+            for f in Path(job.temp_dir).glob("*"):
+                if not f.is_file():
+                    continue
+                if f.suffix in AUDIO_SUFFIXES and not job.source_file:
+                    job.source_file = str(f)
+                elif f.suffix == '.jpg':
+                    job.thumbnail = str(f)
+            
+            if not job.source_file:
+                self.fail_job(job, "Downloaded file not found")
+                return False
+            job.metrics.bytes_downloaded = os.path.getsize(job.source_file)
+            
+            info_path = os.path.join(job.temp_dir, "video.info.json")
+            self.measure_savings(job, info_path)
+            info = load_info(info_path)
+            job.info = {**info, **job.info}
+            if job.video_id and not info_json and info:
+                self.info_cache.store(job.video_id, info_path)  # for a later job in another format
+            
+            if job.video_id:
+                with job.metrics.stage("finalize"):
+                    job.source_file, job.thumbnail = self.download_cache.store(
+                        job.video_id, download_format, job.source_file, job.thumbnail, info
+                    )
+                job.cached = True
+            
+            if job.normalize and not self.measure_loudness(job):
+                return False
+            self.update_job(job, 0.7, "Waiting for encoder...", "Downloaded, waiting for a free encoder...")
+            handed_off = True
+            return True
+            
+        except Exception as e:
+            self.fail_job(job, f"Error: {str(e)}")
+            return False
+        finally:
+            if not handed_off:
+                self.cleanup_job(job)
+    
+    def measure_loudness(self, job):
+        """Set the job's normalization gain, measuring the source unless cached
+        
+        Runs in the download pool, so the analysis pass does not take an
+        encoder slot.  A failed measurement leaves the job unnormalized.
+        Returns False if the job was cancelled.
+        """
+        measurement = self.loudness_cache.get(job.video_id) if job.video_id else None
+        if measurement is None:
+            ffmpeg_cmd = shutil.which("ffmpeg")
+            if not ffmpeg_cmd:
+                return True  # the encode stage reports it
+            self.update_job(job, 0.7, "Measuring loudness...", "Measuring loudness...")
+            with job.metrics.stage("loudness"):
+                process = self.start_process(
+                    job,
+                    [ffmpeg_cmd, "-nostats", "-hide_banner", "-i", job.source_file] + measure_args(),
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.PIPE,
+                    universal_newlines=True,
+                    errors="replace"
+                )
+                lines = list(deque(process.stderr, maxlen=JOB_ERROR_LINES))
+                process.wait()
+            if self.finish_cancelled(job):
+                return False
+            measurement = parse_measurement(lines) if process.returncode == 0 else None
+            if measurement is None:
+                job.log.write("youtube2mp3", "Loudness measurement failed, not normalizing")
+                for line in lines:
+                    job.log.write("ffmpeg", line)
+                return True
+            if job.video_id:
+                self.loudness_cache.put(job.video_id, measurement)
+        job.loudness_gain = gain_for(measurement)
+        job.metrics.loudness_gain = job.loudness_gain
+        job.log.write("youtube2mp3", f"Loudness {measurement['input_i']:.1f} LUFS, peak "
+                      f"{measurement['input_tp']:.1f} dBTP, gain {job.loudness_gain or 0:+.2f} dB")
+        return True
+    
+    def stream_filter_args(self, job):
+        """ffmpeg normalization arguments for a streamed job
+        
+        A stream cannot be measured before it is encoded: without a cached
+        measurement it is normalized by loudnorm's dynamic mode instead.
+        """
+        if not job.normalize:
+            return []
+        measurement = self.loudness_cache.get(job.video_id) if job.video_id else None
+        if measurement is None:
+            job.log.write("youtube2mp3", "Loudness not measured yet, normalizing dynamically")
+            return ["-af", dynamic_filter(), "-ar", "48000"]
+        job.loudness_gain = job.metrics.loudness_gain = gain_for(measurement)
+        return ["-af", gain_filter(job.loudness_gain)] if job.loudness_gain is not None else []
+    
+    def measure_savings(self, job, info_path):
+        """Record how many bytes the job's quality preset kept from being downloaded
+        
+        Compares the download with the size of the stream the "best"
+        preset would have fetched, as listed in yt-dlp's info JSON.
+        """
+        baseline = format_selector(job.output_format, "best")
+        if job.download_format == baseline or not job.metrics.bytes_downloaded:
+            return
+        try:
+            with open(info_path, encoding="utf-8") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return
+        job.metrics.bytes_saved = bytes_saved(info, baseline, job.metrics.bytes_downloaded)
+        if job.metrics.bytes_saved:
+            job.log.write("youtube2mp3", f"{format_size(job.metrics.bytes_saved)} less downloaded than at best quality")
+    
+    def savings_note(self, job):
+        """Suffix for a finished job's message naming the bytes its quality preset saved"""
+        if not job.metrics.bytes_saved:
+            return ""
+        return f" ({format_size(job.metrics.bytes_saved)} less downloaded)"
+    
+    def source_args(self, job, info_json):
+        """yt-dlp arguments naming what to download: the URL, or prefetched info"""
+        if info_json:
+            return ["--load-info-json", info_json]
+        return [job.url]
+    
+    def rate_args(self, rate, fragments):
+        """yt-dlp options for a download share from BandwidthBudget.acquire"""
+        args = ["--concurrent-fragments", str(fragments)]
+        if rate:
+            args += ["--limit-rate", str(rate)]
+        return args
+    
+    def read_download_progress(self, job, stream):
+        """Update the job's progress from yt-dlp output until it ends
+        
+        Progress arrives as PROGRESS_ARGS template lines, parsed into
+        ProgressEvents.  All lines go to the job's log.  Returns the
+        average transfer rate in bytes/s, or None if it is unknown.
+        """
+        first = last = None  # (time, downloaded_bytes) of progress events
+        for line in iter(stream.readline, ''):
+            if not line:
+                break
+            event = parse_progress_line(line)
+            job.log.write("yt-dlp", line, progress=event is not None)
+            if event is None:
+                continue
+            job.progress = event
+            if event.downloaded_bytes is not None:
+                last = (time.monotonic(), event.downloaded_bytes)
+                first = first or last
+            if event.downloaded_bytes is not None and event.total_bytes:
+                fraction = 0.1 + min(1.0, event.downloaded_bytes / event.total_bytes) * 0.6
+            else:
+                fraction = None
+            self.update_job(job, fraction, format_progress(event))
+        if first and last[0] - first[0] >= 1.0 and last[1] > first[1]:
+            return (last[1] - first[1]) / (last[0] - first[0])
+        return None
+    
+    def stream_job(self, job, ytdlp_cmd, ffmpeg_cmd):
+        """Pipe yt-dlp straight into ffmpeg so encoding overlaps the download
+        
+        No audio is written to disk except the output file.  The audio only
+        passes through the OS pipe between the two processes, so memory use
+        stays bounded by the pipe buffer however long the video is.  Only the
+        small info JSON goes to the job's temp dir.
+        """
+        # Also lets auto-named jobs start before the title is known
+        staged_path = self.stage_output(job)
+        try:
+            self.run_stream(job, ytdlp_cmd, ffmpeg_cmd, staged_path)
+        finally:
+            self.remove_partial_output(staged_path)
+    
+    def run_stream(self, job, ytdlp_cmd, ffmpeg_cmd, output_path):
+        # stream_job without the staging file handling
+        self.update_job(job, 0.1, "Streaming...", "Downloading and converting...")
+        
+        info_json = self.info_cache.lookup(job.video_id) if job.video_id else None
+        rate, fragments = self.bandwidth.acquire(job, self.scheduler.downloading)
+        try:
+            download_process = self.start_process(
+                job,
+                [ytdlp_cmd] + self.source_args(job, info_json)
+                + ["-o", "-",
+                   "-o", "infojson:" + os.path.join(job.temp_dir, "video"),
+                   "--write-info-json",
+                   "--no-playlist",
+                   "-f", job.download_format] + PROGRESS_ARGS + self.rate_args(rate, fragments),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,  # progress goes to stderr when writing to stdout
+            )
+            convert_process = self.start_process(
+                job,
+                # The source codec is unknown until the stream arrives, so always encode
+                [ffmpeg_cmd, "-i", "pipe:0", "-vn"] + self.stream_filter_args(job)
+                + encoder_args(job.output_format, job.quality)
+                + (tag_padding_args(job) if OUTPUT_FORMATS[job.output_format]["id3_tags"] else [])
+                + ["-y", output_path],
+                stdin=download_process.stdout,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+            # Let yt-dlp get SIGPIPE if ffmpeg exits early
+            download_process.stdout.close()
+            
+            # Drain ffmpeg's stderr into the job log in the background
+            drain = threading.Thread(
+                target=lambda: [job.log.write("ffmpeg", line.decode(errors="replace"))
+                                for line in convert_process.stderr],
+                daemon=True
+            )
+            drain.start()
+            
+            job.metrics.download_attempts += 1
+            with job.metrics.stage("stream"):
+                progress = io.TextIOWrapper(download_process.stderr, errors="replace")
+                self.read_download_progress(job, progress)
+                download_process.wait()
+                convert_process.wait()
+                drain.join()
+        finally:
+            # The encoder may be what held the stream back, so its rate says little
+            self.bandwidth.release(job, rate, fragments, None)
+        job.metrics.exit_codes.update({"yt-dlp": download_process.returncode, "ffmpeg": convert_process.returncode})
+        if job.progress and job.progress.downloaded_bytes:
+            job.metrics.bytes_downloaded = int(job.progress.downloaded_bytes)
+        
+        if job.cancel_requested or download_process.returncode != 0 or convert_process.returncode != 0:
+            if self.finish_cancelled(job):
+                return
+            if info_json and download_process.returncode != 0:
+                self.info_cache.discard(job.video_id)  # extract afresh next time
+            if download_process.returncode != 0:
+                error_msg = '\n'.join(job.log.tail(5, "yt-dlp")) or "Download failed"
+                self.fail_job(job, f"Download failed: {error_msg}")
+            else:
+                self.fail_job(job, "Conversion failed: " + '\n'.join(job.log.tail(5, "ffmpeg")))
+            return
+        
+        info_path = os.path.join(job.temp_dir, "video.info.json")
+        self.measure_savings(job, info_path)
+        job.info = {**load_info(info_path), **job.info}
+        job.metrics.audio_seconds = job.info.get("duration")
+        if OUTPUT_FORMATS[job.output_format]["id3_tags"]:
+            with job.metrics.stage("tag"):
+                self.tag_output(job, output_path)
+        job.metrics.output_bytes = os.path.getsize(output_path)
+        output_path = self.finalize_output(job, output_path)
+        
+        self.update_job(job, 1.0, "Complete!", f"✓ Successfully converted! Saved to: {output_path}{self.savings_note(job)}", JOB_DONE)
+    
+    def run_ffmpeg(self, job, cmd, start, span, on_time=None):
+        """Run an ffmpeg command that has "-progress pipe:1" and wait for it
+        
+        The encoded fraction of the source duration moves the job's
+        progress from start to start + span, with the encode speed shown
+        as a multiple of realtime.  With on_time, it is called with the
+        seconds encoded so far instead.  Returns (returncode, last_error_lines).
+        """
+        process = self.start_process(
+            job, cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors="replace"
+        )
+        
+        # Drain stderr into the job log in the background
+        drain = threading.Thread(
+            target=lambda: [job.log.write("ffmpeg", line) for line in process.stderr],
+            daemon=True
+        )
+        drain.start()
+        
+        duration = job.duration or job.info.get("duration")
+        speed = ""
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            if key == "speed" and value != "N/A" and not on_time:
+                speed = value
+                job.metrics.encode_speed = parse_speed(value)
+            elif key in ("out_time_us", "out_time_ms") and duration:  # both are microseconds
+                try:
+                    done = min(1.0, int(value) / 1e6 / duration)
+                except ValueError:
+                    continue
+                if on_time:
+                    on_time(done * duration)
+                    continue
+                text = f"Converting... {done:.0%}" + (f" ({speed} realtime)" if speed else "")
+                self.update_job(job, start + done * span, text)
+        
+        process.wait()
+        drain.join()
+        return process.returncode, job.log.tail(5, "ffmpeg")
+    
+    def tag_output(self, job, path):
+        """Write the job's metadata and thumbnail into the MP3's ID3 tag
+        
+        Only the tag at the start of the file is written; the encoded
+        audio is left as ffmpeg wrote it.
+        """
+        cover = None
+        if job.thumbnail:
+            with open(job.thumbnail, "rb") as f:
+                cover = f.read()
+        if not write_tags(path, tags_from_info(job.info, job.url), cover):
+            job.log.write("youtube2mp3", "The tag did not fit in ffmpeg's padding; the file was written again")
+    
+    def resolve_output_path(self, job):
+        """Return the job's output path, naming it after the video if needed"""
+        if not job.output_path:
+            title = job.info.get("title") or job.video_id or f"job-{job.id}"
+            filename = sanitize_filename(title) + OUTPUT_FORMATS[job.output_format]["ext"]
+            job.output_path = os.path.join(job.output_dir, filename)
+        return job.output_path
+    
+    def stage_output(self, job):
+        """Create the file the job's output is written to before finalize_output
+        
+        It lives in STAGING_DIR_NAME inside the output folder, so it is on
+        the same filesystem as the final path.
+        """
+        staging_dir = os.path.join(job.output_dir, STAGING_DIR_NAME)
+        # Unique across processes sharing the folder; created with the
+        # usual umask permissions, unlike tempfile.mkstemp
+        path = os.path.join(staging_dir, f"{os.getpid()}-{job.id}{OUTPUT_FORMATS[job.output_format]['ext']}")
+        while True:
+            os.makedirs(staging_dir, exist_ok=True)
+            prune_staging_dir(staging_dir)
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+            except FileNotFoundError:
+                continue  # another job removed the empty directory just now
+            os.close(fd)
+            return path
+    
+    def finalize_output(self, job, staged_path):
+        """Atomically rename a finished staged file to the job's output path"""
+        output_path = self.resolve_output_path(job)
+        with job.metrics.stage("finalize"):
+            os.replace(staged_path, output_path)
+        self.remove_staging_dir(staged_path)
+        return output_path
+    
+    def remove_partial_output(self, staged_path):
+        """Delete a staged output file that was not finalized"""
+        try:
+            os.remove(staged_path)
+        except OSError:
+            pass
+        self.remove_staging_dir(staged_path)
+    
+    def remove_staging_dir(self, staged_path):
+        """Remove the staging directory once no job uses it any more"""
+        try:
+            os.rmdir(os.path.dirname(staged_path))
+        except OSError:
+            pass
+    
+    def encode_job(self, job):
+        """Produce the output file from the download (runs in an encode worker thread)
+        
+        The source is probed once and either remuxed (-c:a copy) or encoded
+        once into the output format; long sources going to MP3 are encoded
+        in parallel pieces (see encode_segments).  ffmpeg writes to a staged
+        file that is renamed to the output path when it is complete.
+        """
+        fmt = OUTPUT_FORMATS[job.output_format]
+        staged_path = None
+        try:
+            ffmpeg_cmd = shutil.which("ffmpeg")
+            if not ffmpeg_cmd:
+                self.fail_job(job, "ffmpeg not found. Please install it: pacman -S ffmpeg")
+                return
+            
+            if self.finish_cancelled(job):
+                return
+            
+            with job.metrics.stage("probe"):
+                source_codec, job.duration, sample_rate = probe_audio(job.source_file)
+            audio_filter = gain_filter(job.loudness_gain) if job.loudness_gain is not None else None
+            copy, audio_args = plan_conversion(source_codec, job.output_format, job.quality, bool(audio_filter))
+            job.metrics.copied = copy
+            job.metrics.audio_seconds = job.duration
+            if copy:
+                self.update_job(job, 0.7, "Copying...", f"Copying {source_codec} audio stream (no re-encode)...")
+            else:
+                self.update_job(job, 0.7, "Converting...", f"Converting to {fmt['name']}...")
+            
+            staged_path = self.stage_output(job)
+            segmented = (not copy and job.output_format == "mp3" and sample_rate and job.duration
+                         and self.segment_min_duration and job.duration > self.segment_min_duration
+                         and self.encode_segments(job, ffmpeg_cmd, sample_rate, staged_path))
+            if not segmented:
+                if self.finish_cancelled(job):
+                    return
+                
+                convert_cmd = [ffmpeg_cmd, "-nostats", "-progress", "pipe:1", "-i", job.source_file]
+                if job.thumbnail and fmt["cover_args"]:
+                    # Embed the thumbnail as front cover art
+                    convert_cmd += ["-i", job.thumbnail, "-map", "0:a", "-map", "1:v"] + fmt["cover_args"]
+                else:
+                    convert_cmd += ["-vn"]
+                if audio_filter:
+                    convert_cmd += ["-af", audio_filter]
+                if fmt["id3_tags"]:
+                    convert_cmd += tag_padding_args(job)
+                convert_cmd += audio_args + [
+                    "-y",  # Overwrite the (empty) staged file
+                    staged_path
+                ]
+                
+                with job.metrics.stage("ffmpeg"):
+                    returncode, errors = self.run_ffmpeg(job, convert_cmd, 0.7, 0.3)
+                job.metrics.exit_codes["ffmpeg"] = returncode
+                
+                if self.finish_cancelled(job):
+                    return
+                
+                if returncode != 0:
+                    self.fail_job(job, "Conversion failed: " + '\n'.join(errors))
+                    return
+            
+            if fmt["id3_tags"]:
+                with job.metrics.stage("tag"):
+                    self.tag_output(job, staged_path)
+            
+            # Success!
+            job.metrics.output_bytes = os.path.getsize(staged_path)
+            output_path = self.finalize_output(job, staged_path)
+            self.update_job(job, 1.0, "Complete!", f"✓ Successfully converted! Saved to: {output_path}{self.savings_note(job)}", JOB_DONE)
+            
+        except Exception as e:
+            self.fail_job(job, f"Error: {str(e)}")
+        finally:
+            if staged_path:
+                self.remove_partial_output(staged_path)
+            self.cleanup_job(job)
+    
+    def encode_segments(self, job, ffmpeg_cmd, sample_rate, staged_path):
+        """Encode the source to MP3 in parallel pieces joined into staged_path
+        
+        The source is cut on the MP3 frame grid (at chapter starts where
+        possible) into one piece per core left to this encode by the others
+        running, at most one per SEGMENT_LENGTH seconds, and the pieces are
+        joined gaplessly by youtube2mp3_segments.join_segments.  Returns
+        False when the job was cancelled or anything went wrong, so that the
+        caller can fall back to a single-pass encode.
+        """
+        # The encode workers share the cores; this job is one of scheduler.encoding
+        cores = max(1, (os.cpu_count() or 1) // max(1, self.scheduler.encoding))
+        count = min(cores, math.ceil(job.duration / SEGMENT_LENGTH))
+        segments = plan_segments(job.duration, sample_rate, count, job.info.get("chapters") or ())
+        if len(segments) < 2:
+            return False
+        bases = timestamp_bases(ffmpeg_cmd, job.source_file, segments, sample_rate)
+        if bases is None:
+            return False
+        fmt = OUTPUT_FORMATS["mp3"]
+        os.makedirs(WORK_ROOT, exist_ok=True)
+        segment_dir = tempfile.mkdtemp(dir=WORK_ROOT)
+        paths = [os.path.join(segment_dir, f"{index}.mp3") for index in range(len(segments))]
+        encoded = [0.0] * len(segments)
+        returncodes = [None] * len(segments)
+        
+        def on_time(index, seconds):
+            encoded[index] = seconds
+            done = min(1.0, sum(encoded) / job.duration)
+            self.update_job(job, 0.7 + 0.3 * done, f"Converting in {len(segments)} parts... {done:.0%}")
+        
+        def encode(index, segment):
+            input_args, audio_filter = segment_args(segment, sample_rate, bases[index])
+            if job.loudness_gain is not None:
+                audio_filter += "," + gain_filter(job.loudness_gain)
+            cmd = [ffmpeg_cmd, "-nostats", "-progress", "pipe:1"] + input_args + ["-i", job.source_file, "-vn"]
+            if index:
+                cmd += ["-map_metadata", "-1", "-id3v2_version", "0"]  # only the first piece's tag is kept
+            else:
+                cmd += tag_padding_args(job)
+            cmd += ["-af", audio_filter] + encoder_args("mp3", job.quality) + SEGMENT_ENCODE_ARGS
+            cmd += ["-ar", str(sample_rate), "-y", paths[index]]
+            returncode, _ = self.run_ffmpeg(job, cmd, 0.7, 0.3, functools.partial(on_time, index))
+            returncodes[index] = returncode
+            if returncode != 0:
+                # The result is discarded; do not wait for the other pieces
+                for process in list(job.processes):
+                    terminate_process(process)
+        
+        self.update_job(job, 0.7, "Converting...", f"Converting to {fmt['name']} in {len(segments)} parts...")
+        try:
+            start = time.monotonic()
+            with job.metrics.stage("segments"):
+                threads = [threading.Thread(target=encode, args=item, daemon=True) for item in enumerate(segments)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            job.metrics.exit_codes["ffmpeg"] = next((code for code in returncodes if code), 0)
+            if job.cancel_requested:
+                return False
+            if any(returncodes):
+                raise ValueError(f"ffmpeg exited with {job.metrics.exit_codes['ffmpeg']}")
+            job.metrics.encode_speed = round(job.duration / (time.monotonic() - start), 1)
+            
+            with job.metrics.stage("join"):
+                join_segments(segments, paths, staged_path)
+            _, duration, _ = probe_audio(staged_path)
+            if duration is not None and abs(duration - job.duration) > SEGMENT_DURATION_TOLERANCE:
+                raise ValueError(f"the joined file is {duration:.2f}s long, the source {job.duration:.2f}s")
+        except (OSError, ValueError) as e:
+            job.log.write("youtube2mp3", f"Encoding in parts failed, encoding in one pass: {e}")
+            self.update_job(job, 0.7, "Converting...", f"Converting to {fmt['name']}...")
+            return False
+        finally:
+            shutil.rmtree(segment_dir, ignore_errors=True)
+        job.metrics.segments = len(segments)
+        return True
+    
+    def acquire_work_dir(self, job, download_format):
+        """Give the job a working directory
+        
+        Jobs with a video ID get a persistent directory under WORK_ROOT,
+        keyed like the download cache, so a failed download can continue
+        where it stopped.  Other jobs (or a second job for a video already
+        being downloaded) get a throwaway directory, also under WORK_ROOT so
+        that moving the download into the cache stays a rename.
+        """
+        key = DownloadCache.key(job.video_id, download_format) if job.video_id else None
+        with self.work_dirs_lock:
+            if key and key not in self.work_dirs_in_use:
+                self.work_dirs_in_use.add(key)
+                job.work_key = key
+        if job.work_key:
+            job.temp_dir = os.path.join(WORK_ROOT, key)
+            os.makedirs(job.temp_dir, exist_ok=True)
+            os.utime(job.temp_dir)  # restarts the age limit
+        else:
+            os.makedirs(WORK_ROOT, exist_ok=True)
+            job.temp_dir = tempfile.mkdtemp(dir=WORK_ROOT)
+    
+    def cleanup_job(self, job):
+        """Remove the job's temp directory and unpin its cache entry
+        
+        A persistent working directory is kept after a failed job so the
+        next attempt can resume the download.
+        """
+        job.processes = []
+        job.log.close()
+        if job.cached:
+            self.download_cache.release(job.video_id, job.download_format)
+            job.cached = False
+        keep = job.work_key is not None and job.status == JOB_FAILED
+        if job.temp_dir and os.path.exists(job.temp_dir) and not keep:
+            try:
+                shutil.rmtree(job.temp_dir)
+            except:
+                pass
+        if job.work_key:
+            with self.work_dirs_lock:
+                self.work_dirs_in_use.discard(job.work_key)
+            job.work_key = None
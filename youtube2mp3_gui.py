@@ -0,0 +1,668 @@
+#!/usr/bin/env python3
+"""
+YouTube to MP3 Converter
+GTK4 user interface on top of the conversion engine in youtube2mp3_engine
+
+Only one instance runs at a time: launching the app again with URLs (from a
+shell, a browser's URL handler or a script) queues them in the running
+window, and the window also accepts URLs on the submission socket of
+youtube2mp3_ipc.
+"""
+
+import gi
+import os
+import sys
+import threading
+
+from youtube2mp3_engine import (
+    Engine, Job, OUTPUT_FORMATS, DEFAULT_OUTPUT_FORMAT, QUALITY_PRESETS, DEFAULT_QUALITY, format_selector,
+    DEFAULT_DOWNLOAD_WORKERS, DEFAULT_ENCODE_WORKERS, DEFAULT_PLAYLIST_JOBS, JOB_FAILED,
+    DEFAULT_NORMALIZE, is_playlist_url, create_playlist_jobs, format_size, extract_video_id, sanitize_filename,
+)
+from youtube2mp3_info import describe, format_duration
+from youtube2mp3_loudness import DEFAULT_LOUDNESS_TARGET
+from youtube2mp3_ipc import SubmissionServer
+from youtube2mp3_journal import Journal
+
+gi.require_version('Gtk', '4.0')
+
+# Try to import Adw (libadwaita), but make it optional
+try:
+    gi.require_version('Adw', '1')
+    from gi.repository import Adw
+    HAS_ADW = True
+except ValueError:
+    HAS_ADW = False
+    Adw = None
+
+from gi.repository import Gtk, GLib, Gio
+
+# Use Adw.ApplicationWindow if available, otherwise use Gtk.ApplicationWindow
+if HAS_ADW:
+    BaseWindow = Adw.ApplicationWindow
+    BaseApp = Adw.Application
+else:
+    BaseWindow = Gtk.ApplicationWindow
+    BaseApp = Gtk.Application
+
+# Job rows are redrawn at most this many times per second, however fast
+# the engine reports progress
+UI_FRAME_RATE = 10
+
+# Lines of a failed job's output shown in its message tooltip
+JOB_LOG_TOOLTIP_LINES = 20
+
+# Milliseconds the URL must stay unchanged before its video info is fetched
+PREFETCH_DELAY_MS = 500
+
+# Window icon, rendered from youtube2mp3.svg by create_icon.py.  GTK 4
+# finds icons by name, so its folder is added to the icon theme; without
+# the PNG the theme falls back to the SVG of the same name.
+ICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "youtube2mp3.png")
+
+
+class YouTube2MP3Window(BaseWindow):
+    def __init__(self, app):
+        super().__init__(application=app, title="YouTube to MP3 Converter")
+        self.set_default_size(600, 560)
+        
+        # Initialize variables
+        self.jobs = []
+        self.job_rows = {}
+        self.dirty_jobs = set()
+        self.dirty_lock = threading.Lock()
+        self.prefetch_source = None  # pending GLib timeout of a video info fetch
+        self.prefetched = None  # (url, describe() summary) of the URL in the entry
+        self.autofilled_name = None  # file name filled in from the video title
+        try:
+            self.journal = Journal()
+        except Exception as e:
+            print(f"Job history not available: {e}", file=sys.stderr)
+            self.journal = None
+        self.engine = Engine(on_update=self.mark_job_dirty, journal=self.journal)
+        GLib.timeout_add(1000 // UI_FRAME_RATE, self.flush_job_updates)
+        
+        # Create main box
+        main_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=12)
+        main_box.set_margin_start(20)
+        main_box.set_margin_end(20)
+        main_box.set_margin_top(20)
+        main_box.set_margin_bottom(20)
+        
+        # Use set_content for Adw, set_child for Gtk
+        if HAS_ADW:
+            self.set_content(main_box)
+        else:
+            self.set_child(main_box)
+        
+        # Header (use Gtk.HeaderBar if Adw is not available)
+        # For Adw, we can add header to content; for Gtk, we set it as titlebar
+        if HAS_ADW:
+            header = Adw.HeaderBar()
+            main_box.append(header)
+        else:
+            header = Gtk.HeaderBar()
+            self.set_titlebar(header)
+        
+        # Title
+        title_label = Gtk.Label()
+        title_label.set_markup("<span size='xx-large' weight='bold'>YouTube to MP3</span>")
+        title_label.set_halign(Gtk.Align.START)
+        main_box.append(title_label)
+        
+        # YouTube URL entry
+        url_frame = Gtk.Frame()
+        url_frame.set_label("YouTube URL")
+        url_frame.set_label_widget(Gtk.Label(label="YouTube URL"))
+        url_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        url_frame.set_child(url_box)
+        
+        self.url_entry = Gtk.Entry()
+        self.url_entry.set_placeholder_text("https://www.youtube.com/watch?v=...")
+        self.url_entry.set_hexpand(True)
+        self.url_entry.connect("changed", self.on_url_changed)
+        url_box.append(self.url_entry)
+        
+        # Title, duration and formats of the entered video, fetched in the background
+        self.video_info_label = Gtk.Label()
+        self.video_info_label.set_halign(Gtk.Align.START)
+        self.video_info_label.set_wrap(True)
+        self.video_info_label.add_css_class("dim-label")
+        url_box.append(self.video_info_label)
+        main_box.append(url_frame)
+        
+        # Folder selection
+        folder_frame = Gtk.Frame()
+        folder_frame.set_label("Save Folder")
+        folder_frame.set_label_widget(Gtk.Label(label="Save Folder"))
+        folder_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        folder_frame.set_child(folder_box)
+        
+        # Get default Downloads folder
+        default_folder = os.path.join(os.path.expanduser("~"), "Downloads")
+        if not os.path.exists(default_folder):
+            default_folder = os.path.expanduser("~")
+        
+        self.folder_entry = Gtk.Entry()
+        self.folder_entry.set_text(default_folder)
+        self.folder_entry.set_placeholder_text("Select folder to save MP3 file...")
+        self.folder_entry.set_hexpand(True)
+        folder_box.append(self.folder_entry)
+        
+        self.folder_button = Gtk.Button(label="Browse")
+        self.folder_button.connect("clicked", self.on_browse_folder_clicked)
+        folder_box.append(self.folder_button)
+        main_box.append(folder_frame)
+        
+        # Filename entry
+        filename_frame = Gtk.Frame()
+        filename_frame.set_label("File Name")
+        filename_frame.set_label_widget(Gtk.Label(label="File Name"))
+        filename_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        filename_frame.set_child(filename_box)
+        
+        self.filename_entry = Gtk.Entry()
+        self.filename_entry.set_placeholder_text("Enter filename without extension (leave empty to use the video title)")
+        self.filename_entry.set_hexpand(True)
+        filename_box.append(self.filename_entry)
+        main_box.append(filename_frame)
+        
+        # Output format
+        format_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        format_box.append(Gtk.Label(label="Format"))
+        self.format_keys = list(OUTPUT_FORMATS)
+        self.format_dropdown = Gtk.DropDown.new_from_strings(
+            [OUTPUT_FORMATS[key]["label"] for key in self.format_keys]
+        )
+        self.format_dropdown.set_selected(self.format_keys.index(DEFAULT_OUTPUT_FORMAT))
+        format_box.append(self.format_dropdown)
+        format_box.append(Gtk.Label(label="Quality"))
+        self.quality_keys = list(QUALITY_PRESETS)
+        self.quality_dropdown = Gtk.DropDown.new_from_strings(
+            [QUALITY_PRESETS[key]["label"] for key in self.quality_keys]
+        )
+        self.quality_dropdown.set_selected(self.quality_keys.index(DEFAULT_QUALITY))
+        self.quality_dropdown.set_tooltip_text("Lower presets download a smaller source stream")
+        format_box.append(self.quality_dropdown)
+        main_box.append(format_box)
+        
+        # Streaming mode: pipe yt-dlp straight into ffmpeg, no temp file
+        self.streaming_check = Gtk.CheckButton(label="Stream while downloading (no temporary file)")
+        main_box.append(self.streaming_check)
+        
+        # Loudness normalization, measured once per video
+        self.normalize_check = Gtk.CheckButton(label="Normalize loudness")
+        self.normalize_check.set_active(DEFAULT_NORMALIZE)
+        self.normalize_check.set_tooltip_text(f"Bring every file to {DEFAULT_LOUDNESS_TARGET:g} LUFS")
+        main_box.append(self.normalize_check)
+        
+        # Skip videos the job history says are already in the folder
+        self.skip_converted_check = Gtk.CheckButton(label="Skip videos already converted to this folder")
+        self.skip_converted_check.set_sensitive(self.journal is not None)
+        self.skip_converted_check.connect(
+            "toggled", lambda check: setattr(self.engine, "skip_converted", check.get_active())
+        )
+        main_box.append(self.skip_converted_check)
+        
+        # Playlist / channel mode
+        playlist_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        self.playlist_check = Gtk.CheckButton(label="Playlist or channel: download every video,")
+        playlist_box.append(self.playlist_check)
+        self.playlist_jobs_spin = Gtk.SpinButton.new_with_range(1, 16, 1)
+        self.playlist_jobs_spin.set_value(DEFAULT_PLAYLIST_JOBS)
+        playlist_box.append(self.playlist_jobs_spin)
+        playlist_box.append(Gtk.Label(label="at a time"))
+        main_box.append(playlist_box)
+        
+        # Status label
+        self.status_label = Gtk.Label()
+        self.status_label.set_halign(Gtk.Align.START)
+        self.status_label.set_wrap(True)
+        main_box.append(self.status_label)
+        
+        # Download button and pool sizes
+        button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        
+        button_box.append(Gtk.Label(label="Downloads"))
+        self.download_workers_spin = Gtk.SpinButton.new_with_range(1, 16, 1)
+        self.download_workers_spin.set_value(DEFAULT_DOWNLOAD_WORKERS)
+        self.download_workers_spin.connect("value-changed", self.on_download_workers_changed)
+        button_box.append(self.download_workers_spin)
+        
+        button_box.append(Gtk.Label(label="Encoders"))
+        self.encode_workers_spin = Gtk.SpinButton.new_with_range(1, max(16, DEFAULT_ENCODE_WORKERS), 1)
+        self.encode_workers_spin.set_value(DEFAULT_ENCODE_WORKERS)
+        self.encode_workers_spin.connect("value-changed", self.on_encode_workers_changed)
+        button_box.append(self.encode_workers_spin)
+        
+        button_box.append(Gtk.Label(label="MiB/s"))
+        self.bandwidth_spin = Gtk.SpinButton.new_with_range(0, 1000, 0.5)
+        self.bandwidth_spin.set_digits(1)
+        self.bandwidth_spin.set_value(self.engine.bandwidth.limit / 1024 ** 2)
+        self.bandwidth_spin.set_tooltip_text("Total download rate shared by all downloads (0: no limit)")
+        self.bandwidth_spin.connect("value-changed", self.on_bandwidth_limit_changed)
+        button_box.append(self.bandwidth_spin)
+        
+        self.download_button = Gtk.Button(label="Download & Convert")
+        self.download_button.add_css_class("suggested-action")
+        self.download_button.set_hexpand(True)
+        self.download_button.connect("clicked", self.on_download_clicked)
+        button_box.append(self.download_button)
+        main_box.append(button_box)
+        
+        # Job list (queued, running and finished jobs)
+        jobs_frame = Gtk.Frame()
+        jobs_frame.set_label_widget(Gtk.Label(label="Jobs"))
+        jobs_scroll = Gtk.ScrolledWindow()
+        jobs_scroll.set_vexpand(True)
+        jobs_scroll.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
+        self.jobs_list = Gtk.ListBox()
+        self.jobs_list.set_selection_mode(Gtk.SelectionMode.NONE)
+        jobs_scroll.set_child(self.jobs_list)
+        jobs_frame.set_child(jobs_scroll)
+        main_box.append(jobs_frame)
+        
+        # Scheduler queue depths and utilization
+        self.stats_label = Gtk.Label()
+        self.stats_label.set_halign(Gtk.Align.START)
+        self.stats_label.add_css_class("dim-label")
+        main_box.append(self.stats_label)
+        self.refresh_stats()
+        GLib.timeout_add_seconds(1, self.refresh_stats)
+        
+        self.resume_interrupted_jobs()
+        
+    def resume_interrupted_jobs(self):
+        """Queue the jobs a crashed or closed instance did not finish"""
+        if not self.journal:
+            return
+        try:
+            jobs = self.journal.claim_interrupted()
+        except Exception as e:
+            print(f"Could not read the job history: {e}", file=sys.stderr)
+            return
+        for job in jobs:
+            self.add_job(job)
+        if jobs:
+            self.status_label.set_text(f"Resumed {len(jobs)} interrupted job(s)")
+    
+    def on_url_changed(self, entry):
+        """Fetch the video's info once the URL has stopped changing for a moment"""
+        if self.prefetch_source:
+            GLib.source_remove(self.prefetch_source)
+            self.prefetch_source = None
+        self.prefetched = None
+        self.video_info_label.set_text("")
+        url = entry.get_text().strip()
+        if extract_video_id(url) and not is_playlist_url(url):
+            self.prefetch_source = GLib.timeout_add(PREFETCH_DELAY_MS, self.prefetch_video_info, url)
+    
+    def prefetch_video_info(self, url):
+        """Start fetching a video's info off the main loop"""
+        self.prefetch_source = None
+        self.video_info_label.set_text("Looking up video...")
+        download_format = format_selector(self.format_keys[self.format_dropdown.get_selected()], self.quality)
+        threading.Thread(target=self.fetch_video_info, args=(url, download_format), daemon=True).start()
+        return False
+    
+    def fetch_video_info(self, url, download_format):
+        """Fetch a video's info into the engine's info cache (runs in a background thread)"""
+        try:
+            info = self.engine.info_cache.fetch(url, extract_video_id(url))
+            GLib.idle_add(self.show_video_info, url, describe(info, download_format), None)
+        except Exception as e:
+            GLib.idle_add(self.show_video_info, url, None, str(e))
+    
+    def show_video_info(self, url, summary, error):
+        """Show fetched video info and fill in the file name"""
+        if url != self.url_entry.get_text().strip():
+            return False  # the URL was changed while fetching
+        if error:
+            self.video_info_label.set_text(f"Could not look up video: {error}")
+            return False
+        self.prefetched = (url, summary)
+        parts = [summary["title"]]
+        if summary["duration"]:
+            parts.append(format_duration(summary["duration"]))
+        if summary["formats"]:
+            parts.append(", ".join(summary["formats"][:3]))
+        if summary["size"]:
+            parts.append(f"~{format_size(summary['size'])} to download")
+        self.video_info_label.set_text("  ·  ".join(parts))
+        # Only replace a name the user has not typed themselves
+        filename = self.filename_entry.get_text().strip()
+        if not filename or filename == self.autofilled_name:
+            self.autofilled_name = sanitize_filename(summary["title"])
+            self.filename_entry.set_text(self.autofilled_name)
+        return False
+    
+    @property
+    def quality(self):
+        """Key of the selected quality preset"""
+        return self.quality_keys[self.quality_dropdown.get_selected()]
+    
+    def on_browse_folder_clicked(self, button):
+        """Open folder selection dialog"""
+        dialog = Gtk.FileDialog(title="Select Folder", modal=True)
+        dialog.set_accept_label("Select")
+        
+        # Set initial folder if one is already selected
+        current_folder = self.folder_entry.get_text().strip()
+        if current_folder and os.path.exists(current_folder):
+            try:
+                initial_file = Gio.File.new_for_path(current_folder)
+                dialog.set_initial_folder(initial_file)
+            except:
+                pass
+        
+        dialog.select_folder(self, None, self.on_folder_dialog_response)
+    
+    def on_folder_dialog_response(self, dialog, result):
+        """Handle folder dialog response"""
+        try:
+            file = dialog.select_folder_finish(result)
+            if file:
+                folder_path = file.get_path()
+                self.folder_entry.set_text(folder_path)
+        except Exception as e:
+            print(f"Error selecting folder: {e}")
+    
+    def on_download_workers_changed(self, spin):
+        """Apply a new concurrent download limit"""
+        self.engine.scheduler.set_download_workers(spin.get_value_as_int())
+    
+    def on_encode_workers_changed(self, spin):
+        """Apply a new concurrent encode limit"""
+        self.engine.scheduler.set_encode_workers(spin.get_value_as_int())
+    
+    def on_bandwidth_limit_changed(self, spin):
+        """Apply a new total download rate to the downloads started from now on"""
+        self.engine.set_bandwidth_limit(int(spin.get_value() * 1024 ** 2))
+    
+    def refresh_stats(self):
+        """Show scheduler queue depths and pool utilization"""
+        stats = self.engine.stats()
+        self.stats_label.set_text(
+            f"Download: {stats['downloading']} active, {stats['download_queued']} queued, "
+            f"{stats['download_utilization']:.0%} busy  ·  "
+            f"Encode: {stats['encoding']} active, {stats['handoff_queued']} waiting, "
+            f"{stats['encode_utilization']:.0%} busy  ·  "
+            f"Cache: {stats['cache_hits']} hits, {stats['cache_misses']} misses"
+            + (f"  ·  Bandwidth: {format_size(stats['bandwidth_allocated'])}/s of "
+               f"{format_size(stats['bandwidth_limit'])}/s in use" if stats["bandwidth_limit"] else "")
+        )
+        return True
+    
+    def on_download_clicked(self, button):
+        """Queue a download and conversion job"""
+        url = self.url_entry.get_text().strip()
+        folder_path = self.folder_entry.get_text().strip()
+        filename = self.filename_entry.get_text().strip()
+        
+        # Validate inputs
+        if not url:
+            self.show_error("Please enter a YouTube URL")
+            return
+        
+        if not folder_path:
+            self.show_error("Please select a save folder")
+            return
+        
+        if not os.path.exists(folder_path):
+            self.show_error("Selected folder does not exist")
+            return
+        
+        output_format = self.format_keys[self.format_dropdown.get_selected()]
+        
+        if self.playlist_check.get_active() or is_playlist_url(url):
+            self.start_playlist(url, folder_path, output_format, self.streaming_check.get_active(), self.quality,
+                                self.normalize_check.get_active())
+            self.url_entry.set_text("")
+            self.clear_error()
+            self.status_label.set_text("Fetching playlist...")
+            return
+        
+        if filename == self.autofilled_name:
+            filename = ""  # named after the title anyway; keeps skip-converted working
+        job = Job(url, folder_path, filename or None, output_format,
+                  streaming=self.streaming_check.get_active(), quality=self.quality,
+                  normalize=self.normalize_check.get_active())
+        if self.prefetched and self.prefetched[0] == url:
+            job.info["title"] = self.prefetched[1]["title"]
+        
+        for other in self.jobs:
+            if job.output_path and not other.is_finished and other.output_path == job.output_path:
+                self.show_error("A job is already writing to this file")
+                return
+        
+        self.add_job(job)
+        
+        # Clear inputs so the next URL can be queued right away
+        self.url_entry.set_text("")
+        self.filename_entry.set_text("")
+        self.autofilled_name = None
+        self.clear_error()
+        self.status_label.set_text(f"Queued: {job.display_name}")
+    
+    def add_job(self, job):
+        """Add a job to the list and queue it"""
+        self.jobs.append(job)
+        self.add_job_row(job)
+        self.engine.submit(job)
+    
+    def start_playlist(self, url, folder_path, output_format, streaming, quality, normalize):
+        """Expand a playlist off the main loop; entries are named after their titles"""
+        threading.Thread(
+            target=self.expand_playlist,
+            args=(url, folder_path, output_format, streaming, self.playlist_jobs_spin.get_value_as_int(), quality,
+                  normalize),
+            daemon=True
+        ).start()
+    
+    def queue_urls(self, urls, folder_path=None, output_format=None, streaming=None):
+        """Queue URLs that came from outside the window
+        
+        They arrive from the command line, the desktop or the submission
+        socket.  Files are named after the video title; unset options use
+        the window's current settings.
+        """
+        folder_path = folder_path or self.folder_entry.get_text().strip()
+        output_format = output_format or self.format_keys[self.format_dropdown.get_selected()]
+        if streaming is None:
+            streaming = self.streaming_check.get_active()
+        if not os.path.isdir(folder_path):
+            self.show_error(f"Save folder does not exist: {folder_path}")
+            return False
+        
+        for url in urls:
+            if is_playlist_url(url):
+                self.start_playlist(url, folder_path, output_format, streaming, self.quality,
+                                    self.normalize_check.get_active())
+            else:
+                self.add_job(Job(url, folder_path, output_format=output_format, streaming=streaming,
+                                 quality=self.quality, normalize=self.normalize_check.get_active()))
+        self.clear_error()
+        self.status_label.set_text(f"Queued {len(urls)} URL(s)")
+        return False
+    
+    def expand_playlist(self, url, folder_path, output_format, streaming, max_active, quality, normalize):
+        """Fetch a playlist's entries (runs in a background thread)"""
+        try:
+            group, jobs, skipped = create_playlist_jobs(url, folder_path, output_format, streaming, max_active,
+                                                        quality, normalize)
+        except Exception as e:
+            GLib.idle_add(self.show_error, f"Could not read playlist: {e}")
+            return
+        GLib.idle_add(self.add_playlist_jobs, group, jobs, skipped)
+    
+    def add_playlist_jobs(self, group, jobs, skipped):
+        """Queue the jobs of an expanded playlist"""
+        for job in jobs:
+            self.add_job(job)
+        self.status_label.set_text(f"{group.title}: {len(jobs)} queued, {skipped} already in folder")
+        return False
+    
+    def on_cancel_clicked(self, button, job):
+        """Cancel a job; child processes are stopped off the main loop"""
+        button.set_sensitive(False)
+        threading.Thread(target=self.engine.cancel, args=(job,), daemon=True).start()
+    
+    def add_job_row(self, job):
+        """Add a row showing the job's file name, progress and status"""
+        row_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=4)
+        row_box.set_margin_start(6)
+        row_box.set_margin_end(6)
+        row_box.set_margin_top(6)
+        row_box.set_margin_bottom(6)
+        
+        name_label = Gtk.Label()
+        name_label.set_halign(Gtk.Align.START)
+        row_box.append(name_label)
+        
+        progress_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        progress_bar = Gtk.ProgressBar()
+        progress_bar.set_show_text(True)
+        progress_bar.set_hexpand(True)
+        progress_bar.set_valign(Gtk.Align.CENTER)
+        progress_box.append(progress_bar)
+        cancel_button = Gtk.Button(label="Cancel")
+        cancel_button.connect("clicked", self.on_cancel_clicked, job)
+        progress_box.append(cancel_button)
+        row_box.append(progress_box)
+        
+        message_label = Gtk.Label()
+        message_label.set_halign(Gtk.Align.START)
+        message_label.set_wrap(True)
+        row_box.append(message_label)
+        
+        self.jobs_list.append(row_box)
+        self.job_rows[job.id] = (name_label, progress_bar, message_label, cancel_button)
+        self.refresh_job_row(job)
+    
+    def mark_job_dirty(self, job):
+        """Note that a job changed (called from worker threads)
+        
+        Rows are redrawn by flush_job_updates on a fixed timer instead of
+        one main-loop callback per progress line.
+        """
+        with self.dirty_lock:
+            self.dirty_jobs.add(job)
+    
+    def flush_job_updates(self):
+        """Redraw the rows of jobs that changed since the last frame"""
+        with self.dirty_lock:
+            jobs, self.dirty_jobs = self.dirty_jobs, set()
+        for job in jobs:
+            self.refresh_job_row(job)
+        return True
+    
+    def refresh_job_row(self, job):
+        """Show the job's current state in its row (main thread only)"""
+        name_label, progress_bar, message_label, cancel_button = self.job_rows[job.id]
+        name_label.set_text(job.display_name)
+        progress_bar.set_fraction(job.fraction)
+        progress_bar.set_text(job.progress_text)
+        message_label.set_text(job.message)
+        if job.status == JOB_FAILED:
+            message_label.add_css_class("error")
+            message_label.set_tooltip_text("\n".join(job.log.tail(JOB_LOG_TOOLTIP_LINES)))
+        if job.is_finished or job.cancel_requested:
+            cancel_button.set_sensitive(False)
+    
+    def show_error(self, message):
+        """Show error message"""
+        self.status_label.set_text(f"✗ {message}")
+        self.status_label.add_css_class("error")
+    
+    def clear_error(self):
+        """Remove error styling from the status label"""
+        self.status_label.remove_css_class("error")
+
+
+class YouTube2MP3App(BaseApp):
+    def __init__(self):
+        super().__init__(application_id="com.youtube2mp3.app",
+                         flags=Gio.ApplicationFlags.HANDLES_COMMAND_LINE | Gio.ApplicationFlags.HANDLES_OPEN)
+        self.win = None
+        self.submission_server = None
+        self.connect("activate", self.on_activate)
+        # Both are delivered to the primary instance when the app is already running
+        self.connect("command-line", self.on_command_line)
+        self.connect("open", self.on_open)
+        self.connect("shutdown", self.on_shutdown)
+    
+    def get_window(self):
+        """Return the main window, creating it on first use"""
+        if self.win is None:
+            self.win = YouTube2MP3Window(self)
+            icon_theme = Gtk.IconTheme.get_for_display(self.win.get_display())
+            icon_theme.add_search_path(os.path.dirname(ICON_PATH))
+            Gtk.Window.set_default_icon_name(os.path.splitext(os.path.basename(ICON_PATH))[0])
+            self.submission_server = SubmissionServer(self.handle_submission)
+            try:
+                self.submission_server.start()
+            except OSError as e:
+                print(f"Submission socket not available: {e}", file=sys.stderr)
+        return self.win
+    
+    def on_activate(self, app):
+        self.get_window().present()
+    
+    def on_command_line(self, app, command_line):
+        """Queue the URLs of "youtube2mp3 URL...", also from a second launch"""
+        urls = [arg for arg in command_line.get_arguments()[1:] if not arg.startswith("-")]
+        win = self.get_window()
+        if urls:
+            win.queue_urls(urls)
+        win.present()
+        return 0
+    
+    def on_open(self, app, files, n_files, hint):
+        """Queue URLs the desktop asked us to open"""
+        win = self.get_window()
+        win.queue_urls([f.get_uri() for f in files])
+        win.present()
+    
+    def on_shutdown(self, app):
+        if self.submission_server:
+            self.submission_server.stop()
+        if self.win and self.win.journal:
+            # Unfinished jobs stay in the journal and are resumed next time
+            self.win.journal.close()
+    
+    def handle_submission(self, request):
+        """Answer a submission socket request (called in a server thread)"""
+        command = request.get("command", "submit")
+        if command == "status":
+            return {
+                "jobs": [
+                    {"id": job.id, "url": job.url, "status": job.status, "fraction": job.fraction,
+                     "message": job.message, "output": job.output_path}
+                    for job in list(self.win.jobs)
+                ],
+                "stats": self.win.engine.stats(),
+            }
+        if command != "submit":
+            return {"error": f"Unknown command: {command}"}
+        
+        urls = request.get("urls")
+        if not urls or not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+            return {"error": "\"urls\" must be a non-empty list of strings"}
+        output_dir = request.get("output_dir")
+        if output_dir and not os.path.isdir(output_dir):
+            return {"error": f"Folder does not exist: {output_dir}"}
+        output_format = request.get("format")
+        if output_format and output_format not in OUTPUT_FORMATS:
+            return {"error": f"Unknown format: {output_format} (choose from {', '.join(OUTPUT_FORMATS)})"}
+        GLib.idle_add(self.win.queue_urls, urls, output_dir, output_format, request.get("streaming"))
+        return {"queued": len(urls)}
+
+
+def main(argv=None):
+    app = YouTube2MP3App()
+    return app.run(sys.argv if argv is None else argv)
+
+
+if __name__ == "__main__":
+    main()
+
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+YouTube to MP3 Converter - video metadata cache
+Keeps each video's yt-dlp info JSON on disk, keyed by video ID, so it is
+extracted from YouTube only once
+
+The window fetches the info as soon as a URL is pasted, to show the
+title, duration and audio formats and to fill in the file name before
+anything is downloaded.  The download step then hands the cached file to
+yt-dlp with --load-info-json instead of letting it extract the page
+again.  The stream URLs inside the JSON are signed and expire (after
+about six hours on YouTube), so entries are only used for INFO_TTL
+seconds.
+"""
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+# Seconds a fetched info JSON is used for; must stay below the lifetime of
+# the stream URLs it contains
+INFO_TTL = float(os.environ.get("YOUTUBE2MP3_INFO_TTL_MINUTES", "60")) * 60
+
+# Seconds to wait for yt-dlp to extract a video's info
+FETCH_TIMEOUT = 60
+
+# One alternative of a yt-dlp format selector ("bestaudio[ext=m4a]") and
+# its filters ("[abr>=?128]": a "?" also accepts formats without the field)
+SELECTOR_RE = re.compile(r'^(bestaudio|worstaudio|best|worst)((?:\[[^\]]+\])*)$')
+FILTER_RE = re.compile(r'\[(\w+)\s*(<=|>=|!=|=|<|>)(\??)\s*([^\]]+)\]')
+
+
+def is_audio_only(fmt):
+    return fmt.get("acodec") not in (None, "none") and fmt.get("vcodec") == "none"
+
+
+def _matches(fmt, key, op, optional, value):
+    actual = fmt.get(key)
+    if actual is None:
+        return bool(optional)
+    if op in ("=", "!="):
+        return (str(actual) == value) == (op == "=")
+    try:
+        actual, value = float(actual), float(value)
+    except (TypeError, ValueError):
+        return False
+    return {"<": actual < value, "<=": actual <= value, ">": actual > value, ">=": actual >= value}[op]
+
+
+def select_format(info, selector):
+    """Return the format dict yt-dlp would pick for a selector, or None
+
+    Understands the subset of yt-dlp's syntax the engine uses: "/"
+    separated alternatives of best/worst/bestaudio/worstaudio with field
+    filters.  yt-dlp lists formats from worst to best, so that order is
+    the quality ranking.
+    """
+    formats = info.get("formats") or [info]
+    for alternative in selector.split("/"):
+        match = SELECTOR_RE.match(alternative.strip())
+        if not match:
+            continue
+        kind, filters = match.groups()
+        candidates = [
+            fmt for fmt in formats
+            if (is_audio_only(fmt) if kind.endswith("audio") else fmt.get("acodec") != "none")
+            and all(_matches(fmt, *condition) for condition in FILTER_RE.findall(filters))
+        ]
+        if candidates:
+            return candidates[-1] if kind.startswith("best") else candidates[0]
+    return None
+
+
+def estimate_size(fmt, duration=None):
+    """Return a format's size in bytes, estimated from its bitrate if unknown"""
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if size:
+        return int(size)
+    bitrate = fmt.get("abr") or fmt.get("tbr")  # kbit/s
+    if bitrate and duration:
+        return int(bitrate * 1000 / 8 * duration)
+    return None
+
+
+def bytes_saved(info, baseline_format, downloaded):
+    """Return how much smaller a download was than the stream baseline_format picks
+
+    None when the size of that stream is unknown.
+    """
+    baseline = select_format(info, baseline_format)
+    size = baseline and estimate_size(baseline, info.get("duration"))
+    if not size:
+        return None
+    return max(0, size - int(downloaded))
+
+
+def format_duration(seconds):
+    """Format seconds as m:ss or h:mm:ss"""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def describe(info, download_format):
+    """Summarize an info JSON for display
+
+    Returns a dict with "title", "duration" (seconds or None), "formats"
+    (the audio-only formats as "ext codec bitrate" strings, best first)
+    and "size", the estimated download size for download_format.
+    """
+    duration = info.get("duration")
+    formats = []
+    for fmt in reversed(info.get("formats") or []):
+        if not is_audio_only(fmt):
+            continue
+        abr = f" {fmt['abr']:.0f}k" if fmt.get("abr") else ""
+        formats.append(f"{fmt.get('ext', '?')} {fmt['acodec'].split('.')[0]}{abr}")
+    chosen = select_format(info, download_format)
+    return {
+        "title": info.get("title") or info.get("id"),
+        "duration": duration,
+        "formats": formats,
+        "size": estimate_size(chosen, duration) if chosen else None,
+    }
+
+
+class InfoCache:
+    """On-disk cache of yt-dlp info JSON files with a time-to-live
+
+    Files are named <video ID>.info.json under `root`; an entry is fresh
+    for `ttl` seconds after it was fetched.  Expired files are removed
+    when the cache is opened.
+    """
+
+    def __init__(self, root, ttl=INFO_TTL):
+        self.root = root
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.fetch_locks = {}  # video ID -> lock held while fetching it
+        os.makedirs(root, exist_ok=True)
+        self.prune()
+
+    def path(self, video_id):
+        return os.path.join(self.root, f"{video_id}.info.json")
+
+    def _fresh_path(self, video_id):
+        path = self.path(video_id)
+        try:
+            if time.time() - os.path.getmtime(path) < self.ttl:
+                return path
+        except OSError:
+            pass
+        return None
+
+    def lookup(self, video_id):
+        """Return the path of a fresh info JSON for --load-info-json, or None"""
+        path = self._fresh_path(video_id)
+        with self.lock:
+            if path:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return path
+
+    def load(self, video_id):
+        """Return a fresh entry's info dict, or None"""
+        path = self.lookup(video_id)
+        if not path:
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def fetch(self, url, video_id):
+        """Return the info of a video, extracting it with yt-dlp unless cached
+
+        Runs yt-dlp, so call it off the main loop.  Concurrent fetches of
+        the same video wait for the first one.  Raises RuntimeError when
+        yt-dlp fails.
+        """
+        with self.lock:
+            fetch_lock = self.fetch_locks.setdefault(video_id, threading.Lock())
+        with fetch_lock:
+            info = self.load(video_id)
+            if info is not None:
+                return info
+            ytdlp_cmd = shutil.which("yt-dlp")
+            if not ytdlp_cmd:
+                raise RuntimeError("yt-dlp not found. Please install it: pacman -S yt-dlp")
+            try:
+                result = subprocess.run(
+                    [ytdlp_cmd, "-J", "--no-playlist", url],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    timeout=FETCH_TIMEOUT
+                )
+            except subprocess.TimeoutExpired:
+                raise RuntimeError("yt-dlp did not answer in time")
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "yt-dlp failed")
+            info = json.loads(result.stdout)
+            self._write(video_id, lambda f: f.write(result.stdout))
+            return info
+
+    def store(self, video_id, source_path):
+        """Copy an info JSON that yt-dlp wrote (--write-info-json) into the cache"""
+        with open(source_path, encoding="utf-8") as source:
+            self._write(video_id, lambda f: shutil.copyfileobj(source, f))
+
+    def _write(self, video_id, write):
+        # Write to a temporary file first so readers never see half a file
+        path = self.path(video_id)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def discard(self, video_id):
+        """Drop an entry, e.g. when its stream URLs no longer work"""
+        try:
+            os.remove(self.path(video_id))
+        except OSError:
+            pass
+
+    def prune(self):
+        """Remove expired entries and leftover temporary files"""
+        cutoff = time.time() - self.ttl
+        for entry in os.scandir(self.root):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+YouTube to MP3 Converter - job submission socket
+Lets scripts and later launches hand URLs to the running app
+
+The app listens on a Unix socket (SOCKET_PATH) while its window is open.
+Each request is one JSON object on its own line and gets one JSON line
+back; a connection may send any number of requests:
+
+    {"urls": ["https://youtu.be/..."], "output_dir": "/music", "format": "opus", "streaming": false}
+        -> {"queued": 1}
+    {"command": "status"}
+        -> {"jobs": [{"id": 1, "url": ..., "status": "running", ...}], "stats": {...}}
+
+Everything except "urls" is optional and defaults to the window's current
+settings.  Errors are answered with {"error": "..."}.  From a shell:
+
+    python youtube2mp3.py --submit [-o DIR] [-f FORMAT] [URL... | -i FILE]
+
+This module only uses the standard library so a launch that merely
+forwards URLs never loads GTK.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+
+# Seconds a client waits for the app to answer
+CLIENT_TIMEOUT = 5
+
+
+def runtime_dir():
+    """Return a directory only the current user can access"""
+    path = os.environ.get("XDG_RUNTIME_DIR")
+    if path and os.path.isdir(path):
+        return path
+    path = os.path.join(tempfile.gettempdir(), f"youtube2mp3-{os.getuid()}")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if os.stat(path).st_uid != os.getuid():
+        raise PermissionError(f"{path} belongs to another user")
+    return path
+
+
+def default_socket_path():
+    if not hasattr(socket, "AF_UNIX") or not hasattr(os, "getuid"):
+        return None  # e.g. native Windows: single-instance forwarding still works through GApplication
+    return os.path.join(runtime_dir(), "youtube2mp3.sock")
+
+
+class SubmissionServer:
+    """Unix socket server answering JSON-line requests
+
+    ``handler(request)`` is called in a server thread with each decoded
+    request and returns the response dict.
+    """
+
+    def __init__(self, handler, path=None):
+        self.handler = handler
+        self.path = path or default_socket_path()
+        self.sock = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        """Listen in a background thread; returns False if that is not possible"""
+        if self.path is None:
+            return False
+        if os.path.exists(self.path):
+            if is_server_running(self.path):
+                return False
+            os.unlink(self.path)  # left behind by an instance that crashed
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.sock.listen()
+        threading.Thread(target=self._accept, daemon=True).start()
+        return True
+
+    def stop(self):
+        """Stop listening and remove the socket file"""
+        if self.sock is None:
+            return
+        self.stopped.set()
+        self.sock.close()
+        self.sock = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def _accept(self):
+        while not self.stopped.is_set():
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn, conn.makefile("rw", encoding="utf-8") as stream:
+            for line in stream:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                    response = self.handler(request)
+                except Exception as e:
+                    response = {"error": str(e)}
+                stream.write(json.dumps(response) + "\n")
+                stream.flush()
+
+
+def is_server_running(path=None):
+    """Return True when an app is listening on the socket"""
+    path = path or default_socket_path()
+    if path is None:
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+def send_request(request, path=None, timeout=CLIENT_TIMEOUT):
+    """Send one request to the running app and return its response
+
+    Raises OSError when no app is listening.
+    """
+    path = path or default_socket_path()
+    if path is None:
+        raise OSError("Unix sockets are not available on this platform")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        with sock.makefile("rw", encoding="utf-8") as stream:
+            stream.write(json.dumps(request) + "\n")
+            stream.flush()
+            line = stream.readline()
+    if not line:
+        raise OSError("The app closed the connection")
+    return json.loads(line)
+
+
+def submit(urls, output_dir=None, output_format=None, streaming=None, path=None):
+    """Queue URLs in the running app; returns the response dict"""
+    request = {"urls": list(urls)}
+    if output_dir:
+        request["output_dir"] = os.path.abspath(output_dir)
+    if output_format:
+        request["format"] = output_format
+    if streaming is not None:
+        request["streaming"] = streaming
+    return send_request(request, path)
+
+
+def read_urls(stream):
+    """Return the URLs in a text stream, skipping blank and comment lines"""
+    urls = []
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            urls.append(line)
+    return urls
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="youtube2mp3 --submit",
+        description="Queue URLs in the running YouTube to MP3 window."
+    )
+    parser.add_argument("urls", nargs="*", metavar="URL")
+    parser.add_argument("-i", "--input", metavar="FILE",
+                        help="read URLs one per line from FILE (- for standard input)")
+    parser.add_argument("-o", "--output-dir", help="folder to save files in (default: the window's)")
+    parser.add_argument("-f", "--format", help="output format (default: the window's)")
+    parser.add_argument("--stream", action="store_true", default=None,
+                        help="pipe downloads straight into the encoder")
+    parser.add_argument("--status", action="store_true", help="print the app's jobs as JSON")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    urls = list(args.urls)
+    if args.input and not args.status:
+        if args.input == "-":
+            urls += read_urls(sys.stdin)
+        else:
+            try:
+                with open(args.input) as f:
+                    urls += read_urls(f)
+            except OSError as e:
+                print(e, file=sys.stderr)
+                return 1
+    if not urls and not args.status:
+        print("No URLs given", file=sys.stderr)
+        return 2
+
+    try:
+        if args.status:
+            print(json.dumps(send_request({"command": "status"}), indent=2))
+            return 0
+        response = submit(urls, args.output_dir, args.format, args.stream)
+    except OSError as e:
+        print(f"YouTube to MP3 is not running: {e}", file=sys.stderr)
+        return 1
+
+    if "error" in response:
+        print(response["error"], file=sys.stderr)
+        return 1
+    print(f"Queued {response['queued']} URL(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+YouTube to MP3 Converter - per-job log capture
+Keeps the output of a job's yt-dlp and ffmpeg processes in a fixed-size
+ring buffer, optionally also streamed to a gzip-compressed file
+
+Progress lines are collapsed: consecutive progress updates replace each
+other in the buffer, and the file only gets one every
+PROGRESS_LOG_INTERVAL seconds plus the last one before other output.  A
+job's memory use therefore stays constant however long it runs.
+"""
+
+import gzip
+import os
+import threading
+import time
+from collections import deque
+
+# Lines kept in memory per job
+JOB_LOG_LINES = 200
+
+# Seconds between progress lines written to a log file
+PROGRESS_LOG_INTERVAL = 10
+
+
+class JobLog:
+    """Bounded capture of a job's process output
+
+    Lines are stored as (source, text, is_progress).  With a path, all
+    lines (progress collapsed) also go to a gzip file, opened on the
+    first write.
+    """
+
+    def __init__(self, maxlen=JOB_LOG_LINES, path=None):
+        self.lines = deque(maxlen=maxlen)
+        self.path = path
+        self.file = None
+        self.pending_progress = None  # progress line not yet written to the file
+        self.last_progress_write = 0.0
+        self.lock = threading.Lock()
+
+    def write(self, source, text, progress=False):
+        """Add a line of output from `source` ("yt-dlp", "ffmpeg", ...)"""
+        text = text.rstrip()
+        if not text:
+            return
+        entry = (source, text, progress)
+        with self.lock:
+            if progress and self.lines and self.lines[-1][2] and self.lines[-1][0] == source:
+                self.lines[-1] = entry
+            else:
+                self.lines.append(entry)
+            if self.path:
+                self._write_file(entry)
+
+    def _write_file(self, entry):
+        # Called with self.lock held
+        source, text, progress = entry
+        now = time.monotonic()
+        if progress:
+            if now - self.last_progress_write < PROGRESS_LOG_INTERVAL:
+                self.pending_progress = entry
+                return
+            self.last_progress_write = now
+        elif self.pending_progress:
+            self._append(self.pending_progress)
+        self.pending_progress = None
+        self._append(entry)
+
+    def _append(self, entry):
+        # Called with self.lock held
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.file = gzip.open(self.path, "at", encoding="utf-8")
+        self.file.write(f"{time.strftime('%H:%M:%S')} [{entry[0]}] {entry[1]}\n")
+
+    def tail(self, count=5, source=None):
+        """Return the last `count` non-progress lines, optionally of one source"""
+        with self.lock:
+            entries = list(self.lines)
+        texts = [text for entry_source, text, progress in entries
+                 if not progress and (source is None or entry_source == source)]
+        return texts[-count:]
+
+    def close(self):
+        """Flush and close the log file"""
+        with self.lock:
+            if self.pending_progress and self.path:
+                self._append(self.pending_progress)
+                self.pending_progress = None
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def prune_logs(root, max_age):
+    """Remove job log files older than max_age seconds"""
+    if not os.path.isdir(root):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
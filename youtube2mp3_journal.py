@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+YouTube to MP3 Converter - job journal
+SQLite history of every job, used to resume interrupted jobs and to skip
+videos that were already converted
+
+Each process using the journal registers a run and keeps its heartbeat
+fresh.  Jobs that were queued or running in a run that stopped without
+finishing them (crash, killed process, window closed mid-batch) are
+handed back by claim_interrupted().  Job updates are collected in memory
+and written by a background thread in one transaction per
+JOURNAL_FLUSH_INTERVAL, so progress ticks never cost an fsync each.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+from youtube2mp3_engine import (
+    Job, JobGroup, JOB_QUEUED, JOB_RUNNING, JOB_DONE, DEFAULT_PLAYLIST_JOBS, QUALITY_PRESETS,
+    process_alive,
+)
+
+# History is state, not cache: it lives in XDG_STATE_HOME
+STATE_ROOT = os.path.join(
+    os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state"),
+    "youtube2mp3"
+)
+JOURNAL_PATH = os.environ.get("YOUTUBE2MP3_JOURNAL", os.path.join(STATE_ROOT, "journal.sqlite3"))
+
+# Seconds between batched writes, and between heartbeats of a live run
+JOURNAL_FLUSH_INTERVAL = 1.0
+HEARTBEAT_INTERVAL = 30
+# A run whose heartbeat is older than this is considered dead
+RUN_TIMEOUT = 3 * HEARTBEAT_INTERVAL
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    host TEXT NOT NULL,
+    started REAL NOT NULL,
+    heartbeat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    uid TEXT PRIMARY KEY,
+    run INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    video_id TEXT,
+    output_dir TEXT NOT NULL,
+    filename TEXT,
+    output_path TEXT,
+    output_format TEXT NOT NULL,
+    streaming INTEGER NOT NULL,
+    quality TEXT NOT NULL,
+    normalize INTEGER NOT NULL,
+    title TEXT,
+    playlist_title TEXT,
+    playlist_index INTEGER,
+    status TEXT NOT NULL,
+    stage TEXT,
+    message TEXT,
+    timings TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_converted ON jobs (video_id, output_dir, output_format, status);
+CREATE INDEX IF NOT EXISTS jobs_run_status ON jobs (run, status);
+CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated);
+CREATE INDEX IF NOT EXISTS jobs_output ON jobs (output_path);
+"""
+
+UPSERT = """
+INSERT INTO jobs (uid, run, url, video_id, output_dir, filename, output_path, output_format, streaming,
+                  quality, normalize, title, playlist_title, playlist_index, status, stage, message, timings,
+                  created, updated)
+VALUES (:uid, :run, :url, :video_id, :output_dir, :filename, :output_path, :output_format, :streaming,
+        :quality, :normalize, :title, :playlist_title, :playlist_index, :status, :stage, :message, :timings,
+        :updated, :updated)
+ON CONFLICT (uid) DO UPDATE SET
+    run = excluded.run, video_id = excluded.video_id, output_path = excluded.output_path,
+    title = excluded.title, status = excluded.status, stage = excluded.stage,
+    message = excluded.message, timings = excluded.timings, updated = excluded.updated
+"""
+
+UNFINISHED = (JOB_QUEUED, JOB_RUNNING)
+
+
+class Journal:
+    """SQLite journal of jobs, shared by every running instance
+
+    ``update(job)`` is cheap and may be called from any thread on every
+    change; the row is written on the next flush.
+    """
+
+    def __init__(self, path=JOURNAL_PATH, flush_interval=JOURNAL_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.host = socket.gethostname()
+        self.lock = threading.Lock()  # guards the connection
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.stopped = threading.Event()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        # WAL lets the GUI and the command line share the file; NORMAL
+        # syncs at checkpoints instead of on every commit
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+            now = time.time()
+            self.run_id = self.conn.execute(
+                "INSERT INTO runs (pid, host, started, heartbeat) VALUES (?, ?, ?, ?)",
+                (os.getpid(), self.host, now, now)
+            ).lastrowid
+        self.last_heartbeat = time.monotonic()
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def update(self, job):
+        """Note that a job changed; it is written on the next flush"""
+        with self.pending_lock:
+            self.pending[job.uid] = job
+
+    def flush(self):
+        """Write all pending job changes in one transaction"""
+        with self.pending_lock:
+            jobs, self.pending = list(self.pending.values()), {}
+        if not jobs:
+            return
+        now = time.time()
+        rows = [self._row(job, now) for job in jobs]
+        with self.lock, self.conn:
+            self.conn.executemany(UPSERT, rows)
+
+    def _row(self, job, now):
+        stage = job.metrics.current_stage
+        return {
+            "uid": job.uid,
+            "run": self.run_id,
+            "url": job.url,
+            "video_id": job.video_id,
+            "output_dir": os.path.abspath(job.output_dir),
+            "filename": job.filename,
+            "output_path": job.output_path and os.path.abspath(job.output_path),
+            "output_format": job.output_format,
+            "streaming": int(job.streaming),
+            "quality": job.quality,
+            "normalize": int(job.normalize),
+            "title": job.info.get("title"),
+            "playlist_title": job.info.get("playlist_title"),
+            "playlist_index": job.info.get("playlist_index"),
+            "status": job.status,
+            "stage": stage[0] if stage else None,
+            "message": job.message,
+            "timings": json.dumps({name: round(seconds, 4) for name, seconds in dict(job.metrics.stages).items()}),
+            "updated": now,
+        }
+
+    def _write_loop(self):
+        while not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.monotonic() - self.last_heartbeat >= HEARTBEAT_INTERVAL:
+                    self._heartbeat(time.time())
+            except sqlite3.Error as e:
+                print(f"Journal write failed: {e}", file=sys.stderr)
+
+    def _heartbeat(self, value):
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE runs SET heartbeat = ? WHERE id = ?", (value, self.run_id))
+        self.last_heartbeat = time.monotonic()
+
+    def close(self):
+        """Write pending changes and end the run
+
+        Jobs that are still unfinished become claimable right away.
+        """
+        self.stopped.set()
+        self.writer.join()
+        self.flush()
+        self._heartbeat(0)
+        with self.lock:
+            self.conn.close()
+
+    def find_converted(self, video_id, output_dir, output_format):
+        """Return the path of an existing earlier conversion, or None"""
+        if not video_id:
+            return None
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT output_path FROM jobs WHERE video_id = ? AND output_dir = ? AND output_format = ?"
+                " AND status = ? ORDER BY updated DESC",
+                (video_id, os.path.abspath(output_dir), output_format, JOB_DONE)
+            ).fetchall()
+        for row in rows:
+            if row["output_path"] and os.path.exists(row["output_path"]):
+                return row["output_path"]
+        return None
+
+    def find_output(self, path):
+        """Return the newest finished job that wrote `path`, as a dict, or None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM jobs WHERE output_path = ? AND status = ? ORDER BY updated DESC LIMIT 1",
+                (os.path.abspath(path), JOB_DONE)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def claim_interrupted(self):
+        """Take over the unfinished jobs of dead runs and return them as new Jobs
+
+        Jobs keep their uid, so their history row is continued.  Entries
+        of the same playlist share a new JobGroup.
+        """
+        cutoff = time.time() - RUN_TIMEOUT
+        self.flush()
+        with self.lock, self.conn:
+            dead = [
+                row["id"] for row in self.conn.execute(
+                    "SELECT id, pid, host, heartbeat FROM runs WHERE id != ?", (self.run_id,)
+                )
+                if row["heartbeat"] < cutoff or (row["host"] == self.host and not process_alive(row["pid"]))
+            ]
+            rows = []
+            for run in dead:
+                for row in self.conn.execute(
+                    f"SELECT * FROM jobs WHERE run = ? AND status IN ({', '.join('?' * len(UNFINISHED))})"
+                    " ORDER BY created",
+                    (run,) + UNFINISHED
+                ).fetchall():
+                    # Another instance may be claiming the same run
+                    claimed = self.conn.execute(
+                        "UPDATE jobs SET run = ? WHERE uid = ? AND run = ?", (self.run_id, row["uid"], run)
+                    ).rowcount
+                    if claimed:
+                        rows.append(row)
+                self.conn.execute("DELETE FROM runs WHERE id = ?", (run,))
+
+        groups = {}
+        jobs = []
+        for row in rows:
+            group = None
+            if row["playlist_title"]:
+                group = groups.setdefault(row["playlist_title"],
+                                          JobGroup(row["playlist_title"], DEFAULT_PLAYLIST_JOBS))
+            job = Job(row["url"], row["output_dir"], row["filename"], row["output_format"],
+                      bool(row["streaming"]), group, uid=row["uid"],
+                      quality=row["quality"] if row["quality"] in QUALITY_PRESETS else "best",
+                      normalize=bool(row["normalize"]))
+            job.video_id = job.video_id or row["video_id"]
+            job.info = {key: row[key] for key in ("title", "playlist_title", "playlist_index")
+                        if row[key] is not None}
+            jobs.append(job)
+        return jobs
+
+    def history(self, limit=20):
+        """Return the most recently updated jobs as dicts, newest first"""
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM jobs ORDER BY updated DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
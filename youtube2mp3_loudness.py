@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+YouTube to MP3 Converter - loudness normalization
+Measures a source's EBU R128 loudness once and turns the measurement into
+a fixed gain for the encoder
+
+The measurement is ffmpeg's loudnorm filter in analysis mode, run over
+the downloaded source.  Normalizing is then a plain volume filter: the
+gain that brings the integrated loudness to the target, lowered if
+needed so the true peak stays below its limit.  That is what loudnorm's
+linear mode does, without its resampling to 192 kHz and without its
+fallback to dynamic compression, so it also works piece by piece in a
+segmented encode.  Measurements are cached by video ID; a later
+conversion of the same video encodes in a single pass.
+"""
+
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Target integrated loudness (LUFS), true peak (dBTP) and loudness range
+# (LU, only used by the dynamic mode)
+DEFAULT_LOUDNESS_TARGET = float(os.environ.get("YOUTUBE2MP3_LOUDNESS_TARGET", "-16"))
+TRUE_PEAK_LIMIT = -1.5
+LOUDNESS_RANGE = 11
+
+# Measurements kept in the cache; the oldest are dropped beyond this
+LOUDNESS_CACHE_ENTRIES = 10000
+
+MEASUREMENT_KEYS = ("input_i", "input_tp", "input_lra", "input_thresh")
+
+LOUDNESS_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    video_id TEXT PRIMARY KEY,
+    input_i REAL NOT NULL,
+    input_tp REAL NOT NULL,
+    input_lra REAL NOT NULL,
+    input_thresh REAL NOT NULL,
+    measured REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS measurements_measured ON measurements (measured);
+"""
+
+
+def measure_args(target=DEFAULT_LOUDNESS_TARGET):
+    """ffmpeg arguments that analyse the input's loudness and write no output"""
+    return ["-vn", "-af", f"loudnorm=I={target}:TP={TRUE_PEAK_LIMIT}:LRA={LOUDNESS_RANGE}:print_format=json",
+            "-f", "null", "-"]
+
+
+def parse_measurement(lines):
+    """Return the loudnorm analysis in ffmpeg's output as a dict of floats, or None"""
+    text = "\n".join(lines)
+    start, end = text.rfind("{"), text.rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        values = json.loads(text[start:end + 1])
+        return {key: float(values[key]) for key in MEASUREMENT_KEYS}
+    except (ValueError, KeyError):
+        return None
+
+
+def gain_for(measurement, target=DEFAULT_LOUDNESS_TARGET):
+    """Return the gain in dB that normalizes a measured source, or None for silence"""
+    loudness, peak = measurement["input_i"], measurement["input_tp"]
+    if loudness == float("-inf") or loudness < -70:
+        return None  # below loudnorm's gate: nothing to normalize
+    return min(target - loudness, TRUE_PEAK_LIMIT - peak)
+
+
+def gain_filter(gain):
+    """ffmpeg audio filter applying a gain from gain_for"""
+    return f"volume={gain:.2f}dB"
+
+
+def dynamic_filter(target=DEFAULT_LOUDNESS_TARGET):
+    """Single-pass loudnorm for sources that cannot be measured first (streams)
+
+    Its output is 192 kHz, so the encoder needs an explicit sample rate.
+    """
+    return f"loudnorm=I={target}:TP={TRUE_PEAK_LIMIT}:LRA={LOUDNESS_RANGE}"
+
+
+class LoudnessCache:
+    """Loudness measurements by video ID, kept in an SQLite database
+    
+    The window and the command line may share the database; every write is
+    its own transaction, so neither loses the other's measurements.
+    """
+
+    def __init__(self, path, max_entries=LOUDNESS_CACHE_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()  # guards the connection
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(LOUDNESS_CACHE_SCHEMA)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, as in DownloadCache
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def get(self, video_id):
+        """Return the measurement of a video, or None"""
+        with self.lock:
+            row = self.conn.execute(f"SELECT {', '.join(MEASUREMENT_KEYS)} FROM measurements WHERE video_id = ?",
+                                    (video_id,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(zip(MEASUREMENT_KEYS, row))
+
+    def put(self, video_id, measurement):
+        with self.lock, self._transaction():
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO measurements (video_id, {', '.join(MEASUREMENT_KEYS)}, measured)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (video_id, *(measurement[key] for key in MEASUREMENT_KEYS), time.time())
+            )
+            self.conn.execute(
+                "DELETE FROM measurements WHERE video_id NOT IN"
+                " (SELECT video_id FROM measurements ORDER BY measured DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM measurements").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+YouTube to MP3 Converter - job metrics
+Per-stage timings of each job, a JSON-lines log of finished jobs, a
+Prometheus-style text endpoint and an optional per-job profiler.
+"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# The log is rotated to <path>.1 when it grows past this size
+METRICS_LOG_MAX_BYTES = 10 * 1024 * 1024
+
+# Values accepted for Job.profile
+PROFILE_MODES = ("cpu", "memory")
+
+# Lines of allocation statistics written by the memory profiler
+TRACEMALLOC_TOP = 25
+
+_tracemalloc_users = 0
+_tracemalloc_lock = threading.Lock()
+
+# cProfile allows one active profiler per process (enforced since 3.12)
+_cprofile_lock = threading.Lock()
+
+
+class JobMetrics:
+    """Timings, byte counts and exit codes of one job
+
+    Stage durations are measured with time.monotonic and accumulate when a
+    stage runs more than once.  "download" and "encode" are the scheduler
+    stages; the others are parts of them ("tools", "ytdlp", "stream",
+    "finalize" and "loudness" in download, "probe", "ffmpeg" or "segments"
+    and "join", "tag" and "finalize" in encode) or the time spent waiting
+    before them ("queue", "handoff").
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.submitted = time.monotonic()
+        self.stage_ended = None  # monotonic time the last scheduler stage ended
+        self.current_stage = None  # (name, start) of the running scheduler stage
+        self.stages = {}
+        self.download_attempts = 0
+        self.bytes_downloaded = 0
+        self.bytes_saved = None  # less than a "best" quality download, when known
+        self.output_bytes = 0
+        self.audio_seconds = None
+        self.encode_speed = None  # multiple of realtime reported by ffmpeg
+        self.cache_hit = False
+        self.copied = False
+        self.segments = 0  # pieces encoded in parallel, 0 for a single pass
+        self.loudness_gain = None  # dB applied to normalize loudness
+        self.exit_codes = {}
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def begin_stage(self, name):
+        """Start a scheduler stage, counting the wait since the previous one"""
+        now = time.monotonic()
+        self.add("queue" if self.stage_ended is None else "handoff",
+                 now - (self.stage_ended or self.submitted))
+        self.current_stage = (name, now)
+
+    def end_stage(self):
+        """End the running scheduler stage, if any"""
+        if self.current_stage:
+            name, start = self.current_stage
+            self.stage_ended = time.monotonic()
+            self.add(name, self.stage_ended - start)
+            self.current_stage = None
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as stage `name`"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - start)
+
+    def as_dict(self):
+        return {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(self.started)),
+            "total_seconds": round(time.monotonic() - self.submitted, 4),
+            "stages": {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            "download_attempts": self.download_attempts,
+            "bytes_downloaded": self.bytes_downloaded,
+            "bytes_saved": self.bytes_saved,
+            "output_bytes": self.output_bytes,
+            "audio_seconds": self.audio_seconds,
+            "encode_speed": self.encode_speed,
+            "cache_hit": self.cache_hit,
+            "copied": self.copied,
+            "segments": self.segments,
+            "loudness_gain": self.loudness_gain,
+            "exit_codes": self.exit_codes,
+        }
+
+
+def parse_speed(value):
+    """Turn ffmpeg's "12.3x" speed into a float, or None"""
+    try:
+        return float(value.strip().rstrip("x"))
+    except ValueError:
+        return None
+
+
+class MetricsLog:
+    """Collects the metrics of finished jobs
+
+    Each job becomes one JSON line in `path` (None keeps nothing on disk),
+    and running totals are kept for render().
+    """
+
+    def __init__(self, path=None, max_bytes=METRICS_LOG_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.jobs = Counter()
+        self.stage_seconds = defaultdict(float)
+        self.stage_count = Counter()
+        self.bytes_downloaded = 0
+        self.bytes_saved = 0
+        self.output_bytes = 0
+        self.audio_seconds = 0.0
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def record(self, job):
+        """Add a finished job"""
+        record = {
+            "job": job.id,
+            "url": job.url,
+            "video_id": job.video_id,
+            "format": job.output_format,
+            "quality": job.quality,
+            "streaming": job.streaming,
+            "status": job.status,
+            "message": job.message,
+            "output": job.output_path,
+        }
+        record.update(job.metrics.as_dict())
+        with self.lock:
+            self.jobs[job.status] += 1
+            for name, seconds in job.metrics.stages.items():
+                self.stage_seconds[name] += seconds
+                self.stage_count[name] += 1
+            self.bytes_downloaded += job.metrics.bytes_downloaded
+            self.bytes_saved += job.metrics.bytes_saved or 0
+            self.output_bytes += job.metrics.output_bytes
+            self.audio_seconds += job.metrics.audio_seconds or 0.0
+            if self.path:
+                self._append(json.dumps(record, ensure_ascii=False))
+        return record
+
+    def _append(self, line):
+        # Called with self.lock held
+        try:
+            if os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+        except OSError:
+            pass
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def render(self, gauges=None):
+        """Return the totals in the Prometheus text exposition format
+
+        `gauges` adds current values such as Engine.stats(); non-numeric
+        entries are skipped.
+        """
+        lines = []
+        with self.lock:
+            lines += ["# HELP youtube2mp3_jobs_total Finished jobs by final status.",
+                      "# TYPE youtube2mp3_jobs_total counter"]
+            lines += [f'youtube2mp3_jobs_total{{status="{status}"}} {count}'
+                      for status, count in sorted(self.jobs.items())]
+            lines += ["# HELP youtube2mp3_stage_seconds Time spent in each job stage.",
+                      "# TYPE youtube2mp3_stage_seconds summary"]
+            for name in sorted(self.stage_seconds):
+                lines.append(f'youtube2mp3_stage_seconds_sum{{stage="{name}"}} {self.stage_seconds[name]:.6f}')
+                lines.append(f'youtube2mp3_stage_seconds_count{{stage="{name}"}} {self.stage_count[name]}')
+            for name, value, text in (
+                ("downloaded_bytes_total", self.bytes_downloaded, "Bytes downloaded by yt-dlp."),
+                ("saved_bytes_total", self.bytes_saved, "Bytes quality presets kept from being downloaded."),
+                ("output_bytes_total", self.output_bytes, "Bytes of finished output files."),
+                ("audio_seconds_total", self.audio_seconds, "Seconds of audio converted."),
+            ):
+                lines += [f"# HELP youtube2mp3_{name} {text}",
+                          f"# TYPE youtube2mp3_{name} counter",
+                          f"youtube2mp3_{name} {value}"]
+        for key, value in sorted((gauges or {}).items()):
+            if isinstance(value, (int, float)):
+                lines += [f"# TYPE youtube2mp3_{key} gauge", f"youtube2mp3_{key} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(port, render, host="127.0.0.1"):
+    """Serve render() as text on http://host:port/metrics in a daemon thread
+
+    Returns the server; call its shutdown() to stop it.
+    """
+    import http.server  # only needed when serving
+    
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@contextmanager
+def profiled(job, stage, directory):
+    """Profile the enclosed block if job.profile asks for it
+
+    "cpu" runs cProfile in the current thread and writes
+    job-<id>-<stage>.prof (open it with pstats or snakeviz).  Since Python
+    3.12 only one profiler can be active per process, so a stage that
+    starts while another is being profiled runs unprofiled (noted in the
+    job log).  "memory" traces allocations with tracemalloc and writes the
+    top allocation sites to job-<id>-<stage>.txt; tracemalloc is
+    process-wide, so the report includes allocations of jobs running at
+    the same time.
+    """
+    global _tracemalloc_users
+    if job.profile not in PROFILE_MODES:
+        yield
+        return
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"job-{job.id}-{stage}")
+    if job.profile == "cpu":
+        import cProfile
+        profiler = cProfile.Profile()
+        if not _cprofile_lock.acquire(blocking=False):
+            job.log.write("youtube2mp3", f"Not profiling {stage}: another stage is being profiled")
+            yield
+            return
+        try:
+            try:
+                profiler.enable()
+            except ValueError as e:  # another profiling tool is active
+                job.log.write("youtube2mp3", f"Not profiling {stage}: {e}")
+                profiler = None
+            try:
+                yield
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                    profiler.dump_stats(path + ".prof")
+        finally:
+            _cprofile_lock.release()
+        return
+
+    with _tracemalloc_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracemalloc_users += 1
+    try:
+        yield
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        with _tracemalloc_lock:
+            _tracemalloc_users -= 1
+            if not _tracemalloc_users:
+                tracemalloc.stop()
+        with open(path + ".txt", "w") as f:
+            f.write(f"current {current} bytes, peak {peak} bytes\n")
+            for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]:
+                f.write(f"{stat}\n")
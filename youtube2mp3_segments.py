@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+YouTube to MP3 Converter - segmented MP3 encoding
+Cuts long sources into pieces that can be encoded in parallel and joins
+the encoded pieces into one gapless MP3
+
+Cut points lie on the MP3 frame grid, so frame k of a piece that starts
+at a cut is exactly the frame a single-pass encode would produce there.
+Pieces are cut from the decoded audio by timestamp (-copyts with atrim)
+rather than with -ss alone, which is only as exact as the container's
+timestamps; see timestamp_bases.
+Every piece after the first starts SEGMENT_PREROLL_FRAMES early (its
+first frames are dropped once the encoder has settled) and runs
+SEGMENT_POSTROLL_FRAMES past its end, and pieces are encoded without the
+bit reservoir so that no kept frame refers to data in a dropped one.
+The joined file takes the first piece's ID3 tag and a rewritten
+Xing/LAME header frame whose frame count, seek table and gapless
+padding describe the whole file.
+"""
+
+import os
+import re
+import subprocess
+from collections import namedtuple
+
+# Frames encoded before a piece's first kept frame and after its last
+SEGMENT_PREROLL_FRAMES = 8
+SEGMENT_POSTROLL_FRAMES = 4
+
+# Extra ffmpeg output options for encoding a piece
+SEGMENT_ENCODE_ARGS = ["-reservoir", "0"]
+
+# Seconds a piece's input seek lands before its start; the exact cut is
+# made by atrim and the decoder settles in between
+SEEK_MARGIN = 1.0
+
+# Cut points move to a chapter start this close to them, as a fraction of
+# the piece length, so that joins fall on natural breaks
+CHAPTER_SNAP = 0.25
+
+BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+# A piece to encode: input samples [start, end) (end None for the rest of
+# the source), of which the frames [skip, skip + keep) are kept (keep None
+# for all remaining frames)
+Segment = namedtuple("Segment", "start end skip keep")
+
+FrameHeader = namedtuple("FrameHeader", "size samples sample_rate side_info")
+
+
+def samples_per_frame(sample_rate):
+    """Samples in one Layer III frame at the given sample rate"""
+    return 1152 if sample_rate >= 32000 else 576
+
+
+def decoded_frames(ffmpeg_cmd, path, seek=None, count=3):
+    """(pts, samples) of the first decoded audio frames, as filters see them with -copyts"""
+    cmd = [ffmpeg_cmd, "-hide_banner", "-nostats", "-copyts"]
+    if seek:
+        cmd += ["-ss", f"{seek:.6f}"]
+    cmd += ["-i", path, "-map", "0:a:0", "-af", "ashowinfo", "-frames:a", str(count), "-f", "null", "-"]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors="replace")
+    return [(int(pts), int(samples))
+            for pts, samples in re.findall(r"\bn:\d+ pts:(-?\d+) .*?nb_samples:(\d+)", result.stderr)]
+
+
+def seek_time(segment, sample_rate):
+    """Where the input of a piece is seeked to, in seconds (0 for no seek)"""
+    return max(0.0, segment.start / sample_rate - SEEK_MARGIN) if segment.start else 0.0
+
+
+def timestamp_bases(ffmpeg_cmd, path, segments, sample_rate):
+    """Timestamp of sample 0 of the source in each piece's decode, or None
+
+    Container timestamps are not always sample-exact (WebM counts
+    milliseconds), so a decode that starts with a seek can number its
+    samples slightly differently from one that starts at the beginning.
+    The difference is measured at each piece's seek point from the frame
+    grid of both decodes; sources with frames of varying length give None.
+    """
+    frames = decoded_frames(ffmpeg_cmd, path)
+    if len(frames) < 3:
+        return None
+    (first, first_samples), (second, length), (third, _) = frames
+    if second != first + first_samples or third != second + length:
+        return None
+    bases = []
+    for segment in segments:
+        seek = seek_time(segment, sample_rate)
+        if not seek:
+            bases.append(first)
+            continue
+        seeked = decoded_frames(ffmpeg_cmd, path, seek)
+        if len(seeked) < 3 or seeked[1][1] != length or seeked[2][0] != seeked[1][0] + length:
+            return None
+        offset = (seeked[1][0] - second) % length
+        if offset > length // 2:
+            offset -= length
+        bases.append(first + offset)
+    return bases
+
+
+def segment_args(segment, sample_rate, base):
+    """ffmpeg (input options, audio filter) that cut a Segment from the source
+
+    `base` is the piece's entry from timestamp_bases().
+    """
+    input_args = ["-copyts"]
+    seek = seek_time(segment, sample_rate)
+    if seek:
+        input_args += ["-ss", f"{seek:.6f}"]
+    trim = []
+    if segment.start:
+        trim.append(f"start_pts={base + segment.start}")
+    if segment.end is not None:
+        trim.append(f"end_pts={base + segment.end}")
+    return input_args, f"atrim={':'.join(trim)},asetpts=PTS-STARTPTS"
+
+
+def plan_segments(duration, sample_rate, count, chapters=()):
+    """Split a source into at most `count` pieces on the frame grid
+
+    `chapters` are yt-dlp chapter dicts; a cut close to a chapter start
+    is moved there.  Returns a list of Segments covering the whole
+    source, a single one when it is too short to split.
+    """
+    frame = samples_per_frame(sample_rate)
+    total = int(duration * sample_rate)
+    length = total / count
+    starts = sorted(float(chapter.get("start_time") or 0) * sample_rate for chapter in chapters)
+    min_length = (SEGMENT_PREROLL_FRAMES + SEGMENT_POSTROLL_FRAMES + 1) * frame
+
+    cuts = []
+    for k in range(1, count):
+        cut = length * k
+        near = [start for start in starts if abs(start - cut) <= length * CHAPTER_SNAP]
+        if near:
+            cut = min(near, key=lambda start: abs(start - cut))
+        cut = round(cut / frame) * frame
+        if cut - (cuts[-1] if cuts else 0) >= min_length and total - cut >= min_length:
+            cuts.append(cut)
+
+    segments = []
+    bounds = [0] + cuts + [None]
+    for begin, end in zip(bounds, bounds[1:]):
+        skip = SEGMENT_PREROLL_FRAMES if begin else 0
+        segments.append(Segment(
+            begin - skip * frame,
+            None if end is None else end + SEGMENT_POSTROLL_FRAMES * frame,
+            skip,
+            None if end is None else (end - begin) // frame,
+        ))
+    return segments
+
+
+def parse_frame_header(data, offset):
+    """Return the FrameHeader of the Layer III frame at offset, or None"""
+    if offset + 4 > len(data):
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    version = (b1 >> 3) & 3
+    if data[offset] != 0xFF or b1 & 0xE0 != 0xE0 or version == 1 or (b1 >> 1) & 3 != 1:
+        return None
+    bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+    if bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = BITRATES[1 if mpeg1 else 2][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    mono = b3 >> 6 == 3
+    size = (144 if mpeg1 else 72) * bitrate // sample_rate + padding
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    return FrameHeader(size, 1152 if mpeg1 else 576, sample_rate, side_info)
+
+
+def id3v2_size(data):
+    """Length of the ID3v2 tag at the start of data (0 if there is none)"""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    return 10 + size + (10 if data[5] & 0x10 else 0)
+
+
+class EncodedSegment:
+    """An encoded piece: its ID3 tag, its Xing frame and its audio frames"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            data = f.read()
+        self.tag_size = id3v2_size(data)
+        offset = self.tag_size
+        self.offsets = []
+        self.header = None
+        while offset < len(data):
+            header = parse_frame_header(data, offset)
+            if header is None:
+                if data[offset:offset + 3] == b"TAG" and len(data) - offset == 128:
+                    break  # ID3v1 tag
+                raise ValueError(f"{os.path.basename(path)}: no MP3 frame at byte {offset}")
+            self.header = self.header or header
+            self.offsets.append(offset)
+            offset += header.size
+        self.end = min(offset, len(data))
+        if not self.offsets:
+            raise ValueError(f"{os.path.basename(path)}: no MP3 frames")
+        self.xing = None
+        first = self.offsets[0]
+        if data[first + 4 + self.header.side_info:][:4] in (b"Xing", b"Info"):
+            self.xing = bytearray(data[first:self.offsets[1] if len(self.offsets) > 1 else self.end])
+            del self.offsets[0]
+        self.tag = data[:self.tag_size]
+
+    @property
+    def frame_count(self):
+        return len(self.offsets)
+
+    def lame_fields(self):
+        """Return (offset of the LAME tag in the Xing frame, delay, padding), or None"""
+        if self.xing is None:
+            return None
+        position = 4 + self.header.side_info
+        flags = int.from_bytes(self.xing[position + 4:position + 8], "big")
+        position += 8 + 4 * bool(flags & 1) + 4 * bool(flags & 2) + 100 * bool(flags & 4) + 4 * bool(flags & 8)
+        if position + 36 > len(self.xing):
+            return None
+        value = int.from_bytes(self.xing[position + 21:position + 24], "big")
+        return position, value >> 12, value & 0xFFF
+
+    def frame_range(self, first, count=None):
+        """Byte range [start, end) of `count` frames from frame `first` on"""
+        last = len(self.offsets) if count is None else first + count
+        if first > len(self.offsets) or last > len(self.offsets):
+            raise ValueError(f"{os.path.basename(self.path)}: has {len(self.offsets)} frames, "
+                             f"needs {last}")
+        end = self.offsets[last] if last < len(self.offsets) else self.end
+        return self.offsets[first] if first < len(self.offsets) else end, end
+
+
+def crc16(data, crc=0):
+    """CRC-16 (polynomial 0x8005, reflected) as used by the LAME tag"""
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+def join_segments(segments, paths, output_path, chunk_size=1 << 20):
+    """Join encoded pieces into output_path and return its frame count
+
+    `segments` are the Segments the files in `paths` were encoded from.
+    Raises ValueError when a piece is not a usable MP3 or has fewer
+    frames than it should.
+    """
+    pieces = [EncodedSegment(path) for path in paths]
+    first, last = pieces[0], pieces[-1]
+    if first.xing is None or first.lame_fields() is None:
+        raise ValueError("the first piece has no LAME header frame")
+    ranges = [piece.frame_range(segment.skip, segment.keep) for piece, segment in zip(pieces, segments)]
+    frames = sum((segment.keep if segment.keep is not None else piece.frame_count - segment.skip)
+                 for piece, segment in zip(pieces, segments))
+
+    # Xing header: frame count, byte count and seek table of the whole file
+    xing = first.xing
+    position = 4 + first.header.side_info
+    flags = int.from_bytes(xing[position + 4:position + 8], "big")
+    position += 8
+    audio_bytes = sum(end - start for start, end in ranges)
+    total_bytes = len(xing) + audio_bytes
+    if flags & 1:
+        xing[position:position + 4] = frames.to_bytes(4, "big")
+        position += 4
+    if flags & 2:
+        xing[position:position + 4] = total_bytes.to_bytes(4, "big")
+        position += 4
+    if flags & 4:
+        xing[position:position + 100] = seek_table(pieces, segments, ranges, frames, len(xing), total_bytes)
+
+    # LAME tag: the first piece's encoder delay with the last piece's
+    # end padding, the new length and the tag checksum.  The music CRC
+    # is cleared; computing it here would mean hashing the whole file in
+    # Python, and players do not check it.
+    lame, delay, _ = first.lame_fields()
+    _, _, padding = last.lame_fields() or (None, None, 0)
+    xing[lame + 21:lame + 24] = ((delay << 12) | padding).to_bytes(3, "big")
+    xing[lame + 28:lame + 32] = total_bytes.to_bytes(4, "big")
+    xing[lame + 32:lame + 34] = b"\0\0"
+    xing[lame + 34:lame + 36] = crc16(xing[:lame + 34]).to_bytes(2, "big")
+
+    with open(output_path, "wb") as out:
+        out.write(first.tag)
+        out.write(xing)
+        for piece, (start, end) in zip(pieces, ranges):
+            with open(piece.path, "rb") as f:
+                f.seek(start)
+                remaining = end - start
+                while remaining:
+                    chunk = f.read(min(chunk_size, remaining))
+                    if not chunk:
+                        raise ValueError(f"{os.path.basename(piece.path)} is truncated")
+                    out.write(chunk)
+                    remaining -= len(chunk)
+    return frames
+
+
+def seek_table(pieces, segments, ranges, frames, header_bytes, total_bytes):
+    """The Xing TOC: byte position of every percent of the frames, scaled to 0-255"""
+    table = bytearray(100)
+    piece_index = 0
+    base = header_bytes  # joined-file offset of the current piece's first kept frame
+    done = 0  # kept frames of earlier pieces
+    for percent in range(100):
+        target = percent * frames // 100
+        while True:
+            piece, segment, (start, end) = pieces[piece_index], segments[piece_index], ranges[piece_index]
+            kept = segment.keep if segment.keep is not None else piece.frame_count - segment.skip
+            if target < done + kept or piece_index == len(pieces) - 1:
+                break
+            base += end - start
+            done += kept
+            piece_index += 1
+        local = segment.skip + min(target - done, kept - 1)
+        offset = base + piece.offsets[local] - start
+        table[percent] = min(255, offset * 256 // total_bytes)
+    return bytes(table)
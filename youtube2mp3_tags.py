@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+YouTube to MP3 Converter - ID3v2 tagging
+Writes title, artist, album, track, year, source URL and cover art into
+an MP3's ID3v2 tag without touching the audio frames
+
+A tag is written with TAG_PADDING bytes of free space.  As long as an
+edited tag still fits in the space the old one took, only the start of
+the file is rewritten in place.  Otherwise the file is written again
+once: the new tag followed by the unchanged audio bytes, renamed over
+the original.  Frames that are not being changed (ffmpeg's encoder
+frame, comments, ...) are kept as they are, and so is the tag's version
+(2.3 or 2.4); files without a usable tag get a version 2.3 tag, which
+Windows reads.
+"""
+
+import os
+import shutil
+import struct
+import tempfile
+
+# Free space reserved in a written tag for later edits
+TAG_PADDING = 4096
+
+# Files retagged at a time by retag_files
+RETAG_WORKERS = min(8, 2 * (os.cpu_count() or 1))
+
+# Tag names accepted by write_tags and their text frames.  "year" is TYER
+# in version 2.3 and TDRC in 2.4; "url" is the WOAS link frame.
+TEXT_FRAMES = {
+    "title": "TIT2",
+    "artist": "TPE1",
+    "album": "TALB",
+    "album_artist": "TPE2",
+    "track": "TRCK",
+    "genre": "TCON",
+}
+TAG_NAMES = tuple(TEXT_FRAMES) + ("year", "url")
+
+COVER_DESCRIPTION = "Cover (front)"
+PICTURE_FRONT_COVER = 3
+
+
+def tags_from_info(info, url=None):
+    """Return write_tags() values for a job's yt-dlp metadata"""
+    tags = {
+        "title": info.get("track") or info.get("title"),
+        "artist": info.get("artist") or info.get("uploader") or info.get("channel"),
+        "album": info.get("album") or info.get("playlist_title"),
+        "track": info.get("playlist_index"),
+        "year": (info.get("upload_date") or "")[:4],
+        "url": url,
+    }
+    return {name: str(value) for name, value in tags.items() if value}
+
+
+def _syncsafe(value):
+    return bytes(((value >> shift) & 0x7F) for shift in (21, 14, 7, 0))
+
+
+def _unsyncsafe(data):
+    value = 0
+    for byte in data:
+        value = (value << 7) | (byte & 0x7F)
+    return value
+
+
+def _read_tag(f):
+    """Return (version, frames, space) of the tag at the start of a file
+
+    frames is a list of (frame_id, flags, data); space is the number of
+    bytes the tag occupies including padding and footer.  A file without
+    a tag, or with a version 2.2 tag, gives version None and no frames;
+    such a tag is replaced.
+    """
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b"ID3":
+        return None, [], 0
+    version, flags = header[3], header[5]
+    space = 10 + _unsyncsafe(header[6:10]) + (10 if flags & 0x10 else 0)
+    if version not in (3, 4):
+        return None, [], space
+    body = f.read(_unsyncsafe(header[6:10]))
+    if flags & 0x80 and version == 3:
+        body = body.replace(b"\xff\x00", b"\xff")  # tag-wide unsynchronisation
+    offset = 0
+    if flags & 0x40:  # skip the extended header
+        size = _unsyncsafe(body[:4]) if version == 4 else 4 + struct.unpack(">I", body[:4])[0]
+        offset = size
+    frames = []
+    while offset + 10 <= len(body) and body[offset] != 0:
+        frame_id = body[offset:offset + 4].decode("latin-1")
+        raw_size = body[offset + 4:offset + 8]
+        size = _unsyncsafe(raw_size) if version == 4 else struct.unpack(">I", raw_size)[0]
+        frame_flags = body[offset + 8:offset + 10]
+        frames.append((frame_id, frame_flags, body[offset + 10:offset + 10 + size]))
+        offset += 10 + size
+    return version, frames, space
+
+
+def _frame(frame_id, flags, data, version):
+    size = _syncsafe(len(data)) if version == 4 else struct.pack(">I", len(data))
+    return frame_id.encode("latin-1") + size + flags + data
+
+
+def _text(value, version):
+    try:
+        return b"\x00" + value.encode("latin-1")
+    except UnicodeEncodeError:
+        if version == 4:
+            return b"\x03" + value.encode("utf-8")
+        return b"\x01" + value.encode("utf-16")
+
+
+def _new_frames(tags, cover, version):
+    """Return {frame_id: data} for the given tags; empty values remove frames"""
+    frames = {}
+    for name, value in tags.items():
+        if name == "year":
+            frame_id = "TDRC" if version == 4 else "TYER"
+        elif name == "url":
+            frame_id = "WOAS"
+        elif name in TEXT_FRAMES:
+            frame_id = TEXT_FRAMES[name]
+        else:
+            raise ValueError(f"Unknown tag: {name} (choose from {', '.join(TAG_NAMES)})")
+        if not value:
+            frames[frame_id] = None
+        elif frame_id == "WOAS":
+            frames[frame_id] = value.encode("latin-1", "replace")
+        else:
+            frames[frame_id] = _text(value, version)
+    if cover:
+        frames["APIC"] = (b"\x00image/jpeg\x00" + bytes([PICTURE_FRONT_COVER])
+                          + COVER_DESCRIPTION.encode("latin-1") + b"\x00" + cover)
+    return frames
+
+
+def write_tags(path, tags, cover=None, padding=TAG_PADDING):
+    """Set ID3v2 tags of an MP3 file; returns True if it was done in place
+
+    `tags` maps TAG_NAMES to strings (an empty string removes the tag);
+    `cover` is JPEG data replacing any embedded pictures.  Other frames
+    are kept.  The audio after the tag is never rewritten in place, and
+    only copied byte for byte when the tag has outgrown its space.
+    """
+    with open(path, "rb") as f:
+        version, frames, space = _read_tag(f)
+    version = version or 3
+    replaced = _new_frames(tags, cover, version)
+    body = b"".join(_frame(frame_id, flags, data, version)
+                    for frame_id, flags, data in frames if frame_id not in replaced)
+    body += b"".join(_frame(frame_id, b"\x00\x00", data, version)
+                     for frame_id, data in replaced.items() if data is not None)
+
+    if space and 10 + len(body) <= space:
+        # Fits in the old tag's space: pad to exactly that size
+        with open(path, "r+b") as f:
+            f.write(_tag(version, body, space - 10 - len(body)))
+        return True
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out, open(path, "rb") as f:
+            out.write(_tag(version, body, padding))
+            f.seek(space)
+            shutil.copyfileobj(f, out)
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return False
+
+
+def _tag(version, body, padding):
+    size = len(body) + padding
+    return b"ID3" + bytes([version, 0, 0]) + _syncsafe(size) + body + b"\x00" * padding
+
+
+def retag_files(paths, tags_for, workers=RETAG_WORKERS):
+    """Retag many MP3 files in parallel
+
+    `tags_for(path)` returns (tags, cover) for write_tags, or None to
+    leave the file alone.  Yields (path, in_place, error) in the order of
+    `paths`; in_place is None for skipped and failed files.
+    """
+    from concurrent.futures import ThreadPoolExecutor  # only needed for batches
+
+    def retag(path):
+        try:
+            wanted = tags_for(path)
+            if wanted is None:
+                return path, None, None
+            return path, write_tags(path, *wanted), None
+        except Exception as e:
+            return path, None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        yield from pool.map(retag, paths)